@@ -2,46 +2,87 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
+
+load_dotenv()
+
+# Logging first, so the service singletons created on import can log
+from utils import log
+log.configure_logging()
+
 from routes.study_routes import study_bp
 from routes.user_routes import user_bp
 from models.database import db
+from models import db_config, migrations
+from models.history_writer import history_writer
+from models.lifecycle import retention_job
+from utils import metrics, tracing
+from utils.compression import compressor
+from utils.json_provider import FastJSONProvider
+from commands import register_commands
 
-load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+def create_app() -> Flask:
+    """
+    Build the Flask app. Cheap by design: no SDK imports (providers load
+    theirs on first call) and no schema work - migrations are applied by
+    `flask db-upgrade`, once by the gunicorn master (gunicorn.conf.py) or by
+    `python app.py`, never by each worker on boot.
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    CORS(app)
 
-# Database configuration
-import os
-basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "study_helper.db")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize database
-db.init_app(app)
-
-# Create tables
-with app.app_context():
-    db.create_all()
-    print("✅ Database tables created successfully!")
-
-# Register blueprints
-app.register_blueprint(study_bp, url_prefix='/api')
-app.register_blueprint(user_bp, url_prefix='/api')
-
-@app.route('/')
-def home():
-    return jsonify({
-        'message': 'Study Helper AI Backend',
-        'version': '1.0.0',
-        'status': 'running'
-    })
-
-@app.route('/health')
-def health():
-    return jsonify({'status': 'healthy'}), 200
+    # Database configuration (tuned SQLite by default, pooled PostgreSQL via DATABASE_URL)
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    db_config.configure(app, basedir)
+
+    # Initialize database (and the write-behind queue for answers saved by /ask etc.)
+    db.init_app(app)
+    history_writer.init_app(app)
+
+    # Request ids, request/DB instrumentation, /metrics and Server-Timing
+    log.init_app(app)
+    metrics.init_app(app)
+    tracing.init_app(app)
+
+    # gzip/brotli for large JSON bodies (registered last, so it runs before the hooks above)
+    compressor.init_app(app)
+
+    # Periodic archival of old chat history (only when RETENTION_DAYS is set)
+    retention_job.init_app(app)
+
+    # Register blueprints and CLI commands
+    app.register_blueprint(study_bp, url_prefix='/api')
+    app.register_blueprint(user_bp, url_prefix='/api')
+    register_commands(app)
+
+    @app.route('/')
+    def home():
+        return jsonify({
+            'message': 'Study Helper AI Backend',
+            'version': '1.0.0',
+            'status': 'running'
+        })
+
+    @app.route('/health')
+    def health():
+        return jsonify({'status': 'healthy'}), 200
+
+    return app
+
+
+def upgrade_schema(app: Flask):
+    """Create tables / apply pending schema migrations"""
+    with app.app_context():
+        migrations.upgrade()
+        # Don't hand pooled connections on to forked workers
+        db.engine.dispose()
+
+
+app = create_app()
 
 if __name__ == '__main__':
+    upgrade_schema(app)
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_ENV', 'development') == 'development'
     app.run(host='0.0.0.0', port=port, debug=debug)
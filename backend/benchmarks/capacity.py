@@ -0,0 +1,103 @@
+"""
+Concurrent-request capacity per instance
+
+Starts the app under gunicorn against the stub provider (see load_test.py)
+once per serving configuration and ramps closed-loop clients sending
+uncached /ask requests - every request waits on the (stub) LLM, like real
+traffic - reporting throughput and latency at each concurrency level:
+
+- sync: the previous Procfile (2 sync workers)
+- gthread: gunicorn.conf.py (WEB_CONCURRENCY x GUNICORN_THREADS)
+
+Capacity is the highest level whose p95 stays within --slo times the p95
+of a single client: past it, requests queue for a free worker rather than
+waiting on the provider. Provider request limits are lifted for the run so
+routing never falls back to the canned answer.
+
+Usage:
+    python -m benchmarks.capacity
+    python -m benchmarks.capacity --levels 1,4,16,64 --duration 10 --output capacity.json
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.load_test import Servers, run_load, summarize, Workload, git_commit
+
+CONFIGS = {
+    'sync': {'config': None, 'workers': 2, 'worker_class': None, 'threads': None},
+    'gthread': {'config': 'gunicorn.conf.py', 'workers': None, 'worker_class': None, 'threads': None},
+}
+
+
+def server_args(args, config: dict) -> argparse.Namespace:
+    return argparse.Namespace(
+        database_url=None, pipeline=None, stub_latency=args.stub_latency,
+        stub_tokens_per_second=args.stub_tokens_per_second, stub_rpm_limit=0, stub_error_rate=0.0,
+        **config,
+    )
+
+
+def run_config(name: str, args) -> dict:
+    servers = Servers(server_args(args, CONFIGS[name]))
+    levels = {}
+    try:
+        servers.start()
+        workload = Workload(servers.app_url, [0], {'ask_cold': 1})
+        for concurrency in args.levels:
+            samples, elapsed = run_load(workload, args.duration, concurrency, args.seed)
+            latencies = [latency for _, latency, ok, _ in samples if ok]
+            fallbacks = sum(1 for _, _, ok, source in samples if ok and source != 'provider')
+            result = summarize(latencies, sum(1 for s in samples if not s[2]), elapsed)
+            result['not_from_provider'] = fallbacks
+            levels[concurrency] = result
+            print(f"  {concurrency:>4} clients{result['throughput_rps']:>9.1f} rps"
+                  f"{result['p50_ms']:>10.0f} ms p50{result['p95_ms']:>10.0f} ms p95"
+                  f"{result['errors']:>6} errors")
+    finally:
+        servers.stop()
+
+    baseline = levels[args.levels[0]]['p95_ms']
+    capacity = max((c for c, r in levels.items()
+                    if not r['errors'] and r['p95_ms'] <= baseline * args.slo), default=0)
+    return {'levels': levels, 'capacity': capacity,
+            'peak_rps': max(r['throughput_rps'] for r in levels.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure concurrent-request capacity per instance')
+    parser.add_argument('--configs', default='sync,gthread', help=f"Comma-separated: {','.join(CONFIGS)}")
+    parser.add_argument('--levels', default='1,2,4,8,16,32,64',
+                        type=lambda value: [int(level) for level in value.split(',')])
+    parser.add_argument('--duration', type=float, default=8, help='Seconds per concurrency level')
+    parser.add_argument('--slo', type=float, default=2.0, help='p95 multiple of the single-client p95')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stub-latency', default='lognormal:300:0.4')
+    parser.add_argument('--stub-tokens-per-second', type=float, default=2000)
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    # Inherited by the app: keep the client-side rate limiter out of the way
+    for provider in ('GEMINI', 'OPENAI', 'DEEPSEEK'):
+        os.environ[f'{provider}_REQUESTS_PER_MINUTE'] = '1000000'
+        os.environ[f'{provider}_TOKENS_PER_MINUTE'] = '1000000000'
+
+    results = {'meta': {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'levels': args.levels, 'duration': args.duration, 'slo': args.slo},
+               'configs': {}}
+    for name in args.configs.split(','):
+        print(f"🚦 {name}")
+        results['configs'][name] = run_config(name, args)
+
+    print(f"\n{'config':<10}{'capacity':>10}{'peak rps':>10}")
+    for name, result in results['configs'].items():
+        print(f"{name:<10}{result['capacity']:>10}{result['peak_rps']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
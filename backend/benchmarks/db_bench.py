@@ -0,0 +1,287 @@
+"""
+Database benchmark for the user/history endpoints
+
+Seeds a throwaway database with heavy users (100k chat history rows each
+by default), then times the user endpoints through the Flask test client
+so ORM and serialization costs are included. The pre-aggregation code
+path (loading whole relationships and counting in Python) is timed
+alongside for comparison, as is a burst of concurrent writers (the
+"database is locked" case for SQLite without WAL).
+
+Usage:
+    python -m benchmarks.db_bench --output db.json
+    python -m benchmarks.db_bench --rows 10000 --repeat 20     # quick run
+    python -m benchmarks.db_bench --database-url postgresql://localhost/study_bench
+    SQLITE_TUNING=0 python -m benchmarks.db_bench      # driver-default pragmas
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+SUBJECTS = ['Mathematics', 'Physics', 'Computer Science', 'Electrical Engineering', 'Chemistry',
+            'Mechanical Engineering', 'Civil Engineering', 'Biology']
+ANSWER = "A typical markdown answer with a few paragraphs of explanation. " * 20
+# Synthetic vocabulary with a Zipf-like frequency spread, so search terms have realistic selectivity
+VOCABULARY = [f"term{i}" for i in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def load_app(database_url: str):
+    """Import app.py against the benchmark database and migrate it"""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('TRACING_ENABLED', '0')
+    from app import app, upgrade_schema
+    upgrade_schema(app)
+    return app
+
+
+def seed(app, users: int, rows: int, plans: int, rng: random.Random) -> list:
+    """Insert `users` users with `rows` chats and `plans` study plans each"""
+    from models.database import db, User, ChatHistory, StudyPlan
+    from models import content_store
+
+    user_ids = []
+    started = datetime.utcnow() - timedelta(days=365)
+    with app.app_context():
+        for u in range(users):
+            user = User(username=f"bench-user-{u}-{rng.randrange(10 ** 9)}")
+            db.session.add(user)
+            db.session.commit()
+            user_ids.append(user.id)
+            # Every seeded row shares one answer body - referenced, not copied
+            answer_id = content_store.intern(ANSWER, refs=rows + plans)
+
+            batch = []
+            for i in range(rows):
+                batch.append({
+                    'user_id': user.id,
+                    'subject': rng.choice(SUBJECTS),
+                    'question': ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=8)) + '?',
+                    'answer_id': answer_id,
+                    'created_at': started + timedelta(seconds=i * 30),
+                    'version': i + 1,  # as if added one by one (delta sync pages on it)
+                })
+                if len(batch) == 5000:
+                    db.session.execute(db.insert(ChatHistory), batch)
+                    batch = []
+            if batch:
+                db.session.execute(db.insert(ChatHistory), batch)
+
+            db.session.execute(db.insert(StudyPlan), [{
+                'user_id': user.id,
+                'subject': rng.choice(SUBJECTS),
+                'topic': f"Topic {i}",
+                'plan_id': answer_id,
+                'created_at': started + timedelta(hours=i),
+                'is_active': i % 3 != 0,
+                'version': rows + i + 1,
+            } for i in range(plans)])
+            db.session.commit()
+
+        # Seeded in bulk behind the handlers' backs - materialize their stats
+        from models import user_stats
+        user_stats.backfill(user_ids)
+    return user_ids
+
+
+def legacy_stats(user) -> dict:
+    """The previous implementation: load every relationship row and count in Python"""
+    subjects = {}
+    for chat in user.chat_history:
+        subjects[chat.subject] = subjects.get(chat.subject, 0) + 1
+    return {
+        'total_chats': len(user.chat_history),
+        'total_study_plans': len(user.study_plans),
+        'active_study_plans': len([p for p in user.study_plans if p.is_active]),
+        'subject_breakdown': subjects,
+    }
+
+
+def timed(fn, repeat: int) -> dict:
+    fn()  # warm up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'repeat': repeat,
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def http_case(client, method: str, path: str, body: dict = None, headers: dict = None):
+    def run():
+        response = client.open(path, method=method, json=body, headers=headers)
+        assert response.status_code < 400, f"{method} {path} -> {response.status_code}"
+    return run
+
+
+def revalidate_case(client, path: str):
+    """GET `path` with the ETag of a previous response: the 304 path"""
+    etag = client.get(path).headers['ETag']
+    return http_case(client, 'GET', path, headers={'If-None-Match': etag})
+
+
+def bench(app, user_ids: list, repeat: int, legacy_repeat: int) -> dict:
+    from models.database import db, User
+
+    client = app.test_client()
+    user_id = user_ids[0]
+    with app.app_context():
+        username = db.session.get(User, user_id).username
+        # Cursor ~90% of the way through the user's history
+        from models.database import ChatHistory
+        from utils.pagination import encode_cursor
+        total = ChatHistory.query.filter_by(user_id=user_id).count()
+        deep = ChatHistory.query.filter_by(user_id=user_id) \
+            .order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()) \
+            .offset(int(total * 0.9)).first()
+        deep_cursor = encode_cursor(deep.created_at, deep.id)
+
+    cases = {
+        'GET /user/<id>': http_case(client, 'GET', f"/api/user/{user_id}"),
+        'GET /user/<id>/stats': http_case(client, 'GET', f"/api/user/{user_id}/stats"),
+        'GET /history (first page)': http_case(client, 'GET', f"/api/user/{user_id}/history?limit=50"),
+        'GET /history (page at 90%)': http_case(client, 'GET',
+                                                f"/api/user/{user_id}/history?limit=50&cursor={deep_cursor}"),
+        'GET /history (list fields only)': http_case(
+            client, 'GET', f"/api/user/{user_id}/history?limit=50&fields=id,subject,question,created_at"),
+        'GET /study-plans (first page)': http_case(client, 'GET', f"/api/user/{user_id}/study-plans"),
+        'GET /history/search (common term)': http_case(client, 'GET',
+                                                       f"/api/user/{user_id}/history/search?q=term5"),
+        'GET /history/search (rare terms)': http_case(client, 'GET',
+                                                      f"/api/user/{user_id}/history/search?q=term120 term40"),
+        'GET /history/search (prefix)': http_case(client, 'GET',
+                                                  f"/api/user/{user_id}/history/search?q=term12*"),
+        'GET /user/<id>/stats (304)': revalidate_case(client, f"/api/user/{user_id}/stats"),
+        'GET /history (first page, 304)': revalidate_case(client, f"/api/user/{user_id}/history?limit=50"),
+        'GET /study-plans (first page, 304)': revalidate_case(client, f"/api/user/{user_id}/study-plans"),
+        'GET /changes (nothing changed)': http_case(client, 'GET', f"/api/user/{user_id}/changes?since={10 ** 9}"),
+        'GET /changes (since 0, one page)': http_case(client, 'GET', f"/api/user/{user_id}/changes?since=0"),
+        'POST /user/create (existing)': http_case(client, 'POST', '/api/user/create', {'username': username}),
+        'POST /user/<id>/history': http_case(client, 'POST', f"/api/user/{user_id}/history",
+                                             {'subject': 'Physics', 'question': 'Bench question?', 'answer': ANSWER}),
+    }
+
+    results = {}
+    for name, fn in cases.items():
+        results[name] = timed(fn, repeat)
+        print(f"  {name:<40}{results[name]['median_ms']:>10.2f} ms median{results[name]['p95_ms']:>10.2f} ms p95")
+
+    if legacy_repeat:
+        def run_legacy():
+            with app.app_context():
+                legacy_stats(db.session.get(User, user_id))
+        name = 'legacy stats (relationship load)'
+        results[name] = timed(run_legacy, legacy_repeat)
+        print(f"  {name:<40}{results[name]['median_ms']:>10.2f} ms median{results[name]['p95_ms']:>10.2f} ms p95")
+    return results
+
+
+def bench_concurrent_writes(app, user_ids: list, writers: int, seconds: float) -> dict:
+    """Writers POSTing history at once; reports throughput and failed writes"""
+    counts = [[0, 0] for _ in range(writers)]  # [ok, failed] per writer
+    deadline = time.perf_counter() + seconds
+
+    def worker(index: int):
+        client = app.test_client()
+        user_id = user_ids[index % len(user_ids)]
+        while time.perf_counter() < deadline:
+            response = client.post(f"/api/user/{user_id}/history",
+                                   json={'subject': 'Physics', 'question': f"Writer {index}?", 'answer': ANSWER})
+            counts[index][0 if response.status_code < 400 else 1] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    ok = sum(c[0] for c in counts)
+    failed = sum(c[1] for c in counts)
+    result = {'writers': writers, 'writes_ok': ok, 'writes_failed': failed,
+              'writes_per_sec': round(ok / elapsed, 1)}
+    print(f"  {'concurrent writes (' + str(writers) + ' writers)':<40}{result['writes_per_sec']:>10.1f} /s"
+          f"{failed:>10} failed")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the user/history endpoints at scale')
+    parser.add_argument('--users', type=int, default=2, help='Heavy users to seed')
+    parser.add_argument('--rows', type=int, default=100_000, help='Chat history rows per user')
+    parser.add_argument('--plans', type=int, default=500, help='Study plans per user')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed requests per case')
+    parser.add_argument('--legacy-repeat', type=int, default=3,
+                        help='Runs of the old relationship-loading stats (0 to skip)')
+    parser.add_argument('--writers', type=int, default=8, help='Concurrent writer threads (0 to skip)')
+    parser.add_argument('--write-seconds', type=float, default=5, help='Duration of the concurrent write burst')
+    parser.add_argument('--database-url', help='Benchmark against this database instead of a scratch SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='db-bench-')
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    try:
+        os.chdir(workdir)  # keep the app's cache/ and profiles/ out of the tree
+        database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        app = load_app(database_url)
+
+        print(f"🌱 Seeding {args.users} user(s) x {args.rows:,} chats, {args.plans} plans...")
+        started = time.perf_counter()
+        user_ids = seed(app, args.users, args.rows, args.plans, random.Random(args.seed))
+        print(f"  seeded in {time.perf_counter() - started:.1f}s")
+
+        print("⏱️ Timing endpoints")
+        results = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'database': database_url.split(':', 1)[0],
+                'sqlite_tuning': os.getenv('SQLITE_TUNING', '1') != '0',
+                'users': args.users,
+                'rows_per_user': args.rows,
+                'plans_per_user': args.plans,
+            },
+            'cases': bench(app, user_ids, args.repeat, args.legacy_repeat),
+        }
+        if args.writers:
+            results['cases']['concurrent_writes'] = bench_concurrent_writes(
+                app, user_ids, args.writers, args.write_seconds)
+
+        from models import content_store
+        with app.app_context():
+            results['storage'] = content_store.stats()
+        storage = results['storage']
+        print(f"📦 {storage['references']:,} answer/plan references share {storage['contents']:,} "
+              f"stored bodies ({storage['bytes'] / 1e6:.1f} MB)")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
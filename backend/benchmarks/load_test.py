@@ -0,0 +1,396 @@
+"""
+End-to-end load test for the Flask API
+
+Starts the stub provider server and app.py under gunicorn (against a
+throwaway database and cache directory), drives a realistic mix of AI
+and history traffic from many simulated users, and writes
+machine-readable results that can be diffed between commits.
+
+Usage:
+    python -m benchmarks.load_test --duration 30 --concurrency 16 --output results.json
+    python -m benchmarks.load_test --duration 30 --compare results.json
+    python -m benchmarks.load_test --config gunicorn.conf.py --concurrency 64
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HOT_QUESTIONS = [
+    "Explain Kirchhoff's voltage law with an example",
+    "How does a binary search tree handle deletion?",
+    "What is the difference between stress and strain?",
+    "Derive the equation of motion for a simple pendulum",
+    "How do I compute the determinant of a 3x3 matrix?",
+    "What is Big O notation for merge sort and why?",
+    "Explain the first law of thermodynamics",
+    "How does TCP congestion control work?",
+    "What is a Laplace transform used for?",
+    "Explain how a transistor works as a switch",
+]
+FAQ_QUESTIONS = ['what is oop', 'hello', 'what is algorithm', 'how are you', 'what is data structure']
+CONCEPTS = ['Ohm law', 'Recursion', 'Entropy', 'Fourier series', 'Bernoulli principle', 'Deadlock']
+LEVELS = ['beginner', 'intermediate', 'advanced']
+PLAN_TOPICS = [
+    ('Mathematics', 'Calculus'), ('Physics', 'Optics'), ('Computer Science', 'Algorithms'),
+    ('Electrical Engineering', 'Control Systems'), ('Chemistry', 'Organic Chemistry'),
+]
+SUBJECTS = ['Mathematics', 'Physics', 'Computer Science', 'Electrical Engineering', 'Chemistry']
+
+# Relative weights of each operation in the default traffic mix
+DEFAULT_MIX = {
+    'ask_hot': 30,
+    'ask_cold': 10,
+    'ask_faq': 10,
+    'explain': 10,
+    'study_plan': 5,
+    'history_get': 15,
+    'history_post': 10,
+    'user_stats': 5,
+    'user_get': 5,
+}
+AI_OPERATIONS = {'ask_hot', 'ask_cold', 'ask_faq', 'explain', 'study_plan'}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class Servers:
+    """Stub provider + gunicorn app processes for one benchmark run"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='study-helper-bench-')
+        self.stub_port = free_port()
+        self.app_port = free_port()
+        self.processes = []
+
+    @property
+    def stub_url(self) -> str:
+        return f"http://127.0.0.1:{self.stub_port}"
+
+    @property
+    def app_url(self) -> str:
+        return f"http://127.0.0.1:{self.app_port}"
+
+    def app_env(self) -> dict:
+        env = dict(os.environ)
+        env.update({
+            'FLASK_ENV': 'production',
+            'DATABASE_URL': self.args.database_url or f"sqlite:///{os.path.join(self.workdir, 'bench.db')}",
+            'AI_API_KEY': 'stub-key-primary',
+            'AI_API_KEY_BACKUP': 'stub-key-backup',
+            'OPENAI_API_KEY': 'stub-key-openai',
+            'DEEPSEEK_API_KEY': '',
+            'GEMINI_BASE_URL': self.stub_url,
+            'OPENAI_BASE_URL': f"{self.stub_url}/v1",
+        })
+        # Never let a developer's .env leak real backup keys into the run
+        for i in range(2, 10):
+            env[f'AI_API_KEY_BACKUP_{i}'] = ''
+        if self.args.pipeline:
+            env['AI_PIPELINE'] = self.args.pipeline
+        return env
+
+    def start(self):
+        stub_cmd = [
+            sys.executable, '-m', 'tools.stub_provider',
+            '--port', str(self.stub_port),
+            '--latency', self.args.stub_latency,
+            '--tokens-per-second', str(self.args.stub_tokens_per_second),
+            '--rpm-limit', str(self.args.stub_rpm_limit),
+            '--error-rate', str(self.args.stub_error_rate),
+        ]
+        self.processes.append(subprocess.Popen(stub_cmd, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL))
+        wait_for(f"{self.stub_url}/__stats")
+
+        app_cmd = [
+            sys.executable, '-m', 'gunicorn', 'app:app',
+            '--bind', f"127.0.0.1:{self.app_port}",
+            '--pythonpath', BACKEND_DIR,
+            # Run from the scratch dir so the file cache doesn't touch the repo
+            '--chdir', self.workdir,
+        ]
+        if self.args.config:
+            # Serving settings from the config module; flags below override it
+            app_cmd += ['-c', os.path.join(BACKEND_DIR, self.args.config)]
+        else:
+            app_cmd += ['--workers', str(self.args.workers), '--timeout', '120']
+        if self.args.worker_class:
+            app_cmd += ['--worker-class', self.args.worker_class]
+        if self.args.threads:
+            app_cmd += ['--threads', str(self.args.threads)]
+        log = open(os.path.join(self.workdir, 'app.log'), 'w')
+        # The app doesn't migrate on boot (and plain --workers runs have no
+        # gunicorn.conf.py hook to do it), so set up the schema first
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-upgrade'], cwd=self.workdir,
+                       env={**self.app_env(), 'PYTHONPATH': BACKEND_DIR}, stdout=log, stderr=subprocess.STDOUT,
+                       check=True)
+        self.processes.append(subprocess.Popen(
+            app_cmd, cwd=self.workdir, env=self.app_env(), stdout=log, stderr=subprocess.STDOUT
+        ))
+        wait_for(f"{self.app_url}/health", timeout=60)
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Workload:
+    """Generates requests for the traffic mix"""
+
+    def __init__(self, base_url: str, user_ids, mix: dict):
+        self.base_url = base_url
+        self.user_ids = user_ids
+        self.operations = list(mix)
+        self.weights = [mix[op] for op in self.operations]
+
+    def pick(self, rng: random.Random) -> str:
+        return rng.choices(self.operations, self.weights)[0]
+
+    def execute(self, session: requests.Session, rng: random.Random, op: str) -> requests.Response:
+        api = f"{self.base_url}/api"
+        user_id = rng.choice(self.user_ids)
+
+        if op == 'ask_hot':
+            return session.post(f"{api}/ask", json={
+                'question': rng.choice(HOT_QUESTIONS), 'subject': rng.choice(SUBJECTS)})
+        if op == 'ask_cold':
+            return session.post(f"{api}/ask", json={
+                'question': f"Solve practice problem {uuid.uuid4().hex[:12]} step by step",
+                'subject': rng.choice(SUBJECTS)})
+        if op == 'ask_faq':
+            return session.post(f"{api}/ask", json={'question': rng.choice(FAQ_QUESTIONS)})
+        if op == 'explain':
+            return session.post(f"{api}/explain", json={
+                'concept': rng.choice(CONCEPTS), 'level': rng.choice(LEVELS)})
+        if op == 'study_plan':
+            subject, topic = rng.choice(PLAN_TOPICS)
+            return session.post(f"{api}/study-plan", json={'subject': subject, 'topic': topic})
+        if op == 'history_get':
+            return session.get(f"{api}/user/{user_id}/history", params={'limit': 50})
+        if op == 'history_post':
+            return session.post(f"{api}/user/{user_id}/history", json={
+                'subject': rng.choice(SUBJECTS),
+                'question': rng.choice(HOT_QUESTIONS),
+                'answer': 'Benchmark answer body. ' * rng.randint(20, 200)})
+        if op == 'user_stats':
+            return session.get(f"{api}/user/{user_id}/stats")
+        if op == 'user_get':
+            return session.get(f"{api}/user/{user_id}")
+        raise ValueError(f"Unknown operation {op}")
+
+
+def create_users(base_url: str, count: int):
+    ids = []
+    with requests.Session() as session:
+        for i in range(count):
+            response = session.post(f"{base_url}/api/user/create", json={'username': f"bench-user-{i}"})
+            response.raise_for_status()
+            ids.append(response.json()['id'])
+    return ids
+
+
+def run_load(workload: Workload, duration: float, concurrency: int, seed: int):
+    samples = []  # (op, latency_ms, ok, source)
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker(index: int):
+        rng = random.Random(seed + index)
+        local = []
+        with requests.Session() as session:
+            while time.time() < deadline:
+                op = workload.pick(rng)
+                started = time.perf_counter()
+                try:
+                    response = workload.execute(session, rng, op)
+                    ok = response.status_code < 400
+                    source = response.headers.get('X-Answer-Source')
+                except requests.RequestException:
+                    ok, source = False, None
+                local.append((op, (time.perf_counter() - started) * 1000, ok, source))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.time() - started
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+def build_results(samples, elapsed: float, quota_before: dict, quota_after: dict, args) -> dict:
+    by_op = defaultdict(list)
+    errors = defaultdict(int)
+    sources = defaultdict(int)
+    for op, latency, ok, source in samples:
+        by_op[op].append(latency)
+        if not ok:
+            errors[op] += 1
+        if op in AI_OPERATIONS and source:
+            sources[source] += 1
+
+    ai_total = sum(sources.values())
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        },
+        'overall': summarize([s[1] for s in samples], sum(errors.values()), elapsed),
+        'endpoints': {op: summarize(by_op[op], errors[op], elapsed) for op in sorted(by_op)},
+        'answer_sources': {
+            'counts': dict(sources),
+            'faq_hit_ratio': round(sources['faq'] / ai_total, 4) if ai_total else 0,
+            'cache_hit_ratio': round(sources['cache'] / ai_total, 4) if ai_total else 0,
+            'coalesced_ratio': round(sources['coalesced'] / ai_total, 4) if ai_total else 0,
+        },
+        'quota': {key: quota_after.get(key, 0) - quota_before.get(key, 0) for key in quota_after},
+    }
+
+
+def compare(results: dict, baseline: dict):
+    """Print throughput and tail latency changes against a previous run"""
+    print(f"\n📊 Compared with {baseline['meta']['commit']} ({baseline['meta']['timestamp']})")
+    print(f"{'endpoint':<14}{'rps':>10}{'Δrps':>9}{'p95 ms':>10}{'Δp95':>9}{'p99 ms':>10}{'Δp99':>9}")
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    rows = [('overall', results['overall'], baseline['overall'])]
+    rows += [(op, stats, baseline['endpoints'].get(op, {})) for op, stats in results['endpoints'].items()]
+    for name, new, old in rows:
+        print(f"{name:<14}{new['throughput_rps']:>10}{delta(new['throughput_rps'], old.get('throughput_rps', 0)):>9}"
+              f"{new['p95_ms']:>10}{delta(new['p95_ms'], old.get('p95_ms', 0)):>9}"
+              f"{new['p99_ms']:>10}{delta(new['p99_ms'], old.get('p99_ms', 0)):>9}")
+
+    old_quota = baseline.get('quota', {}).get('requests', 0)
+    print(f"provider requests: {results['quota'].get('requests', 0)} (was {old_quota})")
+
+
+def parse_mix(value: str) -> dict:
+    """Parse 'ask_hot=30,history_get=10' into weights"""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in value.split(','):
+        op, weight = item.split('=')
+        if op not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation {op}")
+        mix[op] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test for the Study Helper API')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load')
+    parser.add_argument('--concurrency', type=int, default=16, help='Simulated concurrent clients')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(''),
+                        help='Operation weights, e.g. ask_hot=30,history_get=10')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--config', default=None,
+                        help='gunicorn config module, e.g. gunicorn.conf.py (replaces --workers)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--worker-class', default=None, help='gunicorn worker class (e.g. gthread)')
+    parser.add_argument('--threads', type=int, default=None, help='gunicorn threads per worker')
+    parser.add_argument('--pipeline', default=None, help='AI_PIPELINE profile for the app')
+    parser.add_argument('--database-url', default=None, help='Defaults to a scratch SQLite file')
+    parser.add_argument('--stub-latency', default='lognormal:300:0.4')
+    parser.add_argument('--stub-tokens-per-second', type=float, default=150)
+    parser.add_argument('--stub-rpm-limit', type=int, default=0)
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--compare', help='Baseline results JSON to compare against')
+    args = parser.parse_args()
+
+    servers = Servers(args)
+    try:
+        servers.start()
+        user_ids = create_users(servers.app_url, args.users)
+        workload = Workload(servers.app_url, user_ids, args.mix)
+
+        quota_before = requests.get(f"{servers.stub_url}/__stats").json()
+        samples, elapsed = run_load(workload, args.duration, args.concurrency, args.seed)
+        quota_after = requests.get(f"{servers.stub_url}/__stats").json()
+    finally:
+        servers.stop()
+
+    results = build_results(samples, elapsed, quota_before, quota_after, args)
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
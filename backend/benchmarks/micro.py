@@ -0,0 +1,336 @@
+"""
+Microbenchmarks for the hot paths in utils/ at production scale
+
+Covers ResponseCache get/set/stats, LocalFAQHandler matching,
+PromptCompressor, RateLimiter.can_call and log calls, using synthetic data
+(10k FAQs, 1M cache entries, long prompts, many limiter keys).
+Reports ops/s, net allocated blocks per op and peak traced memory.
+
+Usage:
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.micro --scale 0.01              # quick smoke run
+    python -m benchmarks.micro --baseline micro.json --threshold 0.15
+    python -m benchmarks.micro --only faq,prompt
+"""
+import argparse
+import logging
+import json
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.cache import ResponseCache
+from utils.local_faq import LocalFAQHandler
+from utils.log import ContextFilter, DroppingQueueHandler, sample
+from utils.prompt_utils import PromptCompressor
+from utils.provider_manager import RateLimiter
+
+VOCABULARY = (
+    "voltage current resistance capacitor inductor circuit signal transform "
+    "matrix vector eigenvalue derivative integral limit series entropy heat "
+    "pressure stress strain beam load torque gear algorithm graph tree stack "
+    "queue hash pointer thread process memory cache network packet protocol"
+).split()
+FILLER = ["please note that", "basically", "it is important to", "in other words", "essentially"]
+
+
+# ---- Synthetic data --------------------------------------------------------
+
+def make_question(rng: random.Random, words: int = 10) -> str:
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words)) + '?'
+
+
+def make_faqs(count: int, rng: random.Random) -> LocalFAQHandler:
+    """FAQ handler with `count` extra synthetic entries"""
+    faq = LocalFAQHandler()
+    for i in range(count):
+        key = f"what is {rng.choice(VOCABULARY)} {rng.choice(VOCABULARY)} {i}"
+        keywords = [f"{rng.choice(VOCABULARY)}{i}", f"{rng.choice(VOCABULARY)} {rng.choice(VOCABULARY)} {i}"]
+        faq.faqs[key] = {'answer': f"Synthetic answer {i}", 'keywords': keywords}
+    faq.keyword_index = faq._build_keyword_index()
+    return faq
+
+
+def populate_cache(cache: ResponseCache, count: int, rng: random.Random):
+    """Fill the cache with `count` entries; returns the stored prompts"""
+    prompts = []
+    answer = "Synthetic cached answer. " * 80  # ~2 KB, typical markdown answer
+    for i in range(count):
+        prompt = f"{make_question(rng)} #{i}"
+        cache.set(prompt, answer, {'subject': 'General', 'type': 'qa'})
+        prompts.append(prompt)
+    return prompts
+
+
+def make_long_prompt(words: int, rng: random.Random) -> str:
+    parts = []
+    for i in range(words):
+        parts.append(rng.choice(FILLER) if i % 25 == 0 else rng.choice(VOCABULARY))
+        if i % 40 == 39:
+            parts.append('\n\n\n')
+    return '  '.join(parts)
+
+
+# ---- Measurement ------------------------------------------------------------
+
+def measure(name: str, fn, min_time: float, max_ops: int = None, alloc_ops: int = 200) -> dict:
+    """
+    Run fn() repeatedly for at least min_time seconds (or max_ops calls)
+    and report ops/s, then re-run a short burst under tracemalloc for
+    memory figures
+    """
+    fn()  # warm up
+
+    ops = 0
+    started = time.perf_counter()
+    deadline = started + min_time
+    while time.perf_counter() < deadline and (max_ops is None or ops < max_ops):
+        fn()
+        ops += 1
+    elapsed = time.perf_counter() - started
+
+    alloc_ops = min(alloc_ops, max(1, ops))
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    for _ in range(alloc_ops):
+        fn()
+    blocks_after = sys.getallocatedblocks()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'ops': ops,
+        'ops_per_sec': round(ops / elapsed, 2),
+        'us_per_op': round(elapsed / ops * 1e6, 3),
+        'alloc_blocks_per_op': round((blocks_after - blocks_before) / alloc_ops, 2),
+        'peak_kib': round(peak / 1024, 1),
+    }
+    print(f"  {name:<40}{result['ops_per_sec']:>14,.0f} ops/s{result['us_per_op']:>12} µs/op"
+          f"{result['peak_kib']:>10} KiB peak")
+    return result
+
+
+def measure_threaded(name: str, fn_for_thread, threads: int, min_time: float) -> dict:
+    """Aggregate ops/s of `threads` threads each calling their own fn"""
+    counts = [0] * threads
+    deadline = time.perf_counter() + min_time
+
+    def worker(index: int):
+        fn = fn_for_thread(index)
+        n = 0
+        while time.perf_counter() < deadline:
+            fn()
+            n += 1
+        counts[index] = n
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+    elapsed = time.perf_counter() - started
+
+    ops = sum(counts)
+    result = {
+        'ops': ops,
+        'threads': threads,
+        'ops_per_sec': round(ops / elapsed, 2),
+        'us_per_op': round(elapsed / ops * 1e6, 3) if ops else 0,
+    }
+    print(f"  {name:<40}{result['ops_per_sec']:>14,.0f} ops/s  ({threads} threads)")
+    return result
+
+
+# ---- Suites ----------------------------------------------------------------
+
+def bench_cache(scale: float, min_time: float, rng: random.Random) -> dict:
+    entries = max(100, int(1_000_000 * scale))
+    workdir = tempfile.mkdtemp(prefix='bench-cache-')
+    try:
+        cache = ResponseCache(cache_dir=os.path.join(workdir, 'cache'))
+        print(f"📦 ResponseCache with {entries:,} entries (populating...)")
+        started = time.perf_counter()
+        prompts = populate_cache(cache, entries, rng)
+        print(f"  populated in {time.perf_counter() - started:.1f}s")
+
+        metadata = {'subject': 'General', 'type': 'qa'}
+        counter = iter(range(10 ** 12))
+        return {
+            'entries': entries,
+            'cache.get_hit': measure('cache.get (hit)',
+                                     lambda: cache.get(rng.choice(prompts), metadata), min_time),
+            'cache.get_miss': measure('cache.get (miss)',
+                                      lambda: cache.get(make_question(rng), metadata), min_time),
+            'cache.set': measure('cache.set',
+                                 lambda: cache.set(f"new prompt {next(counter)}", "answer " * 300, metadata),
+                                 min_time),
+            # stats() walks the whole cache - one pass is the interesting number
+            'cache.stats': measure('cache.stats', cache.stats, min_time, max_ops=3, alloc_ops=1),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_faq(scale: float, min_time: float, rng: random.Random) -> dict:
+    count = max(100, int(10_000 * scale))
+    print(f"💡 LocalFAQHandler with {count:,} FAQs")
+    faq = make_faqs(count, rng)
+    keys = list(faq.faqs)
+    misses = [make_question(rng, 14) for _ in range(256)]
+    return {
+        'faqs': count,
+        'faq.can_answer_hit': measure('faq.can_answer (exact hit)',
+                                      lambda: faq.can_answer(rng.choice(keys)), min_time),
+        'faq.can_answer_miss': measure('faq.can_answer (miss)',
+                                       lambda: faq.can_answer(rng.choice(misses)), min_time),
+        'faq.get_answer': measure('faq.get_answer (keyword)',
+                                  lambda: faq.get_answer(f"explain {rng.choice(keys)[8:]} please"), min_time),
+    }
+
+
+def bench_prompt(scale: float, min_time: float, rng: random.Random) -> dict:
+    words = max(200, int(20_000 * scale))
+    print(f"✂️ PromptCompressor on {words:,}-word prompts")
+    long_prompt = make_long_prompt(words, rng)
+    context = [make_long_prompt(200, rng) for _ in range(5)]
+    return {
+        'prompt_words': words,
+        'prompt.create_efficient_prompt': measure(
+            'create_efficient_prompt',
+            lambda: PromptCompressor.create_efficient_prompt(long_prompt, 'Physics', context), min_time),
+        'prompt.remove_redundant_instructions': measure(
+            'remove_redundant_instructions',
+            lambda: PromptCompressor.remove_redundant_instructions(long_prompt), min_time),
+    }
+
+
+def bench_rate_limiter(scale: float, min_time: float, rng: random.Random, threads: int) -> dict:
+    keys = [f"provider-{i}" for i in range(max(10, int(10_000 * scale)))]
+    print(f"⏱️ RateLimiter with {len(keys):,} keys")
+    limiter = RateLimiter()
+    for key in keys:
+        for _ in range(rng.randint(1, 14)):
+            limiter.record_call(key, rng.randint(100, 2000))
+
+    def threaded(index: int):
+        local_rng = random.Random(index)
+        return lambda: limiter.can_call(local_rng.choice(keys), 15, 1500, 1_000_000)
+
+    return {
+        'keys': len(keys),
+        'rate_limiter.can_call': measure(
+            'rate_limiter.can_call', lambda: limiter.can_call(rng.choice(keys), 15, 1500, 1_000_000), min_time),
+        'rate_limiter.can_call_threaded': measure_threaded(
+            'rate_limiter.can_call (threaded)', threaded, threads, min_time),
+    }
+
+
+def bench_logging(min_time: float) -> dict:
+    """Cost of a hot-path log call with its level disabled, sampled and enqueued"""
+    print("📝 Logging through the queue handler (records discarded)")
+    log_queue = queue.Queue(maxsize=1000)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    logger = logging.getLogger('study_helper.bench')
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    def log_and_drain(fn):
+        def run():
+            fn()
+            if log_queue.qsize() > 900:
+                log_queue.queue.clear()
+        return run
+
+    prompt = "what is entropy " * 10
+    return {
+        'log.debug_disabled': measure('logger.debug (level disabled)',
+                                      lambda: logger.debug("Cache HIT: %.50s", prompt), min_time),
+        'log.info_sampled': measure('logger.info (sampled 1%)', log_and_drain(
+            lambda: logger.info("Cache HIT: %.50s", prompt, extra=sample(0.01))), min_time),
+        'log.info_enqueued': measure('logger.info (enqueued)', log_and_drain(
+            lambda: logger.info("Cache HIT: %.50s", prompt)), min_time),
+    }
+
+
+SUITES = ('cache', 'faq', 'prompt', 'limiter', 'logging')
+
+
+def check_regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """Benchmarks whose ops/s dropped by more than threshold vs. baseline"""
+    regressions = []
+    for suite, benches in results['suites'].items():
+        for name, result in benches.items():
+            old = baseline.get('suites', {}).get(suite, {}).get(name)
+            if not isinstance(result, dict) or not isinstance(old, dict):
+                continue
+            if old['ops_per_sec'] and result['ops_per_sec'] < old['ops_per_sec'] * (1 - threshold):
+                change = (result['ops_per_sec'] - old['ops_per_sec']) / old['ops_per_sec'] * 100
+                regressions.append(f"{name}: {old['ops_per_sec']:,.0f} → {result['ops_per_sec']:,.0f} ops/s ({change:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks for backend/utils hot paths')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Multiplier on production data sizes (1.0 = 1M cache entries, 10k FAQs)')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds per benchmark')
+    parser.add_argument('--threads', type=int, default=8, help='Threads for concurrent benchmarks')
+    parser.add_argument('--only', default=','.join(SUITES), help=f"Comma-separated subset of {SUITES}")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Previous results JSON for the regression check')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Allowed fractional ops/s drop before failing (default 0.10)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    selected = [name.strip() for name in args.only.split(',')]
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'scale': args.scale,
+            'min_time': args.min_time,
+        },
+        'suites': {},
+    }
+
+    if 'cache' in selected:
+        results['suites']['cache'] = bench_cache(args.scale, args.min_time, rng)
+    if 'faq' in selected:
+        results['suites']['faq'] = bench_faq(args.scale, args.min_time, rng)
+    if 'prompt' in selected:
+        results['suites']['prompt'] = bench_prompt(args.scale, args.min_time, rng)
+    if 'limiter' in selected:
+        results['suites']['limiter'] = bench_rate_limiter(args.scale, args.min_time, rng, args.threads)
+    if 'logging' in selected:
+        results['suites']['logging'] = bench_logging(args.min_time)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_regressions(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Bytes on the wire and CPU per request for the large JSON responses
+
+Seeds a user whose answers and plans are 2-8 KB of synthetic markdown,
+then requests a 50-row history page, a study plan page and the topics
+catalog through the Flask test client under each configuration:
+
+- stdlib json, uncompressed (the previous behaviour)
+- orjson (if installed), uncompressed
+- orjson + gzip / brotli, compressed on every request (cold cache)
+- orjson + gzip / brotli, served from the compressed-body cache
+
+reporting response bytes and process CPU per request, plus JSON encoding
+time alone for the history page.
+
+Usage:
+    python -m benchmarks.payload_bench
+    python -m benchmarks.payload_bench --requests 500 --output payload.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.db_bench import SUBJECTS, VOCABULARY, WEIGHTS, load_app  # noqa: E402
+
+
+def markdown(rng: random.Random, size: int) -> str:
+    """Roughly `size` bytes of answer-shaped markdown"""
+    parts = []
+    while sum(map(len, parts)) < size:
+        kind = rng.random()
+        words = rng.choices(VOCABULARY, WEIGHTS, k=rng.randint(8, 40))
+        if kind < 0.15:
+            parts.append(f"## {' '.join(words[:4]).title()}\n")
+        elif kind < 0.45:
+            parts.append(''.join(f"- **{w}**: {' '.join(rng.choices(VOCABULARY, WEIGHTS, k=6))}\n"
+                                 for w in words[:5]))
+        elif kind < 0.55:
+            parts.append(f"```python\ndef {words[0]}(x):\n    return x * {rng.randint(2, 99)}\n```\n")
+        else:
+            parts.append(' '.join(words).capitalize() + ". \"Quoted\" text, with <symbols> & unicode — ✓.\n\n")
+    return ''.join(parts)
+
+
+def seed_lines(rng: random.Random, rows: int, plans: int):
+    for i in range(rows):
+        yield json.dumps({'type': 'chat', 'subject': rng.choice(SUBJECTS),
+                          'question': ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=10)) + '?',
+                          'answer': markdown(rng, rng.randint(2000, 8000))})
+    for i in range(plans):
+        yield json.dumps({'type': 'study_plan', 'subject': rng.choice(SUBJECTS), 'topic': f"Topic {i}",
+                          'plan': markdown(rng, rng.randint(2000, 8000))})
+
+
+def run_case(client, path: str, encoding: str, requests: int, clear_cache) -> dict:
+    headers = {'Accept-Encoding': encoding}
+    client.get(path, headers=headers)  # warm up
+    size = 0
+    cpu = wall = 0.0
+    for _ in range(requests):
+        if clear_cache:
+            clear_cache()
+        started_cpu, started_wall = time.process_time(), time.perf_counter()
+        response = client.get(path, headers=headers)
+        cpu += time.process_time() - started_cpu
+        wall += time.perf_counter() - started_wall
+        assert response.status_code == 200, f"{path} -> {response.status_code}"
+        size = len(response.get_data())
+    return {'bytes': size, 'cpu_ms': round(cpu / requests * 1000, 3), 'wall_ms': round(wall / requests * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure response size and CPU per request')
+    parser.add_argument('--rows', type=int, default=500, help='Chats to seed')
+    parser.add_argument('--plans', type=int, default=100, help='Study plans to seed')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per case')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='payload-bench-')
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    try:
+        os.chdir(workdir)
+        app = load_app(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        from flask.json.provider import DefaultJSONProvider
+        from models import transfer
+        from models.database import db, ChatHistory, User
+        from utils import json_provider
+        from utils.compression import ENCODERS, compressor
+        from utils.json_provider import FastJSONProvider
+
+        rng = random.Random(args.seed)
+        with app.app_context():
+            user = User(username=f"payload-bench-{rng.randrange(10 ** 9)}")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+            transfer.import_lines(user_id, seed_lines(rng, args.rows, args.plans))
+            page = [chat.to_dict() for chat in ChatHistory.query.filter_by(user_id=user_id)
+                    .order_by(ChatHistory.created_at.desc()).limit(50)]
+
+        paths = {
+            'history page (50)': f"/api/user/{user_id}/history?limit=50",
+            'study plans page (50)': f"/api/user/{user_id}/study-plans?limit=50",
+            'topics': '/api/topics/Physics',
+        }
+        providers = {'stdlib json': DefaultJSONProvider(app)}
+        if json_provider.orjson is not None:
+            providers['orjson'] = FastJSONProvider(app)
+        fast = list(providers)[-1]
+        configs = [('stdlib json', 'identity', False), (fast, 'identity', False)]
+        for encoding in ('gzip', 'br'):
+            if encoding in ENCODERS:
+                configs += [(fast, encoding, True), (fast, encoding, False)]
+
+        results = {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'requests': args.requests,
+                            'encoders': sorted(ENCODERS), 'orjson': json_provider.orjson is not None},
+                   'cases': {}, 'encode': {}}
+        client = app.test_client()
+        for name, path in paths.items():
+            print(f"📦 {name}")
+            for provider, encoding, cold in configs:
+                app.json = providers[provider]
+                label = f"{provider}, {encoding}" + (' (compressed per request)' if cold
+                                                     else ' (cached body)' if encoding != 'identity' else '')
+                result = run_case(client, path, encoding, args.requests, compressor.cache.clear if cold else None)
+                results['cases'][f"{name}: {label}"] = result
+                print(f"  {label:<44}{result['bytes']:>10,} B{result['cpu_ms']:>9.2f} ms CPU"
+                      f"{result['wall_ms']:>9.2f} ms wall")
+
+        print("🔤 JSON encoding only (history page)")
+        for name, provider in providers.items():
+            with app.app_context():
+                started = time.process_time()
+                for _ in range(args.requests):
+                    provider.response({'history': page}).get_data()
+                per_call = (time.process_time() - started) / args.requests * 1000
+            results['encode'][name] = round(per_call, 3)
+            print(f"  {name:<44}{per_call:>9.3f} ms CPU")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Query-plan verification for the history and study-plan queries
+
+Builds a scratch SQLite database through the migrations, runs EXPLAIN
+QUERY PLAN on the queries the user routes issue, and fails if any of
+them scans its table or sorts in a temp B-tree instead of walking the
+expected index.
+
+Usage:
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --database-url sqlite:////path/to/study_helper.db
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def history_queries():
+    """(name, query, expected index) for the queries issued by routes/user_routes.py"""
+    from datetime import datetime
+    from sqlalchemy import tuple_
+    from models.database import ChatHistory, StudyPlan, Tombstone
+
+    user_id = 1
+    cursor = (tuple_(ChatHistory.created_at, ChatHistory.id) < (datetime(2026, 1, 1), 1000))
+    return [
+        ('history by user',
+         ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.created_at.desc()).limit(50),
+         'ix_chat_history_user_created'),
+        ('history by user and subject',
+         ChatHistory.query.filter_by(user_id=user_id, subject='Physics')
+         .order_by(ChatHistory.created_at.desc()).limit(50),
+         'ix_chat_history_user_subject_created'),
+        ('history page after cursor',
+         ChatHistory.query.filter_by(user_id=user_id).filter(cursor)
+         .order_by(ChatHistory.created_at.desc(), ChatHistory.id.desc()).limit(50),
+         'ix_chat_history_user_created'),
+        ('study plans page',
+         StudyPlan.query.filter_by(user_id=user_id)
+         .order_by(StudyPlan.created_at.desc(), StudyPlan.id.desc()).limit(50),
+         'ix_study_plans_user_created'),
+        ('active study plans page',
+         StudyPlan.query.filter_by(user_id=user_id, is_active=True)
+         .order_by(StudyPlan.created_at.desc(), StudyPlan.id.desc()).limit(50),
+         'ix_study_plans_user_active_created'),
+        ('history changes since version',
+         ChatHistory.query.filter(ChatHistory.user_id == user_id, ChatHistory.version > 100,
+                                  ChatHistory.version <= 300).order_by(ChatHistory.version),
+         'ix_chat_history_user_version'),
+        ('study plan changes since version',
+         StudyPlan.query.filter(StudyPlan.user_id == user_id, StudyPlan.version > 100,
+                                StudyPlan.version <= 300).order_by(StudyPlan.version),
+         'ix_study_plans_user_version'),
+        ('tombstones since version',
+         Tombstone.query.filter(Tombstone.user_id == user_id, Tombstone.version > 100,
+                                Tombstone.version <= 300).order_by(Tombstone.version),
+         'ix_tombstones_user_version'),
+    ]
+
+
+def explain(query) -> list:
+    from sqlalchemy import text
+    from models.database import db
+
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {statement}")).all()
+    return [row[-1] for row in rows]
+
+
+def check(plan: list, index: str) -> list:
+    problems = []
+    if not any(index in line for line in plan):
+        problems.append(f"does not use {index}")
+    for line in plan:
+        if line.startswith('SCAN') and 'USING' not in line:
+            problems.append(f"full scan: {line}")
+        if 'TEMP B-TREE' in line:
+            problems.append(f"sorts in memory: {line}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify history/plan queries use their indexes')
+    parser.add_argument('--database-url', help='Check this SQLite database instead of a fresh one')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query-plans-')
+    cwd = os.getcwd()
+    failures = 0
+    try:
+        os.chdir(workdir)
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        from app import app, upgrade_schema
+        upgrade_schema(app)
+
+        with app.app_context():
+            for name, query, index in history_queries():
+                plan = explain(query)
+                problems = check(plan, index)
+                print(f"{'✅' if not problems else '❌'} {name}")
+                for line in plan:
+                    print(f"     {line}")
+                for problem in problems:
+                    print(f"   - {problem}")
+                failures += bool(problems)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
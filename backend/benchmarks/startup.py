@@ -0,0 +1,196 @@
+"""
+Cold-start benchmark: how soon a fresh instance can answer
+
+- import: a fresh interpreter importing app.py (median of --runs), then the
+  first /health and the first uncached /ask in that process - the first
+  call to a provider is where lazily imported SDKs are paid for
+- gunicorn: time from launch until /health answers, with and without
+  preload, and the instance's memory (PSS of master + workers) right
+  after boot and after the workers have served AI requests
+
+The database is migrated beforehand, so this measures a restart of an
+existing deployment; providers are the stub server (tools/stub_provider.py).
+
+Usage:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import requests
+
+from benchmarks.load_test import BACKEND_DIR, free_port, git_commit, wait_for
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get('/health')
+health = time.perf_counter()
+client.post('/api/ask', json={'question': 'Cold start question %s' % time.time(), 'subject': 'Physics'})
+asked = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'first_health_ms': (health - imported) * 1000,
+                  'first_ask_ms': (asked - health) * 1000}))
+"""
+
+
+def pss_kb(pid: int) -> int:
+    """Proportional set size of a process (Linux), 0 if unavailable"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def children(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+class Instance:
+    """Scratch database + stub provider shared by every measurement"""
+
+    def __init__(self):
+        self.workdir = tempfile.mkdtemp(prefix='startup-bench-')
+        self.stub_port = free_port()
+        self.stub = None
+
+    def env(self, **extra) -> dict:
+        stub_url = f"http://127.0.0.1:{self.stub_port}"
+        env = dict(os.environ)
+        env.update({
+            'FLASK_ENV': 'production',
+            'LOG_LEVEL': 'WARNING',
+            'PYTHONPATH': BACKEND_DIR,
+            'DATABASE_URL': f"sqlite:///{os.path.join(self.workdir, 'startup.db')}",
+            'AI_API_KEY': 'stub-key-primary',
+            'AI_API_KEY_BACKUP': '',
+            'OPENAI_API_KEY': 'stub-key-openai',
+            'DEEPSEEK_API_KEY': '',
+            'GEMINI_BASE_URL': stub_url,
+            'OPENAI_BASE_URL': f"{stub_url}/v1",
+        })
+        for i in range(2, 10):
+            env[f'AI_API_KEY_BACKUP_{i}'] = ''
+        env.update(extra)
+        return env
+
+    def start(self):
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'tools.stub_provider', '--port', str(self.stub_port),
+             '--latency', 'fixed:50', '--tokens-per-second', '100000'],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+        wait_for(f"http://127.0.0.1:{self.stub_port}/__stats")
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-upgrade'], cwd=self.workdir,
+                       env=self.env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    def stop(self):
+        if self.stub is not None:
+            self.stub.terminate()
+            self.stub.wait(timeout=10)
+
+
+def measure_import(instance: Instance, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=instance.workdir, env=instance.env(),
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_ms'] = (time.perf_counter() - started) * 1000
+        samples.append(result)
+    return {key: round(statistics.median(sample[key] for sample in samples), 1) for key in samples[0]}
+
+
+def measure_gunicorn(instance: Instance, preload: bool, workers: int, warm_requests: int) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = instance.env(WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD='1' if preload else '0')
+    started = time.perf_counter()
+    master = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'),
+         '--bind', f"127.0.0.1:{port}", '--chdir', instance.workdir],
+        cwd=instance.workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.perf_counter() - started > 60:
+                raise RuntimeError('gunicorn did not come up')
+            time.sleep(0.01)
+        ready_ms = (time.perf_counter() - started) * 1000
+
+        # Let every worker finish booting before measuring memory
+        deadline = time.time() + 30
+        while len(children(master.pid)) < workers and time.time() < deadline:
+            time.sleep(0.05)
+        time.sleep(2)
+        boot_kb = sum(pss_kb(pid) for pid in [master.pid] + children(master.pid))
+
+        with requests.Session() as session:
+            for _ in range(warm_requests):
+                session.post(f"{url}/api/ask", json={'question': f"Warm-up {uuid.uuid4().hex}"})
+        warm_kb = sum(pss_kb(pid) for pid in [master.pid] + children(master.pid))
+    finally:
+        master.terminate()
+        master.wait(timeout=30)
+    return {'ready_ms': round(ready_ms, 1), 'pss_boot_mb': round(boot_kb / 1024, 1),
+            'pss_warm_mb': round(warm_kb / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start time and memory per instance')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters for the import timing')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (WEB_CONCURRENCY)')
+    parser.add_argument('--warm-requests', type=int, default=20, help='/ask requests before the warm memory reading')
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    instance = Instance()
+    results = {'meta': {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'runs': args.runs, 'workers': args.workers}}
+    try:
+        instance.start()
+        print(f"🐍 import app (median of {args.runs} fresh interpreters)")
+        results['import'] = measure_import(instance, args.runs)
+        for key, value in results['import'].items():
+            print(f"  {key:<18}{value:>9.1f} ms")
+
+        print(f"🦄 gunicorn, {args.workers} workers")
+        results['gunicorn'] = {}
+        for preload in (False, True):
+            label = 'preload' if preload else 'no preload'
+            result = measure_gunicorn(instance, preload, args.workers, args.warm_requests)
+            results['gunicorn'][label] = result
+            print(f"  {label:<12}ready in {result['ready_ms']:>7.0f} ms   PSS {result['pss_boot_mb']:>6.1f} MB"
+                  f" at boot, {result['pss_warm_mb']:>6.1f} MB after {args.warm_requests} requests")
+    finally:
+        instance.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
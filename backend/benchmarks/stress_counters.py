@@ -0,0 +1,180 @@
+"""
+Stress test for the sharded statistics counters (utils/counters.py)
+
+Hammers counters from many threads at once - long-lived threads, plus
+waves of short-lived ones whose shards get retired, with a reader taking
+snapshots throughout - and checks every total is exact. Runs the same
+load through AIProvider.record_success and Pipeline stage timings, and
+compares update throughput with a locked dict and a plain dict (which
+can lose updates).
+
+Exits non-zero if any count is off.
+
+Usage:
+    python -m benchmarks.stress_counters
+    python -m benchmarks.stress_counters --threads 64 --updates 50000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.counters import ShardedStats  # noqa: E402
+
+NAMES = ('hits', 'misses', 'tokens')
+
+
+def hammer(threads: int, work, waves: int = 1) -> float:
+    """Run work(index) on `threads` threads, `waves` times over; returns seconds"""
+    started = time.perf_counter()
+    for wave in range(waves):
+        barrier = threading.Barrier(threads)
+
+        def run(index: int):
+            barrier.wait()
+            work(wave * threads + index)
+
+        pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+    return time.perf_counter() - started
+
+
+def check(label: str, got, expected) -> bool:
+    ok = got == expected
+    print(f"  {'✅' if ok else '❌'} {label}: {got}" + ('' if ok else f" (expected {expected})"))
+    return ok
+
+
+def stress_sharded(threads: int, updates: int, waves: int) -> bool:
+    print(f"🔨 ShardedStats: {threads} threads x {updates:,} updates, {waves} wave(s) of fresh threads")
+    stats = ShardedStats(*NAMES)
+    stop = threading.Event()
+    snapshots = []
+
+    def reader():
+        previous = 0
+        while not stop.is_set():
+            hits = stats.snapshot()['hits']
+            snapshots.append(hits >= previous)  # counters only grow
+            previous = hits
+
+    def work(index: int):
+        for i in range(updates):
+            stats.inc('hits')
+            if i % 4 == 0:
+                stats.add({'misses': 1, 'tokens': index})
+            if i % 10 == 0:
+                stats.dec('tokens', 1)
+
+    watcher = threading.Thread(target=reader)
+    watcher.start()
+    elapsed = hammer(threads, work, waves)
+    stop.set()
+    watcher.join()
+
+    total_threads = threads * waves
+    per_thread_misses = (updates + 3) // 4
+    expected_tokens = sum(index for index in range(total_threads)) * per_thread_misses \
+        - total_threads * ((updates + 9) // 10)
+    totals = stats.snapshot()
+    print(f"  {total_threads * updates / elapsed:,.0f} updates/s, {len(snapshots):,} concurrent snapshots")
+    return all([
+        check('hits', totals['hits'], total_threads * updates),
+        check('misses', totals['misses'], total_threads * per_thread_misses),
+        check('tokens', totals['tokens'], expected_tokens),
+        check('snapshots never went backwards', all(snapshots), True),
+        check('live shards after threads exited', len(stats._shards), 0),
+    ])
+
+
+def stress_provider(threads: int, updates: int) -> bool:
+    from utils.provider_manager import AIProvider, ProviderResponse, RateLimiter
+
+    print(f"🔨 AIProvider.record_success: {threads} threads x {updates:,} calls")
+    provider = AIProvider('stress', 'key', rate_limit=10 ** 9)
+    limiter = RateLimiter()
+    response = ProviderResponse('ok', prompt_tokens=3, completion_tokens=5, latency_ms=2.0)
+
+    def work(index: int):
+        for _ in range(updates):
+            booking = limiter.reserve(provider.name, provider.rate_limit, 8)
+            provider.record_success(limiter, response, booking)
+
+    hammer(threads, work)
+    stats = provider.get_stats()
+    calls = threads * updates
+    return all([
+        check('success_count', stats['success_count'], calls),
+        check('total_tokens', stats['total_tokens'], calls * 8),
+        check('rate limiter calls', limiter.usage(provider.name)['calls_this_minute'], calls),
+    ])
+
+
+def stress_pipeline(threads: int, updates: int) -> bool:
+    from services.pipeline import Pipeline, ProviderStage, RequestContext, AskTask
+
+    print(f"🔨 Pipeline stage timings: {threads} threads x {updates:,} stages")
+    stage = ProviderStage(None)
+    pipeline = Pipeline([stage])
+    ctx = RequestContext(AskTask('fallback'), {'question': 'q', 'subject': 's'})
+
+    def work(index: int):
+        for _ in range(updates):
+            pipeline._record(ctx, stage, time.perf_counter())
+
+    hammer(threads, work)
+    return check('provider stage count', pipeline.stage_timings['provider']['count'], threads * updates)
+
+
+def compare_throughput(threads: int, updates: int):
+    """Updates/s for the same workload on a sharded, locked and plain dict"""
+    print(f"⏱️ Update throughput, {threads} threads")
+    sharded = ShardedStats('hits')
+    locked, lock = {'hits': 0}, threading.Lock()
+    plain = {'hits': 0}
+
+    def with_lock():
+        with lock:
+            locked['hits'] += 1
+
+    def unsafe():
+        plain['hits'] += 1
+
+    for label, update, read in (('sharded', lambda: sharded.inc('hits'), lambda: sharded['hits']),
+                                ('locked dict', with_lock, lambda: locked['hits']),
+                                ('plain dict', unsafe, lambda: plain['hits'])):
+        def work(index: int, update=update):
+            for _ in range(updates):
+                update()
+
+        elapsed = hammer(threads, work)
+        lost = threads * updates - read()
+        print(f"  {label:<14}{threads * updates / elapsed:>14,.0f} updates/s   lost: {lost:,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress the sharded statistics counters')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--updates', type=int, default=20000, help='Updates per thread')
+    parser.add_argument('--waves', type=int, default=3, help='Rounds of fresh threads for ShardedStats')
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    results = [
+        stress_sharded(args.threads, args.updates, args.waves),
+        stress_provider(args.threads, args.updates // 10),
+        stress_pipeline(args.threads, args.updates // 10),
+    ]
+    compare_throughput(args.threads, args.updates)
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Throughput benchmark for NDJSON export / import (models/transfer.py)
+
+Generates a synthetic export file, imports it into a throwaway database,
+then streams it back out (plain and gzip), reporting rows/s and the peak
+Python memory allocated while streaming (a second, tracemalloc'd pass) -
+which should stay flat as --rows grows.
+
+Usage:
+    python -m benchmarks.transfer_bench
+    python -m benchmarks.transfer_bench --rows 500000 --output transfer.json
+    python -m benchmarks.transfer_bench --database-url postgresql://localhost/study_bench
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.db_bench import SUBJECTS, VOCABULARY, WEIGHTS, load_app  # noqa: E402
+
+# Answers repeat across users in practice (cache hits); a few hundred distinct bodies
+DISTINCT_ANSWERS = 300
+
+
+def synthetic_lines(rows: int, plans: int, rng: random.Random, answer_words: int = 150):
+    started = datetime.utcnow() - timedelta(days=365)
+    answers = [' '.join(rng.choices(VOCABULARY, WEIGHTS, k=answer_words)) for _ in range(DISTINCT_ANSWERS)]
+    for i in range(rows):
+        yield json.dumps({
+            'type': 'chat', 'subject': rng.choice(SUBJECTS),
+            'question': ' '.join(rng.choices(VOCABULARY, WEIGHTS, k=8)) + '?',
+            'answer': rng.choice(answers),
+            'created_at': (started + timedelta(seconds=i * 30)).isoformat(),
+        }) + '\n'
+    for i in range(plans):
+        yield json.dumps({
+            'type': 'study_plan', 'subject': rng.choice(SUBJECTS), 'topic': f"Topic {i}",
+            'plan': rng.choice(answers), 'is_active': i % 3 != 0,
+            'created_at': (started + timedelta(hours=i)).isoformat(),
+        }) + '\n'
+
+
+def measure(fn, trace: bool = True) -> dict:
+    """Run fn() -> rows for rows/s, then (if `trace`) again under tracemalloc for peak memory"""
+    started = time.perf_counter()
+    rows = fn()
+    elapsed = time.perf_counter() - started
+    result = {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_sec': round(rows / elapsed), 'peak_mb': None}
+    if trace:
+        tracemalloc.start()
+        fn()
+        result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark NDJSON export/import throughput')
+    parser.add_argument('--rows', type=int, default=200_000, help='Chat rows to import/export')
+    parser.add_argument('--plans', type=int, default=1000, help='Study plans to import/export')
+    parser.add_argument('--answer-words', type=int, default=150,
+                        help='Words per answer (full-text indexing cost grows with it)')
+    parser.add_argument('--database-url', help='Benchmark against this database instead of a scratch SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='transfer-bench-')
+    cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    try:
+        os.chdir(workdir)
+        database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        app = load_app(database_url)
+        from models import transfer
+        from models.database import db, User
+
+        path = os.path.join(workdir, 'export.ndjson')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(synthetic_lines(args.rows, args.plans, random.Random(args.seed), args.answer_words))
+        total = args.rows + args.plans
+        print(f"📄 {total:,} rows, {os.path.getsize(path) / 1e6:.1f} MB of NDJSON")
+
+        results = {'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'database': database_url.split(':', 1)[0],
+            'rows': args.rows, 'plans': args.plans, 'answer_words': args.answer_words,
+        }, 'cases': {}}
+
+        with app.app_context():
+            user = User(username=f"transfer-bench-{random.randrange(10 ** 9)}")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+
+            def run_import():
+                with open(path, 'rb') as f:
+                    imported = transfer.import_lines(user_id, transfer.open_ndjson(f))
+                return imported['chats'] + imported['study_plans']
+
+            def run_export(compress: bool):
+                def run():
+                    lines = transfer.export_lines(user_id)
+                    size = 0
+                    for chunk in (transfer.gzip_stream(lines) if compress else lines):
+                        size += len(chunk)
+                    return total
+                return run
+
+            # Importing twice would double the data, so only exports are re-run under tracemalloc
+            cases = {
+                'import (executemany)': (run_import, False),
+                'export NDJSON': (run_export(False), True),
+                'export NDJSON gzip': (run_export(True), True),
+            }
+            for name, (fn, trace) in cases.items():
+                result = results['cases'][name] = measure(fn, trace)
+                peak = f"{result['peak_mb']:>9.1f} MB peak" if trace else ''
+                print(f"  {name:<28}{result['rows_per_sec']:>12,} rows/s{result['seconds']:>9.2f} s{peak}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Maintenance commands, run with the Flask CLI from backend/:
+
+    flask --app app backfill-user-stats            # rebuild stats for every user
+    flask --app app backfill-user-stats --user-id 42
+    flask --app app db-upgrade                     # apply schema migrations
+    flask --app app db-status
+    flask --app app delete-user 42
+    flask --app app prune-history --days 365 [--user-id 42]
+    flask --app app archive-history --days 365 --dir archive
+    flask --app app deactivate-plans --days 90 [--user-id 42]
+    flask --app app export-user 42 -o user42.ndjson.gz
+    flask --app app import-user 42 user42.ndjson.gz
+    flask --app app prune-tombstones --days 90     # delta-sync deletion records
+"""
+import sys
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from models import changes, lifecycle, migrations, transfer, user_stats
+from models.database import db, User
+
+
+@click.command('backfill-user-stats')
+@click.option('--user-id', type=int, multiple=True, help='Only rebuild these users (repeatable)')
+@click.option('--batch-size', type=int, default=100, show_default=True, help='Users per commit')
+@with_appcontext
+def backfill_user_stats(user_id, batch_size):
+    """Rebuild user_stats / user_subject_stats from history and plans"""
+    done = user_stats.backfill(list(user_id) or None, batch_size=batch_size)
+    click.echo(f"✅ Rebuilt stats for {done} user(s)")
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade():
+    """Apply pending schema migrations"""
+    ran = migrations.upgrade()
+    click.echo(f"✅ Applied {len(ran)} migration(s)" + (f": {', '.join(ran)}" if ran else ''))
+
+
+@click.command('db-status')
+@with_appcontext
+def db_status():
+    """List applied and pending schema migrations"""
+    done = migrations.applied()
+    for mid, description, _ in migrations.MIGRATIONS:
+        click.echo(f"{'✅' if mid in done else '⏳'} {mid}  {description}")
+
+
+@click.command('delete-user')
+@click.argument('user_id', type=int)
+@click.option('--batch-size', type=int, default=lifecycle.DEFAULT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def delete_user(user_id, batch_size):
+    """Delete a user with all their history and plans"""
+    deleted = lifecycle.delete_user(user_id, batch_size=batch_size)
+    if deleted is None:
+        raise click.ClickException(f"User {user_id} not found")
+    click.echo(f"✅ Deleted user {user_id}: {deleted['chats']} chat(s), {deleted['study_plans']} plan(s)")
+
+
+@click.command('prune-history')
+@click.option('--days', type=int, required=True, help='Delete chats older than this many days')
+@click.option('--user-id', type=int, help='Only this user')
+@click.option('--batch-size', type=int, default=lifecycle.DEFAULT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def prune_history(days, user_id, batch_size):
+    """Delete old chat history in batches (no archive)"""
+    deleted = lifecycle.prune_history(datetime.utcnow() - timedelta(days=days), user_id, batch_size)
+    click.echo(f"✅ Deleted {deleted} chat(s)")
+
+
+@click.command('archive-history')
+@click.option('--days', type=int, required=True, help='Archive chats older than this many days')
+@click.option('--dir', 'directory', default='archive', show_default=True, help='Archive directory')
+@click.option('--batch-size', type=int, default=lifecycle.DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--max-batches', type=int, help='Stop after this many batches')
+@click.option('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+@with_appcontext
+def archive_history(days, directory, batch_size, max_batches, pause):
+    """Move old chat history into a gzip NDJSON archive"""
+    result = lifecycle.archive_history(datetime.utcnow() - timedelta(days=days), directory,
+                                       batch_size=batch_size, max_batches=max_batches, pause=pause)
+    click.echo(f"✅ Archived {result['archived']} chat(s) in {result['batches']} batch(es)"
+               + (f" to {result['path']}" if result['path'] else ''))
+
+
+@click.command('deactivate-plans')
+@click.option('--days', type=int, help='Only plans older than this many days')
+@click.option('--user-id', type=int, help='Only this user')
+@with_appcontext
+def deactivate_plans(days, user_id):
+    """Mark active study plans inactive in bulk"""
+    before = datetime.utcnow() - timedelta(days=days) if days is not None else None
+    changed = lifecycle.deactivate_plans(user_id, before=before)
+    click.echo(f"✅ Deactivated {changed} study plan(s)")
+
+
+@click.command('export-user')
+@click.argument('user_id', type=int)
+@click.option('-o', '--output', help='Output file (.gz to compress); default stdout')
+@click.option('--include', default=','.join(transfer.KINDS), show_default=True)
+@with_appcontext
+def export_user(user_id, output, include):
+    """Stream a user's history and plans as NDJSON"""
+    if db.session.get(User, user_id) is None:
+        raise click.ClickException(f"User {user_id} not found")
+    lines = transfer.export_lines(user_id, [kind.strip() for kind in include.split(',')])
+    if output is None:
+        for chunk in lines:
+            sys.stdout.write(chunk)
+        return
+    with open(output, 'wb') as f:
+        if output.endswith('.gz'):
+            for data in transfer.gzip_stream(lines):
+                f.write(data)
+        else:
+            for chunk in lines:
+                f.write(chunk.encode('utf-8'))
+    click.echo(f"✅ Exported user {user_id} to {output}", err=True)
+
+
+@click.command('import-user')
+@click.argument('user_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', type=int, default=transfer.IMPORT_BATCH_SIZE, show_default=True)
+@with_appcontext
+def import_user(user_id, path, batch_size):
+    """Bulk insert NDJSON (plain or gzip) as a user's history and plans"""
+    if db.session.get(User, user_id) is None:
+        raise click.ClickException(f"User {user_id} not found")
+    with open(path, 'rb') as f:
+        try:
+            imported = transfer.import_lines(user_id, transfer.open_ndjson(f), batch_size)
+        except transfer.TransferError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"✅ Imported {imported['chats']} chat(s), {imported['study_plans']} plan(s)")
+
+
+@click.command('prune-tombstones')
+@click.option('--days', type=int, required=True, help='Delete deletion records older than this many days')
+@with_appcontext
+def prune_tombstones(days):
+    """Drop old delta-sync tombstones; clients further behind resync in full"""
+    deleted = changes.prune_tombstones(datetime.utcnow() - timedelta(days=days))
+    click.echo(f"✅ Deleted {deleted} tombstone(s)")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_user_stats)
+    app.cli.add_command(db_upgrade)
+    app.cli.add_command(db_status)
+    app.cli.add_command(delete_user)
+    app.cli.add_command(prune_history)
+    app.cli.add_command(archive_history)
+    app.cli.add_command(deactivate_plans)
+    app.cli.add_command(export_user)
+    app.cli.add_command(import_user)
+    app.cli.add_command(prune_tombstones)
@@ -0,0 +1,78 @@
+"""
+gunicorn settings - `gunicorn app:app -c gunicorn.conf.py`
+
+    WEB_CONCURRENCY=2            worker processes
+    GUNICORN_THREADS=16          threads per worker = concurrent requests per worker
+    GUNICORN_WORKER_CLASS=gthread
+    GUNICORN_TIMEOUT=120
+    GUNICORN_PRELOAD=1           import the app once in the master, share it with workers
+    MIGRATE_ON_START=1           master applies pending migrations before forking
+"""
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Requests mostly wait on the LLM. On Postgres keep DB_POOL_SIZE +
+# DB_MAX_OVERFLOW >= threads, or threads queue for a connection
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+# Longest request: a slow LLM call plus fallbacks. Workers heartbeat from
+# their main thread, so this doesn't limit streamed (SSE) responses
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+# Let in-flight answers finish on deploys/restarts
+graceful_timeout = 30
+# Render's proxy reuses connections
+keepalive = 5
+
+# The heartbeat file is touched constantly; keep it off the (possibly slow) disk
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Workers write metric snapshots here for /metrics to merge (utils/metrics.py).
+# Set before the app is imported; METRICS_DIR= (empty) turns it off
+_default_metrics_dir = os.path.join(tempfile.gettempdir(), f"study-helper-metrics-{os.getpid()}")
+os.environ.setdefault('METRICS_DIR', _default_metrics_dir)
+
+
+def on_starting(server):
+    # Snapshots from a previous run would be merged as exited workers
+    metrics_dir = os.environ['METRICS_DIR']
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+            os.remove(path)
+
+
+def when_ready(server):
+    # Master, before the first worker is forked
+    if os.getenv('MIGRATE_ON_START', '1') != '1':
+        return
+    if server.cfg.preload_app:
+        from app import app, upgrade_schema
+        upgrade_schema(app)
+    else:
+        # Keep the app out of the master, or every worker would inherit it
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db-upgrade'], check=True,
+                       env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
+
+
+def post_fork(server, worker):
+    # Per-process state a preloaded master may have started
+    from app import app
+    from models.database import db
+    from utils import log
+    log.configure_logging()  # the log writer thread doesn't survive the fork
+    with app.app_context():
+        db.engine.dispose(close=False)  # never share the master's pooled connections
+
+
+def on_exit(server):
+    if os.environ['METRICS_DIR'] == _default_metrics_dir:
+        shutil.rmtree(_default_metrics_dir, ignore_errors=True)
@@ -0,0 +1,92 @@
+"""
+Delta sync: what changed in a user's history and study plans since a version
+
+Every change advances the user's version in user_stats (see
+user_stats.next_version); added/updated rows carry the version they were
+written at and deletions leave a tombstone carrying theirs. A client keeps
+the last version it saw and asks for everything newer:
+
+    GET /api/user/<id>/changes?since=812[&limit=200]
+
+"Nothing changed" is answered from the user_stats primary key alone.
+Otherwise rows come from the (user_id, version) indexes, in version
+order, and `version` in the response is the point to resume from (with
+`has_more` set if the page stopped short of the latest version).
+
+Tombstones older than the retention window are pruned; the user's
+sync_floor records the newest pruned version, and clients behind it get
+`reset: true` and resync from `since=0`.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import case, delete, func, update
+
+from models.database import db, User, ChatHistory, StudyPlan, Tombstone, UserStats
+from models import user_stats
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+# Response key -> model, and the tombstone kind for it
+SOURCES = (('history', ChatHistory, 'chat'), ('study_plans', StudyPlan, 'study_plan'))
+
+
+def _cut(model, user_id: int, since: int, limit: int) -> Optional[int]:
+    """Version of the (limit + 1)-th row after `since`, if there are that many"""
+    return db.session.query(model.version) \
+        .filter(model.user_id == user_id, model.version > since) \
+        .order_by(model.version).offset(limit).limit(1).scalar()
+
+
+def changes_since(user_id: int, since: int, limit: int = DEFAULT_LIMIT) -> Optional[Dict]:
+    """Changes after version `since`; None if the user doesn't exist"""
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        if db.session.get(User, user_id) is None:
+            return None
+        user_stats.rebuild(user_id)
+        db.session.commit()
+        stats = db.session.get(UserStats, user_id)
+    latest = stats.version
+    if since >= latest:
+        return {'version': latest, 'changed': False}
+    if 0 < since < stats.sync_floor:
+        return {'version': latest, 'changed': True, 'reset': True}
+
+    # Stop before the first version that would overflow a page in any source.
+    # Versions are never split across pages; a version shared by more rows
+    # than `limit` is returned whole
+    upto = latest
+    for model in (ChatHistory, StudyPlan, Tombstone):
+        cut = _cut(model, user_id, since, limit)
+        if cut is not None:
+            upto = min(upto, max(cut - 1, since + 1))
+
+    result = {'version': upto, 'changed': True, 'has_more': upto < latest,
+              'deleted': {}, 'cleared': []}
+    tombstones = Tombstone.query \
+        .filter(Tombstone.user_id == user_id, Tombstone.version > since, Tombstone.version <= upto) \
+        .order_by(Tombstone.version).all()
+    for key, model, kind in SOURCES:
+        rows = model.query \
+            .filter(model.user_id == user_id, model.version > since, model.version <= upto) \
+            .order_by(model.version).all()
+        result[key] = [row.to_dict() for row in rows]
+        result['deleted'][key] = [t.item_id for t in tombstones if t.kind == kind and t.item_id is not None]
+        if any(t.kind == kind and t.item_id is None for t in tombstones):
+            result['cleared'].append(key)  # drop local items older than this page's rows
+    return result
+
+
+def prune_tombstones(before: datetime) -> int:
+    """Delete tombstones created before `before`, raising each user's sync_floor; returns rows deleted"""
+    floors = db.session.query(Tombstone.user_id, func.max(Tombstone.version)) \
+        .filter(Tombstone.created_at < before) \
+        .group_by(Tombstone.user_id).all()
+    for user_id, version in floors:
+        db.session.execute(update(UserStats).where(UserStats.user_id == user_id).values(
+            sync_floor=case((UserStats.sync_floor < version, version), else_=UserStats.sync_floor)))
+    deleted = db.session.execute(delete(Tombstone).where(Tombstone.created_at < before)).rowcount
+    db.session.commit()
+    return deleted
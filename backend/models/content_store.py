@@ -0,0 +1,175 @@
+"""
+Content-addressed storage for answer and study plan bodies
+
+Many users ask the same questions and get the same (cached) answer, so
+answer text is stored once in `contents`, keyed by its SHA-256, and
+chat_history / study_plans rows hold only a content id. Reads stay a
+single join (ChatHistory.answer_content is eagerly joined).
+
+Each content row counts the history/plan rows pointing at it:
+
+- interning (on flush, for rows whose ContentBody field was assigned)
+  upserts each distinct body once: insert, or bump the refcount
+- deleting rows through the session releases their references after the
+  flush and removes contents nobody points at any more
+- bulk deletes bypass the session, so callers collect the references
+  first:
+
+    refs = content_store.references(ChatHistory, ChatHistory.user_id == user_id)
+    ChatHistory.query.filter_by(user_id=user_id).delete()
+    content_store.release(refs)
+"""
+import hashlib
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, delete, event, func, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models.database import db, Content, content_fields
+from utils.log import get_logger
+
+logger = get_logger('content_store')
+
+contents = Content.__table__
+
+
+def content_hash(body: str) -> str:
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def upsert_insert(conn: Connection):
+    """The dialect's insert(), which supports on_conflict_do_update"""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def intern_many(refs: Dict[str, int], conn: Optional[Connection] = None) -> Dict[str, int]:
+    """
+    {body: content id} for several bodies, adding refs[body] references
+    to each: one executemany upsert plus one id lookup per 500 bodies
+    """
+    conn = conn or db.session.connection()
+    hashes = {body: content_hash(body) for body in refs}
+    insert = upsert_insert(conn)
+    statement = insert(contents).values(hash=bindparam('h'), body=bindparam('b'), refcount=bindparam('n'))
+    statement = statement.on_conflict_do_update(
+        index_elements=[contents.c.hash],
+        set_={'refcount': contents.c.refcount + statement.excluded.refcount},
+    )
+    conn.execute(statement, [{'h': hashes[body], 'b': body, 'n': count} for body, count in refs.items()])
+
+    ids = {}
+    digests = list(set(hashes.values()))
+    for start in range(0, len(digests), 500):
+        ids.update(conn.execute(select(contents.c.hash, contents.c.id)
+                                .where(contents.c.hash.in_(digests[start:start + 500]))).all())
+    return {body: ids[digest] for body, digest in hashes.items()}
+
+
+def intern(body: str, refs: int = 1, conn: Optional[Connection] = None) -> int:
+    """Id of the content row holding `body`, adding `refs` references to it"""
+    return intern_many({body: refs}, conn)[body]
+
+
+def references(model, *criteria) -> Counter:
+    """{content id: rows} for the rows of `model` matching `criteria`, before a bulk delete"""
+    refs = Counter()
+    for field in content_fields(model).values():
+        column = getattr(model, field.column)
+        rows = db.session.query(column, func.count()).filter(*criteria).group_by(column)
+        refs.update({content_id: count for content_id, count in rows})
+    return refs
+
+
+def release(refs: Counter, conn: Optional[Connection] = None) -> int:
+    """Drop references; contents left with none are deleted. Returns rows deleted"""
+    refs = {content_id: count for content_id, count in refs.items() if content_id is not None and count}
+    if not refs:
+        return 0
+    conn = conn or db.session.connection()
+    conn.execute(
+        update(contents).where(contents.c.id == bindparam('cid'))
+        .values(refcount=contents.c.refcount - bindparam('n')),
+        [{'cid': content_id, 'n': count} for content_id, count in refs.items()]
+    )
+    removed = 0
+    ids = list(refs)
+    for start in range(0, len(ids), 500):
+        removed += conn.execute(delete(contents).where(
+            contents.c.id.in_(ids[start:start + 500]), contents.c.refcount <= 0)).rowcount
+    return removed
+
+
+def dedupe(conn: Connection, table: str, column: str, ref_column: str, batch_size: int = 5000) -> int:
+    """Migration helper: move `table.column` text into contents and point `ref_column` at it"""
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            f"SELECT id, {column} FROM {table} WHERE id > :last AND {ref_column} IS NULL "
+            f"ORDER BY id LIMIT :n"), {'last': last_id, 'n': batch_size}).all()
+        if not rows:
+            return moved
+        ids = intern_many(Counter(body for _, body in rows), conn=conn)
+        conn.execute(text(f"UPDATE {table} SET {ref_column} = :cid WHERE id = :rid"),
+                     [{'cid': ids[body], 'rid': row_id} for row_id, body in rows])
+        moved += len(rows)
+        last_id = rows[-1][0]
+        logger.info("Moved %d %s row(s) into contents", moved, table)
+
+
+def stats(conn: Optional[Connection] = None) -> dict:
+    """Distinct bodies, references to them and stored bytes"""
+    conn = conn or db.session.connection()
+    rows, refs, size = conn.execute(select(
+        func.count(), func.coalesce(func.sum(contents.c.refcount), 0),
+        func.coalesce(func.sum(func.length(contents.c.body)), 0))).one()
+    return {'contents': rows, 'references': refs, 'bytes': size}
+
+
+@event.listens_for(Session, 'before_flush')
+def _intern_pending(session, flush_context, instances):
+    released = session.info.setdefault('content_released', Counter())
+    assigned = []
+    for obj in list(session.new) + list(session.dirty):
+        pending = obj.__dict__.get('_content_pending')
+        if not pending:
+            continue
+        fields = content_fields(type(obj))
+        for name in pending:
+            field = fields[name]
+            old_id = getattr(obj, field.column)
+            if old_id is not None and obj not in session.new:
+                released[old_id] += 1
+            body = obj.__dict__['_content_bodies'][name]
+            if body is not None:
+                assigned.append((obj, field.column, body))
+        pending.clear()
+
+    # One upsert per distinct body - a write-behind batch often repeats the same cached answer
+    if assigned:
+        ids = intern_many(Counter(body for _, _, body in assigned), conn=session.connection())
+        for obj, column, body in assigned:
+            setattr(obj, column, ids[body])
+
+    for obj in session.deleted:
+        for field in content_fields(type(obj)).values():
+            released[getattr(obj, field.column)] += 1
+
+
+@event.listens_for(Session, 'after_flush')
+def _release_deleted(session, flush_context):
+    # After the flush, so delete triggers (the FTS index) still see the content
+    released = session.info.pop('content_released', None)
+    if released:
+        release(released, conn=session.connection())
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_released(session, previous_transaction):
+    session.info.pop('content_released', None)
@@ -1,8 +1,48 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, case
+from sqlalchemy.orm.attributes import flag_dirty, instance_state
 from datetime import datetime
 
 db = SQLAlchemy()
 
+
+class ContentBody:
+    """
+    A large text field stored once in `contents` and referenced by id
+
+    Reads go through an eagerly joined relationship; assigned text is
+    interned (hashed, inserted or ref-counted) when the session flushes,
+    see models/content_store.py.
+    """
+    
+    def __init__(self, column: str, relationship: str):
+        self.column = column
+        self.relationship = relationship
+    
+    def __set_name__(self, owner, name):
+        self.name = name
+    
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        bodies = obj.__dict__.get('_content_bodies', {})
+        if self.name in bodies:
+            return bodies[self.name]
+        content = getattr(obj, self.relationship)
+        return content.body if content is not None else None
+    
+    def __set__(self, obj, value):
+        obj.__dict__.setdefault('_content_bodies', {})[self.name] = value
+        obj.__dict__.setdefault('_content_pending', set()).add(self.name)
+        if instance_state(obj).persistent:
+            flag_dirty(obj)
+
+
+def content_fields(model) -> dict:
+    """{field name: ContentBody} for a model"""
+    return {name: attr for name, attr in vars(model).items() if isinstance(attr, ContentBody)}
+
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -14,27 +54,67 @@ class User(db.Model):
     # Relationships
     chat_history = db.relationship('ChatHistory', backref='user', lazy=True, cascade='all, delete-orphan')
     study_plans = db.relationship('StudyPlan', backref='user', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('UserStats', uselist=False, lazy=True, cascade='all, delete-orphan')
+    subject_stats = db.relationship('UserSubjectStats', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
+    def to_dict(self, counts: dict = None):
+        # Counts come from user_stats / COUNT queries - never load the relationships just to len() them
+        counts = counts or self.counts()
         return {
             'id': self.id,
             'username': self.username,
             'email': self.email,
             'created_at': self.created_at.isoformat(),
-            'total_chats': len(self.chat_history),
-            'total_study_plans': len(self.study_plans)
+            'total_chats': counts['total_chats'],
+            'total_study_plans': counts['total_study_plans']
         }
+    
+    def counts(self) -> dict:
+        """Chat and study plan totals - from user_stats, or one COUNT round trip"""
+        stats = db.session.get(UserStats, self.id)
+        if stats is not None:
+            return {'total_chats': stats.total_chats, 'total_study_plans': stats.total_study_plans}
+        
+        chats = db.session.query(func.count(ChatHistory.id)).filter(ChatHistory.user_id == self.id).scalar_subquery()
+        plans = db.session.query(func.count(StudyPlan.id)).filter(StudyPlan.user_id == self.id).scalar_subquery()
+        total_chats, total_plans = db.session.query(chats, plans).one()
+        return {'total_chats': total_chats, 'total_study_plans': total_plans}
+    
+    def subject_breakdown(self) -> dict:
+        """Chat count per subject, grouped in SQL"""
+        rows = db.session.query(ChatHistory.subject, func.count(ChatHistory.id)) \
+            .filter(ChatHistory.user_id == self.id) \
+            .group_by(ChatHistory.subject).all()
+        return {subject: count for subject, count in rows}
+    
+    def study_plan_counts(self) -> dict:
+        """Total and active study plans in one query"""
+        total, active = db.session.query(
+            func.count(StudyPlan.id),
+            func.coalesce(func.sum(case((StudyPlan.is_active == True, 1), else_=0)), 0)  # noqa: E712
+        ).filter(StudyPlan.user_id == self.id).one()
+        return {'total': total, 'active': active}
 
 
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        # History is always read per user, newest first, optionally per subject
+        db.Index('ix_chat_history_user_created', 'user_id', 'created_at'),
+        db.Index('ix_chat_history_user_subject_created', 'user_id', 'subject', 'created_at'),
+        db.Index('ix_chat_history_user_version', 'user_id', 'version'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
     question = db.Column(db.Text, nullable=False)
-    answer = db.Column(db.Text, nullable=False)
+    answer_id = db.Column(db.Integer, db.ForeignKey('contents.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # user's change version
+    
+    answer_content = db.relationship('Content', lazy='joined', innerjoin=True)
+    answer = ContentBody('answer_id', 'answer_content')
     
     def to_dict(self):
         return {
@@ -42,20 +122,30 @@ class ChatHistory(db.Model):
             'subject': self.subject,
             'question': self.question,
             'answer': self.answer,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'version': self.version
         }
 
 
 class StudyPlan(db.Model):
     __tablename__ = 'study_plans'
+    __table_args__ = (
+        db.Index('ix_study_plans_user_active_created', 'user_id', 'is_active', 'created_at'),
+        db.Index('ix_study_plans_user_created', 'user_id', 'created_at'),
+        db.Index('ix_study_plans_user_version', 'user_id', 'version'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
     topic = db.Column(db.String(200), nullable=False)
-    plan = db.Column(db.Text, nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('contents.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    plan_content = db.relationship('Content', lazy='joined', innerjoin=True)
+    plan = ContentBody('plan_id', 'plan_content')
     
     def to_dict(self):
         return {
@@ -64,5 +154,55 @@ class StudyPlan(db.Model):
             'topic': self.topic,
             'plan': self.plan,
             'created_at': self.created_at.isoformat(),
-            'is_active': self.is_active
+            'is_active': self.is_active,
+            'version': self.version
         }
+
+
+class Content(db.Model):
+    """Answer and study plan bodies, stored once per distinct text (models/content_store.py)"""
+    __tablename__ = 'contents'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 hex of body
+    body = db.Column(db.Text, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserStats(db.Model):
+    """Per-user totals, maintained incrementally by models/user_stats.py"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_chats = db.Column(db.Integer, nullable=False, default=0)
+    total_study_plans = db.Column(db.Integer, nullable=False, default=0)
+    active_study_plans = db.Column(db.Integer, nullable=False, default=0)
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Delta sync: bumped on every history/plan change; tombstones below sync_floor were pruned
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    sync_floor = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
+class UserSubjectStats(db.Model):
+    """Per-user, per-subject chat counts"""
+    __tablename__ = 'user_subject_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    subject = db.Column(db.String(100), primary_key=True)
+    chat_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Tombstone(db.Model):
+    """A deleted chat / study plan, kept for delta sync (models/changes.py)"""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        db.Index('ix_tombstones_user_version', 'user_id', 'version'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'chat' or 'study_plan'
+    item_id = db.Column(db.Integer, nullable=True)  # NULL: every item of this kind was deleted
+    version = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
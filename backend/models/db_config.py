@@ -0,0 +1,88 @@
+"""
+Database configuration
+
+Two modes, picked from DATABASE_URL:
+
+- SQLite (default, backend/study_helper.db): every new connection gets
+  WAL journaling, synchronous=NORMAL, a busy timeout, mmap and a larger
+  page cache, so gunicorn workers can read while one writes and commits
+  don't fsync the main database file each time.
+- PostgreSQL (DATABASE_URL=postgresql://...): pooled connections sized
+  by DB_POOL_SIZE / DB_MAX_OVERFLOW, recycled and pre-pinged so idle
+  connections dropped by the server don't surface as request errors.
+"""
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.log import get_logger
+
+logger = get_logger('db')
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name, '')
+    return int(value) if value.strip() else default
+
+
+def database_url(basedir: str) -> str:
+    url = os.getenv('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "study_helper.db")}')
+    # Render/Heroku hand out postgres://, which SQLAlchemy no longer accepts
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def sqlite_pragmas() -> dict:
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),  # negative = KiB
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(url: str) -> dict:
+    if url.startswith('sqlite'):
+        return {
+            # pysqlite's own lock wait, in seconds; busy_timeout covers the rest
+            'connect_args': {'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000},
+        }
+
+    options = {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def configure(app, basedir: str):
+    """Set the database URL and engine options on the app before db.init_app()"""
+    url = database_url(basedir)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    if url.startswith('sqlite') and os.getenv('SQLITE_TUNING', '1') != '0':
+        if not event.contains(Engine, 'connect', _apply_sqlite_pragmas):
+            event.listen(Engine, 'connect', _apply_sqlite_pragmas)
+    logger.info("Database: %s", url.split(':', 1)[0])
@@ -0,0 +1,170 @@
+"""
+Write-behind persistence for answers produced by the AI endpoints
+
+/ask, /explain and /study-plan enqueue the row and return immediately; a
+background thread groups everything enqueued within HISTORY_FLUSH_MS
+(or HISTORY_BATCH_SIZE rows) into one transaction, together with the
+matching user_stats updates. Pending rows are flushed synchronously at
+interpreter exit, and written inline if the queue is ever full. If a
+batch fails, its rows are retried one at a time so only a bad row is lost.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from models.database import db, User, ChatHistory, StudyPlan
+from models import user_stats
+from utils.counters import ShardedStats
+from utils.log import get_logger
+
+logger = get_logger('history_writer')
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """Batches chat history / study plan inserts off the request path"""
+
+    def __init__(self, flush_interval: float = 0.2, batch_size: int = 200, max_pending: int = 10000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.app = None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = ShardedStats('enqueued', 'written', 'batches', 'dropped', 'inline')
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.close)
+
+    def add_chat(self, user_id: int, subject: str, question: str, answer: str):
+        if not question or not answer:
+            self._reject('chat', user_id)
+            return
+        self._enqueue((ChatHistory, dict(user_id=int(user_id), subject=_subject(subject),
+                                         question=str(question), answer=str(answer),
+                                         created_at=datetime.utcnow())))
+
+    def add_study_plan(self, user_id: int, subject: str, topic: str, plan: str):
+        if not topic or not plan:
+            self._reject('study plan', user_id)
+            return
+        self._enqueue((StudyPlan, dict(user_id=int(user_id), subject=_subject(subject),
+                                       topic=str(topic)[:200], plan=str(plan), is_active=True,
+                                       created_at=datetime.utcnow())))
+
+    def _reject(self, kind: str, user_id):
+        logger.warning("Not saving %s for user %s: empty text", kind, user_id)
+        self.stats.inc('dropped')
+
+    def _enqueue(self, row):
+        self._ensure_started()
+        self.stats.inc('enqueued')
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Backpressure: never lose a row, pay for the write on this request instead
+            logger.warning("History queue full, writing inline")
+            self.stats.inc('inline')
+            self._write([row])
+
+    def _ensure_started(self):
+        # One writer thread per process - threads don't survive a gunicorn fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, rows: List):
+        """Insert one batch and its stats updates in a single transaction"""
+        with self.app.app_context():
+            try:
+                user_ids = {fields['user_id'] for _, fields in rows}
+                existing = {uid for (uid,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+            except Exception:
+                db.session.rollback()
+                logger.exception("History batch of %d row(s) failed", len(rows))
+                return
+            kept = [row for row in rows if row[1]['user_id'] in existing]
+            if len(kept) < len(rows):
+                logger.warning("Dropping %d history row(s) for unknown users", len(rows) - len(kept))
+                self.stats.inc('dropped', len(rows) - len(kept))
+            if not kept or self._insert(kept):
+                return
+            if len(kept) > 1:
+                # Find the bad row(s) rather than losing everyone else's
+                for row in kept:
+                    self._insert([row])
+
+    def _insert(self, rows: List) -> bool:
+        """Add rows (fresh ORM objects each attempt) and commit; False if it failed"""
+        try:
+            records = [model(**fields) for model, fields in rows]
+            db.session.add_all(records)
+            db.session.flush()
+            for record in records:
+                if isinstance(record, ChatHistory):
+                    user_stats.chat_added(record)
+                else:
+                    user_stats.plan_added(record)
+            db.session.commit()
+            self.stats.add({'written': len(rows), 'batches': 1})
+            return True
+        except Exception:
+            db.session.rollback()
+            if len(rows) == 1:
+                logger.exception("Dropping history row for user %s", rows[0][1]['user_id'])
+                self.stats.inc('dropped')
+            else:
+                logger.warning("History batch of %d row(s) failed, retrying row by row", len(rows))
+            return False
+
+    def close(self, timeout: float = 10):
+        """Flush everything still queued; called at exit"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def get_stats(self) -> dict:
+        return {**self.stats.snapshot(), 'pending': self._queue.qsize()}
+
+
+def _subject(subject) -> str:
+    return str(subject or 'General')[:100]
+
+
+history_writer = HistoryWriter(
+    flush_interval=int(os.getenv('HISTORY_FLUSH_MS', 200)) / 1000,
+    batch_size=int(os.getenv('HISTORY_BATCH_SIZE', 200)),
+)
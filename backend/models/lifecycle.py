@@ -0,0 +1,313 @@
+"""
+Bulk data lifecycle: user deletion, plan deactivation, history pruning
+and archival
+
+    flask --app app delete-user 42
+    flask --app app prune-history --days 365
+    flask --app app archive-history --days 365 --dir archive
+    flask --app app deactivate-plans --days 90
+
+RETENTION_DAYS runs archival (and tombstone pruning) in the background.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from models.database import db, User, ChatHistory, Content, StudyPlan, Tombstone, UserStats, UserSubjectStats
+from models import changes, content_store, user_stats
+from utils.log import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+logger = get_logger('lifecycle')
+
+# Set-based deletes, one short transaction per batch, so request writes
+# interleave between batches instead of waiting on SQLite's writer lock
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _chat_batch(criteria: list, after_id: int, batch_size: int) -> list:
+    return db.session.query(ChatHistory.id, ChatHistory.user_id, ChatHistory.subject) \
+        .filter(ChatHistory.id > after_id, *criteria) \
+        .order_by(ChatHistory.id).limit(batch_size).all()
+
+
+def _delete_chats(rows: list, update_stats: bool = True):
+    """Delete one batch of (id, user_id, subject) rows, releasing their contents"""
+    ids = [row.id for row in rows]
+    refs = content_store.references(ChatHistory, ChatHistory.id.in_(ids))
+    db.session.execute(delete(ChatHistory).where(ChatHistory.id.in_(ids)))
+    content_store.release(refs)
+    if update_stats:
+        user_stats.chats_removed(rows)
+
+
+def prune_history(before: datetime, user_id: Optional[int] = None,
+                  batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Delete chats created before `before` (optionally for one user); returns rows deleted"""
+    criteria = [ChatHistory.created_at < before]
+    if user_id is not None:
+        criteria.append(ChatHistory.user_id == user_id)
+    deleted = 0
+    last_id = 0
+    while True:
+        rows = _chat_batch(criteria, last_id, batch_size)
+        if not rows:
+            return deleted
+        _delete_chats(rows)
+        db.session.commit()
+        deleted += len(rows)
+        last_id = rows[-1].id
+
+
+def deactivate_plans(user_id: Optional[int] = None, before: Optional[datetime] = None,
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Mark active study plans inactive in bulk; returns plans changed"""
+    criteria = [StudyPlan.is_active == True]  # noqa: E712
+    if user_id is not None:
+        criteria.append(StudyPlan.user_id == user_id)
+    if before is not None:
+        criteria.append(StudyPlan.created_at < before)
+    changed = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(StudyPlan.id, StudyPlan.user_id) \
+            .filter(StudyPlan.id > last_id, *criteria) \
+            .order_by(StudyPlan.id).limit(batch_size).all()
+        if not rows:
+            return changed
+        db.session.execute(update(StudyPlan).where(StudyPlan.id.in_([row.id for row in rows]))
+                           .values(is_active=False))
+        user_stats.plans_deactivated(rows)
+        db.session.commit()
+        changed += len(rows)
+        last_id = rows[-1].id
+
+
+def _delete_user_rows(user_id: int):
+    db.session.execute(delete(UserSubjectStats).where(UserSubjectStats.user_id == user_id))
+    db.session.execute(delete(UserStats).where(UserStats.user_id == user_id))
+    db.session.execute(delete(User).where(User.id == user_id))
+
+
+def _sweep_user(user_id: int, batch_size: int, counts: Dict):
+    """Delete the user's chats, plans and tombstones in batches"""
+    last_id = 0
+    while True:
+        rows = _chat_batch([ChatHistory.user_id == user_id], last_id, batch_size)
+        if not rows:
+            break
+        _delete_chats(rows, update_stats=False)
+        db.session.commit()
+        counts['chats'] += len(rows)
+        last_id = rows[-1].id
+
+    while True:
+        ids = [plan_id for (plan_id,) in db.session.query(StudyPlan.id)
+               .filter(StudyPlan.user_id == user_id).order_by(StudyPlan.id).limit(batch_size)]
+        if not ids:
+            break
+        refs = content_store.references(StudyPlan, StudyPlan.id.in_(ids))
+        db.session.execute(delete(StudyPlan).where(StudyPlan.id.in_(ids)))
+        content_store.release(refs)
+        db.session.commit()
+        counts['study_plans'] += len(ids)
+
+    db.session.execute(delete(Tombstone).where(Tombstone.user_id == user_id))
+    db.session.commit()
+
+
+def delete_user(user_id: int, batch_size: int = DEFAULT_BATCH_SIZE) -> Optional[Dict]:
+    """
+    Delete a user and everything they own without loading it; returns
+    row counts, or None if the user doesn't exist. The users and stats
+    rows go first, in one short transaction, so history_writer drops any
+    row that arrives during the sweep; a database that enforces the
+    foreign keys (PostgreSQL) refuses that, so there they go last.
+    """
+    if db.session.get(User, user_id) is None:
+        return None
+    counts = {'chats': 0, 'study_plans': 0}
+    try:
+        _delete_user_rows(user_id)
+        db.session.commit()
+        parent_first = True
+    except IntegrityError:
+        db.session.rollback()
+        parent_first = False
+
+    _sweep_user(user_id, batch_size, counts)
+    while not parent_first:
+        try:
+            _delete_user_rows(user_id)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # A row was written during the sweep
+            db.session.rollback()
+            _sweep_user(user_id, batch_size, counts)
+    return counts
+
+
+def _archive_line(row) -> str:
+    return json.dumps({
+        'id': row.id,
+        'user_id': row.user_id,
+        'subject': row.subject,
+        'question': row.question,
+        'answer': row.body,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+    }, ensure_ascii=False)
+
+
+def archive_history(before: datetime, directory: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                    max_batches: Optional[int] = None, pause: float = 0.0) -> Dict:
+    """
+    Move chats created before `before` into a gzip NDJSON file in
+    `directory`, one batch at a time. Each batch is appended and fsynced
+    before its rows are deleted, so a crash can duplicate the last batch
+    in the archive but never lose it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"chat_history-{before:%Y%m%d}-{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson.gz")
+    archived = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        rows = db.session.query(ChatHistory.id, ChatHistory.user_id, ChatHistory.subject,
+                                ChatHistory.question, ChatHistory.created_at, Content.body) \
+            .join(Content, Content.id == ChatHistory.answer_id) \
+            .filter(ChatHistory.id > last_id, ChatHistory.created_at < before) \
+            .order_by(ChatHistory.id).limit(batch_size).all()
+        if not rows:
+            break
+        # End the read transaction before the (slow) file write
+        db.session.commit()
+
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+                archive.write(''.join(_archive_line(row) + '\n' for row in rows).encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        _delete_chats(rows)
+        db.session.commit()
+        archived += len(rows)
+        batches += 1
+        last_id = rows[-1].id
+        if pause:
+            time.sleep(pause)  # let request writers in between batches
+
+    if archived:
+        logger.info("Archived %d chat(s) older than %s to %s", archived, before.date(), path)
+    return {'archived': archived, 'batches': batches, 'path': path if archived else None}
+
+
+def read_archive(path: str) -> List[Dict]:
+    """Rows of an archive file (small archives / inspection)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line) for line in archive if line.strip()]
+
+
+def _try_lock(f) -> bool:
+    """Non-blocking exclusive lock on an open file, released when it's closed"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class RetentionJob:
+    """
+    Archives chats older than `days` (and prunes tombstones older than
+    `tombstone_days`) every `interval` seconds, in one process at a time
+    """
+
+    def __init__(self, days: int = 0, directory: str = 'archive', interval: float = 86400,
+                 batch_size: int = DEFAULT_BATCH_SIZE, pause: float = 0.05, tombstone_days: int = 90):
+        self.days = days
+        self.tombstone_days = tombstone_days
+        self.directory = directory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {'runs': 0, 'skipped': 0, 'archived': 0, 'errors': 0}
+
+    def init_app(self, app):
+        self.app = app
+        if self.days > 0:
+            # Started from the first request each process serves, so a
+            # preloading gunicorn master never runs it itself
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        # Like history_writer: one thread per process, started after fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name='retention', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                # e.g. ARCHIVE_DIR not writable - keep the thread alive for the next run
+                self.stats['errors'] += 1
+                logger.exception("Retention run failed")
+            time.sleep(self.interval)
+
+    def run_once(self) -> Optional[Dict]:
+        """One archival pass, unless another process holds the archive lock"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.retention.lock'), 'w') as lock:
+            if not _try_lock(lock):
+                self.stats['skipped'] += 1
+                return None
+            with self.app.app_context():
+                try:
+                    result = archive_history(datetime.utcnow() - timedelta(days=self.days), self.directory,
+                                             batch_size=self.batch_size, pause=self.pause)
+                    if self.tombstone_days > 0:
+                        result['tombstones'] = changes.prune_tombstones(
+                            datetime.utcnow() - timedelta(days=self.tombstone_days))
+                except Exception:
+                    db.session.rollback()
+                    self.stats['errors'] += 1
+                    logger.exception("Retention run failed")
+                    return None
+        self.stats['runs'] += 1
+        self.stats['archived'] += result['archived']
+        return result
+
+
+retention_job = RetentionJob(
+    days=int(os.getenv('RETENTION_DAYS', 0)),
+    directory=os.getenv('ARCHIVE_DIR', 'archive'),
+    interval=float(os.getenv('RETENTION_INTERVAL_HOURS', 24)) * 3600,
+    batch_size=int(os.getenv('RETENTION_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+    tombstone_days=int(os.getenv('TOMBSTONE_DAYS', 90)),
+)
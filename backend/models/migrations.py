@@ -0,0 +1,248 @@
+"""
+Schema migrations
+
+db.create_all() only creates missing tables - it never adds indexes or
+columns to tables that already exist. Schema changes are therefore
+listed here as numbered migrations and applied in order; the ids of
+applied migrations are recorded in the schema_migrations table.
+
+    flask --app app db-upgrade      # apply pending migrations
+    flask --app app db-status       # list applied/pending migrations
+
+To add one: write a function taking a Connection, append it to
+MIGRATIONS with the next id, and mirror the change on the models so
+fresh databases created by create_all() end up identical. Migrations
+must be idempotent (e.g. CREATE INDEX IF NOT EXISTS) because workers
+may race to apply them on first boot.
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from models.database import db, Content, Tombstone
+from models import content_store, search
+from utils.log import get_logger
+
+logger = get_logger('migrations')
+
+
+def _create_tables(conn: Connection):
+    db.metadata.create_all(conn)
+
+
+def _history_plan_indexes(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_history_user_created "
+        "ON chat_history (user_id, created_at)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_history_user_subject_created "
+        "ON chat_history (user_id, subject, created_at)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_study_plans_user_active_created "
+        "ON study_plans (user_id, is_active, created_at)"))
+
+
+def _study_plan_created_index(conn: Connection):
+    # Unfiltered plan lists page on (created_at, id) without an is_active filter
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_study_plans_user_created "
+        "ON study_plans (user_id, created_at)"))
+
+
+# Search index as migration 0004 shipped it, over chat_history.answer.
+# Frozen here: models/search.py has since moved on (0005 rebuilds these)
+_SEARCH_V1_SQLITE = [
+    """CREATE VIEW IF NOT EXISTS chat_history_fts_source AS
+       SELECT id, 'u' || user_id AS owner, question, answer FROM chat_history""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+       owner, question, answer,
+       content='chat_history_fts_source', content_rowid='id',
+       tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_ai AFTER INSERT ON chat_history BEGIN
+       INSERT INTO chat_history_fts(rowid, owner, question, answer)
+       VALUES (new.id, 'u' || new.user_id, new.question, new.answer);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_ad AFTER DELETE ON chat_history BEGIN
+       INSERT INTO chat_history_fts(chat_history_fts, rowid, owner, question, answer)
+       VALUES ('delete', old.id, 'u' || old.user_id, old.question, old.answer);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_history_fts_au AFTER UPDATE OF user_id, question, answer ON chat_history BEGIN
+       INSERT INTO chat_history_fts(chat_history_fts, rowid, owner, question, answer)
+       VALUES ('delete', old.id, 'u' || old.user_id, old.question, old.answer);
+       INSERT INTO chat_history_fts(rowid, owner, question, answer)
+       VALUES (new.id, 'u' || new.user_id, new.question, new.answer);
+       END""",
+    # Index rows that existed before the table did
+    "INSERT INTO chat_history_fts(chat_history_fts) VALUES('rebuild')",
+]
+
+_SEARCH_V1_POSTGRES = [
+    """CREATE INDEX IF NOT EXISTS ix_chat_history_fts ON chat_history
+       USING GIN (to_tsvector('english', question || ' ' || answer))""",
+]
+
+
+def _search_index(conn: Connection):
+    if 'answer' not in {c['name'] for c in inspect(conn).get_columns('chat_history')}:
+        return  # created by 0001 from the current models; 0005 builds the index
+    if conn.dialect.name == 'postgresql':
+        for statement in _SEARCH_V1_POSTGRES:
+            conn.execute(text(statement))
+        return
+    if conn.dialect.name != 'sqlite':
+        logger.warning("No full-text index for %s; search will scan", conn.dialect.name)
+        return
+    try:
+        for statement in _SEARCH_V1_SQLITE:
+            conn.execute(text(statement))
+    except OperationalError as e:
+        if 'no such module' not in str(e):
+            raise
+        # SQLite built without FTS5 - search falls back to LIKE
+        logger.warning("FTS5 unavailable (%s); search will scan", e)
+
+
+def _content_store(conn: Connection):
+    """Move answer/plan text into contents, one row per distinct body"""
+    Content.__table__.create(conn, checkfirst=True)
+    search.drop_dependents(conn)
+    for table, column, ref_column in (('chat_history', 'answer', 'answer_id'),
+                                      ('study_plans', 'plan', 'plan_id')):
+        columns = {c['name'] for c in inspect(conn).get_columns(table)}
+        if column not in columns:
+            continue  # created by 0001 from the current models
+        if ref_column not in columns:
+            # Nullable here: ADD COLUMN can't add NOT NULL without a default
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ref_column} INTEGER REFERENCES contents (id)"))
+        content_store.dedupe(conn, table, column, ref_column)
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+    search.create_index(conn)
+
+
+def _change_versions(conn: Connection):
+    """Per-user change versions and tombstones for delta sync (models/changes.py)"""
+    added = False
+    for table, column, definition in (('chat_history', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+                                      ('study_plans', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+                                      ('user_stats', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+                                      ('user_stats', 'sync_floor', 'INTEGER NOT NULL DEFAULT 0')):
+        if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+            added = True
+    if added:
+        # Number existing rows per user (chats, then plans, in id order) so a
+        # client's first sync pages through them instead of getting one version
+        conn.execute(text(
+            "UPDATE chat_history SET version = n.rn FROM ("
+            "SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS rn FROM chat_history"
+            ") AS n WHERE chat_history.id = n.id"))
+        conn.execute(text(
+            "UPDATE study_plans SET version = n.rn + (SELECT COUNT(*) FROM chat_history c WHERE c.user_id = n.user_id) "
+            "FROM (SELECT id, user_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) AS rn FROM study_plans"
+            ") AS n WHERE study_plans.id = n.id"))
+        conn.execute(text(
+            "UPDATE user_stats SET version = 1 "
+            "+ (SELECT COUNT(*) FROM chat_history c WHERE c.user_id = user_stats.user_id) "
+            "+ (SELECT COUNT(*) FROM study_plans p WHERE p.user_id = user_stats.user_id)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_history_user_version "
+        "ON chat_history (user_id, version)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_study_plans_user_version "
+        "ON study_plans (user_id, version)"))
+    Tombstone.__table__.create(conn, checkfirst=True)
+
+
+def _rebuild_sqlite_table(conn: Connection, table: str, edit: Callable[[str], str]):
+    """SQLite can't alter a column: create an edited copy, move the rows over, swap it in"""
+    create_sql = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :t"), {'t': table}).scalar_one()
+    indexes = [row[0] for row in conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"), {'t': table})]
+    columns = ', '.join(c['name'] for c in inspect(conn).get_columns(table))
+    temp = f"{table}__rebuild"
+    new_sql = edit(create_sql).replace(f"CREATE TABLE {table}", f"CREATE TABLE {temp}", 1)
+    if new_sql == create_sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE {temp}", 1) \
+            or not new_sql.startswith(f"CREATE TABLE {temp}"):
+        raise RuntimeError(f"Unexpected schema for {table}: {create_sql}")
+    conn.execute(text(new_sql))
+    conn.execute(text(f"INSERT INTO {temp} ({columns}) SELECT {columns} FROM {table}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {temp} RENAME TO {table}"))
+    for statement in indexes:
+        conn.execute(text(statement))
+
+
+def _content_refs_not_null(conn: Connection):
+    """Make answer_id / plan_id NOT NULL on databases upgraded through 0005, as in the models"""
+    for table, ref_column in (('chat_history', 'answer_id'), ('study_plans', 'plan_id')):
+        column = next(c for c in inspect(conn).get_columns(table) if c['name'] == ref_column)
+        if not column['nullable']:
+            continue  # created by 0001 from the current models
+        missing = conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {ref_column} IS NULL")).scalar()
+        if missing:
+            raise RuntimeError(f"{missing} {table} row(s) have no {ref_column}; fix them before upgrading")
+        if conn.dialect.name == 'sqlite':
+            if table == 'chat_history':
+                search.drop_dependents(conn)
+            declared = f"{ref_column} INTEGER REFERENCES contents (id)"  # as added by 0005
+            _rebuild_sqlite_table(conn, table, lambda sql: sql.replace(
+                declared, f"{ref_column} INTEGER NOT NULL REFERENCES contents (id)"))
+        else:
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {ref_column} SET NOT NULL"))
+    if conn.dialect.name == 'sqlite':
+        search.create_index(conn)
+
+
+# (id, description, apply) - append only, never reorder or edit applied entries
+MIGRATIONS: List[Tuple[str, str, Callable[[Connection], None]]] = [
+    ('0001', 'baseline tables', _create_tables),
+    ('0002', 'composite indexes on chat_history and study_plans', _history_plan_indexes),
+    ('0003', 'study_plans (user_id, created_at) index for pagination', _study_plan_created_index),
+    ('0004', 'full-text search index on chat_history', _search_index),
+    ('0005', 'content-addressed answer and study plan bodies', _content_store),
+    ('0006', 'change versions and tombstones for delta sync', _change_versions),
+    ('0007', 'NOT NULL answer_id / plan_id on upgraded databases', _content_refs_not_null),
+]
+
+
+def _ensure_table(conn: Connection):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "id VARCHAR(32) PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"))
+
+
+def applied() -> set:
+    with db.engine.begin() as conn:
+        _ensure_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT id FROM schema_migrations"))}
+
+
+def pending() -> list:
+    done = applied()
+    return [(mid, description) for mid, description, _ in MIGRATIONS if mid not in done]
+
+
+def upgrade() -> list:
+    """Apply pending migrations in order, each in its own transaction; returns applied ids"""
+    done = applied()
+    ran = []
+    for mid, description, apply in MIGRATIONS:
+        if mid in done:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                apply(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (id, description, applied_at) VALUES (:id, :d, :at)"),
+                    {'id': mid, 'd': description, 'at': datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Another worker applied it first
+            continue
+        logger.info("Applied migration %s: %s", mid, description)
+        ran.append(mid)
+    return ran
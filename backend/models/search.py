@@ -0,0 +1,269 @@
+"""
+Full-text search over chat history
+
+SQLite FTS5 (chat_history_fts, migration 0005) or PostgreSQL GIN indexes,
+falling back to a scan:
+
+    search_history(user_id, 'newton laws', subject='Physics')
+    GET /api/user/<id>/history/search?q=newton+laws&subject=Physics
+"""
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from models.database import db
+from utils.log import get_logger
+
+logger = get_logger('search')
+
+# Snippet markers - the app renders answers as markdown, so highlight in bold
+HIGHLIGHT_START = '**'
+HIGHLIGHT_END = '**'
+SNIPPET_TOKENS = 16
+# Ranking: question hits count double
+QUESTION_WEIGHT = 2.0
+# Near-universal words only lengthen the doclists without narrowing the match
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from how i in is it its of on or so
+that the this to was what when where which who why will with you your
+""".split())
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+_ANSWER = "(SELECT body FROM contents WHERE id = {row}.answer_id)"
+
+_INSERT_TRIGGER = f"""CREATE TRIGGER IF NOT EXISTS chat_history_fts_ai AFTER INSERT ON chat_history BEGIN
+       INSERT INTO chat_history_fts(rowid, owner, question, answer)
+       VALUES (new.id, 'u' || new.user_id, new.question, {_ANSWER.format(row='new')});
+       END"""
+
+SQLITE_SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS chat_history_fts_source AS
+       SELECT h.id, 'u' || h.user_id AS owner, h.question, c.body AS answer
+       FROM chat_history h JOIN contents c ON c.id = h.answer_id""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_history_fts USING fts5(
+       owner, question, answer,
+       content='chat_history_fts_source', content_rowid='id',
+       tokenize='porter unicode61')""",
+    _INSERT_TRIGGER,
+    # Contents are released after the history row is gone, so old.answer_id still resolves
+    f"""CREATE TRIGGER IF NOT EXISTS chat_history_fts_ad AFTER DELETE ON chat_history BEGIN
+       INSERT INTO chat_history_fts(chat_history_fts, rowid, owner, question, answer)
+       VALUES ('delete', old.id, 'u' || old.user_id, old.question, {_ANSWER.format(row='old')});
+       END""",
+    f"""CREATE TRIGGER IF NOT EXISTS chat_history_fts_au AFTER UPDATE OF user_id, question, answer_id ON chat_history BEGIN
+       INSERT INTO chat_history_fts(chat_history_fts, rowid, owner, question, answer)
+       VALUES ('delete', old.id, 'u' || old.user_id, old.question, {_ANSWER.format(row='old')});
+       INSERT INTO chat_history_fts(rowid, owner, question, answer)
+       VALUES (new.id, 'u' || new.user_id, new.question, {_ANSWER.format(row='new')});
+       END""",
+]
+
+# Everything that reads chat_history columns by name, dropped while the table is reshaped
+SQLITE_DEPENDENTS = [
+    "DROP TRIGGER IF EXISTS chat_history_fts_ai",
+    "DROP TRIGGER IF EXISTS chat_history_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_history_fts_au",
+    "DROP VIEW IF EXISTS chat_history_fts_source",
+]
+
+POSTGRES_SCHEMA = [
+    """CREATE INDEX IF NOT EXISTS ix_chat_history_question_fts ON chat_history
+       USING GIN (to_tsvector('english', question))""",
+    """CREATE INDEX IF NOT EXISTS ix_contents_body_fts ON contents
+       USING GIN (to_tsvector('english', body))""",
+]
+
+
+def drop_dependents(conn: Connection):
+    """Migration step: detach the FTS triggers/view so chat_history columns can change"""
+    if conn.dialect.name == 'sqlite':
+        for statement in SQLITE_DEPENDENTS:
+            conn.execute(text(statement))
+
+
+def create_index(conn: Connection):
+    """Migration step: build the search index for this database"""
+    if conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_SCHEMA:
+            conn.execute(text(statement))
+        return
+    if conn.dialect.name != 'sqlite':
+        logger.warning("No full-text index for %s; search will scan", conn.dialect.name)
+        return
+    existed = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'")).first()
+    try:
+        for statement in SQLITE_SCHEMA:
+            conn.execute(text(statement))
+    except OperationalError as e:
+        if 'no such module' not in str(e):
+            raise
+        # SQLite built without FTS5 - search falls back to LIKE
+        logger.warning("FTS5 unavailable (%s); search will scan", e)
+        return
+    if not existed:
+        # Index rows that existed before the table did
+        conn.execute(text("INSERT INTO chat_history_fts(chat_history_fts) VALUES('rebuild')"))
+
+
+@contextmanager
+def bulk_insert(conn: Connection):
+    """
+    Wrap a bulk chat_history insert. On SQLite the per-row insert trigger
+    is dropped and the new rows indexed with one INSERT ... SELECT at the
+    end (about 4x faster than row by row), then the trigger is recreated.
+    DDL is transactional in SQLite and a write transaction excludes other
+    writers, so no other connection ever inserts without the trigger. Only
+    used inside an already-open write transaction; elsewhere a no-op.
+    """
+    dbapi = conn.connection.dbapi_connection
+    if conn.dialect.name != 'sqlite' or not getattr(dbapi, 'in_transaction', False) or not conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'chat_history_fts_ai'")).first():
+        yield
+        return
+    last_id = conn.execute(text("SELECT coalesce(max(id), 0) FROM chat_history")).scalar()
+    conn.execute(text("DROP TRIGGER chat_history_fts_ai"))
+    yield
+    conn.execute(text(
+        "INSERT INTO chat_history_fts(rowid, owner, question, answer) "
+        "SELECT id, owner, question, answer FROM chat_history_fts_source WHERE id > :last"), {'last': last_id})
+    conn.execute(text(_INSERT_TRIGGER))
+
+
+def fts_query(query: str) -> Optional[str]:
+    """
+    Quote user input into an FTS5 expression: every word must match;
+    a trailing * on the query makes the last word a prefix ("thermo*")
+    """
+    tokens = _TOKEN.findall(query)
+    tokens = [t for t in tokens if t.lower() not in STOPWORDS] or tokens
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    if query.rstrip().endswith('*'):
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+_fts_available = {}
+
+
+def _has_fts() -> bool:
+    url = str(db.engine.url)
+    if url not in _fts_available:
+        row = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_history_fts'")).first()
+        _fts_available[url] = row is not None
+    return _fts_available[url]
+
+
+def _search_sqlite(user_id: int, query: str, limit: int, subject: str = None) -> List[Dict]:
+    expression = fts_query(query)
+    if expression is None:
+        return []
+    terms = f"{{question answer}}: ({expression})"
+    snippets = f"""
+        snippet(chat_history_fts, 1, :hs, :he, '…', {SNIPPET_TOKENS}) AS question,
+        snippet(chat_history_fts, 2, :hs, :he, '…', {SNIPPET_TOKENS}) AS answer"""
+    # A MATCH ... rowid IN lookup re-expands prefix terms for every row, so
+    # prefix queries build their snippets while ranking; others only build
+    # them for the rows returned
+    inline = '*' in expression
+    # The per-user owner token ("u42") makes scoping part of the MATCH, and
+    # FTS5's bm25() ranks every match (owner column weighted 0)
+    ranked = db.session.execute(text(f"""
+        SELECT chat_history_fts.rowid AS id, {snippets + ',' if inline else ''}
+               bm25(chat_history_fts, 0.0, {QUESTION_WEIGHT}, 1.0) AS score
+        FROM chat_history_fts
+        {'JOIN chat_history c ON c.id = chat_history_fts.rowid' if subject else ''}
+        WHERE chat_history_fts MATCH :match
+        {'AND c.subject = :subject' if subject else ''}
+        ORDER BY score, chat_history_fts.rowid DESC
+        LIMIT :limit
+    """), {
+        'match': f"owner:u{int(user_id)} AND {terms}", 'subject': subject, 'limit': limit,
+        'hs': HIGHLIGHT_START, 'he': HIGHLIGHT_END,
+    }).mappings().all()
+    if not ranked:
+        return []
+
+    if inline:
+        sql = "SELECT c.id, c.subject, c.created_at FROM chat_history c WHERE c.id IN :ids"
+    else:
+        sql = f"""
+            SELECT c.id, c.subject, c.created_at, {snippets}
+            FROM chat_history_fts
+            JOIN chat_history c ON c.id = chat_history_fts.rowid
+            WHERE chat_history_fts MATCH :match AND chat_history_fts.rowid IN :ids
+        """
+    rows = db.session.execute(text(sql).bindparams(bindparam('ids', expanding=True)), {
+        'match': terms, 'ids': [row['id'] for row in ranked],
+        'hs': HIGHLIGHT_START, 'he': HIGHLIGHT_END,
+    }).mappings()
+    by_id = {row['id']: row for row in rows}
+    # bm25() is lower-is-better; report it like ts_rank, higher-is-better
+    return [{**row, **by_id[row['id']], 'score': round(-row['score'], 4)}
+            for row in ranked if row['id'] in by_id]
+
+
+def _search_postgres(user_id: int, query: str, limit: int, subject: str = None) -> List[Dict]:
+    options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_TOKENS}, MinWords=5"
+    sql = f"""
+        SELECT c.id, c.subject, c.created_at,
+               ts_headline('english', c.question, q, :options) AS question,
+               ts_headline('english', a.body, q, :options) AS answer,
+               ts_rank(to_tsvector('english', c.question || ' ' || a.body), q) AS score
+        FROM chat_history c
+        JOIN contents a ON a.id = c.answer_id,
+        plainto_tsquery('english', :query) q
+        WHERE c.user_id = :user_id
+          AND (to_tsvector('english', c.question) @@ q OR to_tsvector('english', a.body) @@ q)
+          {'AND c.subject = :subject' if subject else ''}
+        ORDER BY score DESC
+        LIMIT :limit
+    """
+    rows = db.session.execute(text(sql), {
+        'query': query, 'user_id': user_id, 'subject': subject, 'limit': limit, 'options': options,
+    }).mappings().all()
+    return [{**row, 'score': round(float(row['score']), 4)} for row in rows]
+
+
+def _search_scan(user_id: int, query: str, limit: int, subject: str = None) -> List[Dict]:
+    """No full-text index available: LIKE over the user's rows (slow on large histories)"""
+    from sqlalchemy.orm import contains_eager
+    from models.database import ChatHistory, Content
+
+    q = ChatHistory.query.join(ChatHistory.answer_content) \
+        .options(contains_eager(ChatHistory.answer_content)).filter(ChatHistory.user_id == user_id)
+    if subject:
+        q = q.filter(ChatHistory.subject == subject)
+    for token in _TOKEN.findall(query):
+        pattern = f"%{token}%"
+        q = q.filter(ChatHistory.question.ilike(pattern) | Content.body.ilike(pattern))
+    rows = q.order_by(ChatHistory.created_at.desc()).limit(limit).all()
+    return [{'id': r.id, 'subject': r.subject, 'created_at': r.created_at,
+             'question': r.question, 'answer': r.answer[:200], 'score': None} for r in rows]
+
+
+def search_history(user_id: int, query: str, limit: int = 20, subject: str = None) -> List[Dict]:
+    """Best-matching chats for one user, with highlighted snippets"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        results = _search_postgres(user_id, query, limit, subject)
+    elif dialect == 'sqlite' and _has_fts():
+        results = _search_sqlite(user_id, query, limit, subject)
+    else:
+        results = _search_scan(user_id, query, limit, subject)
+
+    for result in results:
+        created_at = result['created_at']
+        if isinstance(created_at, str):  # raw SQLite text
+            created_at = datetime.fromisoformat(created_at)
+        result['created_at'] = created_at.isoformat() if created_at else None
+    return results
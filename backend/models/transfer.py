@@ -0,0 +1,219 @@
+"""
+Streaming NDJSON export / bulk import of a user's history and study plans
+
+    {"type": "chat", "id": 1, "subject": "...", "question": "...", "answer": "...", "created_at": "..."}
+    {"type": "study_plan", "id": 7, "subject": "...", "topic": "...", "plan": "...", "is_active": true, "created_at": "..."}
+
+    GET  /api/user/<id>/export[?include=history,study_plans&gzip=1]
+    POST /api/user/<id>/import        (NDJSON body, gzip accepted; ids are ignored)
+    flask --app app export-user 42 -o user42.ndjson.gz
+    flask --app app import-user 42 user42.ndjson.gz
+"""
+import gzip
+import io
+import json
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, IO, Iterable, Iterator, List
+
+from sqlalchemy import insert, select
+
+from models.database import db, ChatHistory, Content, StudyPlan
+from models import content_store, search, user_stats
+
+KINDS = ('history', 'study_plans')
+EXPORT_BATCH_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000
+
+_quote = json.encoder.encode_basestring  # str -> JSON string literal
+_loads = json.JSONDecoder().decode
+
+
+class TransferError(ValueError):
+    """A malformed import line - reported to the client as a 400"""
+
+
+def _iso(value) -> str:
+    return _quote(value.isoformat()) if value is not None else 'null'
+
+
+class _BodyCache:
+    """
+    JSON-encoded content bodies by id. Many rows share a body, so each is
+    read and encoded once per export; cleared when full to keep memory flat
+    """
+
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self.encoded = {}
+
+    def load(self, content_ids):
+        missing = {content_id for content_id in content_ids if content_id not in self.encoded}
+        if not missing:
+            return
+        if len(self.encoded) + len(missing) > self.max_size:
+            self.encoded.clear()
+        missing = list(missing)
+        for start in range(0, len(missing), 500):
+            rows = db.session.execute(select(Content.id, Content.body)
+                                      .where(Content.id.in_(missing[start:start + 500])))
+            self.encoded.update((content_id, _quote(body)) for content_id, body in rows)
+
+
+def _history_lines(user_id: int, batch_size: int) -> Iterator[str]:
+    bodies = _BodyCache()
+    statement = select(ChatHistory.id, ChatHistory.subject, ChatHistory.question,
+                       ChatHistory.answer_id, ChatHistory.created_at) \
+        .where(ChatHistory.user_id == user_id) \
+        .order_by(ChatHistory.id) \
+        .execution_options(yield_per=batch_size)
+    # One chunk per fetched batch, so memory stays flat however long the history
+    for rows in db.session.execute(statement).partitions():
+        bodies.load(row[3] for row in rows)
+        encoded = bodies.encoded
+        yield ''.join(
+            f'{{"type":"chat","id":{row_id},"subject":{_quote(subject)},"question":{_quote(question)},'
+            f'"answer":{encoded[answer_id]},"created_at":{_iso(created_at)}}}\n'
+            for row_id, subject, question, answer_id, created_at in rows)
+
+
+def _plan_lines(user_id: int, batch_size: int) -> Iterator[str]:
+    bodies = _BodyCache()
+    statement = select(StudyPlan.id, StudyPlan.subject, StudyPlan.topic, StudyPlan.plan_id,
+                       StudyPlan.is_active, StudyPlan.created_at) \
+        .where(StudyPlan.user_id == user_id) \
+        .order_by(StudyPlan.id) \
+        .execution_options(yield_per=batch_size)
+    for rows in db.session.execute(statement).partitions():
+        bodies.load(row[3] for row in rows)
+        encoded = bodies.encoded
+        yield ''.join(
+            f'{{"type":"study_plan","id":{row_id},"subject":{_quote(subject)},"topic":{_quote(topic)},'
+            f'"plan":{encoded[plan_id]},"is_active":{"true" if is_active else "false"},'
+            f'"created_at":{_iso(created_at)}}}\n'
+            for row_id, subject, topic, plan_id, is_active, created_at in rows)
+
+
+def export_lines(user_id: int, kinds: Iterable[str] = KINDS,
+                 batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """NDJSON for one user, one string per fetched batch"""
+    if 'history' in kinds:
+        yield from _history_lines(user_id, batch_size)
+    if 'study_plans' in kinds:
+        yield from _plan_lines(user_id, batch_size)
+
+
+def gzip_stream(chunks: Iterable[str], level: int = 1) -> Iterator[bytes]:
+    """
+    Compress text chunks into one gzip stream as they are produced. Level 1:
+    ~3x the throughput of level 6 for a ~25% larger file on NDJSON
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def open_ndjson(stream: IO[bytes]) -> IO[bytes]:
+    """Wrap a binary stream, transparently un-gzipping it if it starts with the gzip magic"""
+    buffered = stream if isinstance(stream, io.BufferedReader) else io.BufferedReader(stream)
+    if buffered.peek(2)[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=buffered, mode='rb')
+    return buffered
+
+
+def _parse_time(value) -> datetime:
+    if not value:
+        return datetime.utcnow()
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:  # stored as naive UTC
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _insert_many(conn, table, columns: tuple, rows: List[tuple]):
+    """
+    executemany an insert. On SQLite it goes straight to the DB-API cursor:
+    SQLAlchemy's per-row bind processing costs more than the insert itself
+    """
+    if conn.dialect.name != 'sqlite':
+        conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+        return
+    conn.exec_driver_sql(
+        f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+
+def _flush(user_id: int, chats: List[tuple], plans: List[tuple]):
+    """chats: (subject, question, answer, created_at); plans: (subject, topic, plan, is_active, created_at)"""
+    # Distinct bodies interned in one executemany, then one executemany per table
+    refs = Counter(row[2] for row in chats) + Counter(row[2] for row in plans)
+    ids = content_store.intern_many(refs)
+    # One change version per row, so delta sync can page through an import
+    rows = len(chats) + len(plans)
+    first = user_stats.next_version(user_id, rows) - rows + 1
+
+    conn = db.session.connection()
+    if conn.dialect.name == 'sqlite':
+        # Raw DB-API rows: store datetimes in the text format SQLAlchemy's SQLite DateTime uses
+        def when(value): return value.isoformat(' ', 'microseconds')
+    else:
+        def when(value): return value
+    if chats:
+        with search.bulk_insert(conn):
+            _insert_many(conn, ChatHistory.__table__,
+                         ('user_id', 'subject', 'question', 'answer_id', 'created_at', 'version'),
+                         [(user_id, subject, question, ids[answer], when(created_at), first + i)
+                          for i, (subject, question, answer, created_at) in enumerate(chats)])
+    if plans:
+        _insert_many(conn, StudyPlan.__table__,
+                     ('user_id', 'subject', 'topic', 'plan_id', 'is_active', 'created_at', 'version'),
+                     [(user_id, subject, topic, ids[plan], is_active, when(created_at), first + len(chats) + i)
+                      for i, (subject, topic, plan, is_active, created_at) in enumerate(plans)])
+    db.session.commit()
+
+
+def import_lines(user_id: int, lines: Iterable, batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Insert NDJSON lines (str or bytes) as `user_id`'s rows, committing every
+    `batch_size` rows. Raises TransferError on a malformed line; batches
+    already committed stay.
+    """
+    chats, plans = [], []
+    counts = {'chats': 0, 'study_plans': 0}
+    try:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = _loads(line if isinstance(line, str) else line.decode('utf-8'))
+                kind = record['type']
+                if kind == 'chat':
+                    chats.append((record['subject'], record['question'], record['answer'],
+                                  _parse_time(record.get('created_at'))))
+                elif kind == 'study_plan':
+                    plans.append((record['subject'], record['topic'], record['plan'],
+                                  bool(record.get('is_active', True)), _parse_time(record.get('created_at'))))
+                else:
+                    raise ValueError(f"unknown type {kind!r}")
+            except KeyError as e:
+                raise TransferError(f"line {number}: missing field {e}")
+            except (ValueError, TypeError) as e:
+                raise TransferError(f"line {number}: {e}")
+            if len(chats) + len(plans) >= batch_size:
+                counts['chats'] += len(chats)
+                counts['study_plans'] += len(plans)
+                _flush(user_id, chats, plans)
+                chats, plans = [], []
+        if chats or plans:
+            counts['chats'] += len(chats)
+            counts['study_plans'] += len(plans)
+            _flush(user_id, chats, plans)
+    finally:
+        db.session.rollback()
+        # Bulk inserts bypass the per-row hooks - recount once
+        user_stats.rebuild(user_id)
+        db.session.commit()
+    return counts
@@ -0,0 +1,258 @@
+"""
+Incrementally maintained per-user statistics
+
+Route handlers call these after staging their change in the session and
+before committing, so the counters commit (or roll back) together with
+the rows they describe. Counters are updated in SQL (`count = count + 1`),
+which keeps concurrent writers from losing increments.
+
+If a user has no user_stats row yet (created before the table existed, or
+deleted for repair), it is rebuilt from the history/plan tables instead of
+incremented. `flask backfill-user-stats` rebuilds everything.
+
+Every change also advances the user's change version (next_version):
+added/updated rows are stamped with it and deletions leave a tombstone
+carrying it, which is what delta sync reads (models/changes.py).
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, case, update, delete, insert
+
+from models.database import db, User, ChatHistory, StudyPlan, Tombstone, UserStats, UserSubjectStats
+from models import content_store
+
+
+def _has_row(user_id: int) -> bool:
+    return db.session.query(UserStats.user_id).filter_by(user_id=user_id).first() is not None
+
+
+def _bump(user_id: int, **deltas):
+    """Add deltas to user_stats columns in SQL"""
+    values = {name: getattr(UserStats, name) + delta for name, delta in deltas.items()}
+    values['updated_at'] = datetime.utcnow()
+    db.session.execute(update(UserStats).where(UserStats.user_id == user_id).values(**values))
+
+
+def _bump_subject(user_id: int, subject: str, delta: int):
+    table = UserSubjectStats.__table__
+    if delta > 0:
+        # Upsert: two writers adding a subject's first chat at once (history_writer
+        # and a POST) would otherwise both insert, and one would fail
+        statement = content_store.upsert_insert(db.session.connection())(table) \
+            .values(user_id=user_id, subject=subject, chat_count=delta)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.subject],
+            set_={'chat_count': table.c.chat_count + statement.excluded.chat_count},
+        ))
+        return
+    db.session.execute(
+        update(UserSubjectStats)
+        .where(UserSubjectStats.user_id == user_id, UserSubjectStats.subject == subject)
+        .values(chat_count=UserSubjectStats.chat_count + delta)
+    )
+    db.session.execute(
+        delete(UserSubjectStats)
+        .where(UserSubjectStats.user_id == user_id, UserSubjectStats.subject == subject,
+               UserSubjectStats.chat_count <= 0)
+    )
+
+
+def _touch(user_id: int, when: datetime):
+    db.session.execute(
+        update(UserStats)
+        .where(UserStats.user_id == user_id)
+        .where((UserStats.last_activity_at == None) | (UserStats.last_activity_at < when))  # noqa: E711
+        .values(last_activity_at=when)
+    )
+
+
+def rebuild(user_id: int):
+    """Recompute one user's stats from the history and plan tables"""
+    db.session.flush()
+    total_chats = db.session.query(func.count(ChatHistory.id)).filter(ChatHistory.user_id == user_id).scalar()
+    total_plans, active_plans, last_plan = db.session.query(
+        func.count(StudyPlan.id),
+        func.coalesce(func.sum(case((StudyPlan.is_active == True, 1), else_=0)), 0),  # noqa: E712
+        func.max(StudyPlan.created_at)
+    ).filter(StudyPlan.user_id == user_id).one()
+    last_chat = db.session.query(func.max(ChatHistory.created_at)).filter(ChatHistory.user_id == user_id).scalar()
+    subjects = db.session.query(ChatHistory.subject, func.count(ChatHistory.id)) \
+        .filter(ChatHistory.user_id == user_id) \
+        .group_by(ChatHistory.subject).all()
+
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        # Continue after the newest version already stamped on the user's rows
+        versions = [db.session.query(func.max(model.version)).filter(model.user_id == user_id).scalar()
+                    for model in (ChatHistory, StudyPlan, Tombstone)]
+        stats = UserStats(user_id=user_id, version=max((v for v in versions if v), default=1))
+        db.session.add(stats)
+    else:
+        stats.version = UserStats.version + 1  # counts may change: invalidate cached responses
+    stats.total_chats = total_chats
+    stats.total_study_plans = total_plans
+    stats.active_study_plans = active_plans
+    stats.last_activity_at = max((t for t in (last_chat, last_plan) if t), default=None)
+    stats.updated_at = datetime.utcnow()
+
+    db.session.execute(delete(UserSubjectStats).where(UserSubjectStats.user_id == user_id))
+    for subject, count in subjects:
+        db.session.add(UserSubjectStats(user_id=user_id, subject=subject, chat_count=count))
+    db.session.flush()
+
+
+def created(user_id: int):
+    """Empty stats row for a brand new user"""
+    db.session.add(UserStats(user_id=user_id))
+
+
+def next_version(user_id: int, count: int = 1) -> int:
+    """
+    Advance the user's change version by `count` and return the new value;
+    rows changed now are stamped with it (bulk writers reserve a block and
+    number rows up to it). The row lock taken here is held until commit,
+    so versions become visible in increasing order.
+    """
+    if not _has_row(user_id):
+        rebuild(user_id)
+    return db.session.execute(
+        update(UserStats).where(UserStats.user_id == user_id)
+        .values(version=UserStats.version + count)
+        .returning(UserStats.version)
+    ).scalar_one()
+
+
+def _tombstone(user_id: int, kind: str, item_ids: List[Optional[int]]):
+    """Record deletions for delta sync; item id None means every item of `kind`"""
+    version = next_version(user_id)
+    now = datetime.utcnow()
+    db.session.execute(insert(Tombstone), [
+        {'user_id': user_id, 'kind': kind, 'item_id': item_id, 'version': version, 'created_at': now}
+        for item_id in item_ids
+    ])
+
+
+def chat_added(chat: ChatHistory):
+    if not _has_row(chat.user_id):
+        rebuild(chat.user_id)
+    else:
+        _bump(chat.user_id, total_chats=1)
+        _bump_subject(chat.user_id, chat.subject, 1)
+        _touch(chat.user_id, chat.created_at or datetime.utcnow())
+    chat.version = next_version(chat.user_id)
+
+
+def chat_deleted(chat: ChatHistory):
+    if not _has_row(chat.user_id):
+        rebuild(chat.user_id)
+    else:
+        _bump(chat.user_id, total_chats=-1)
+        _bump_subject(chat.user_id, chat.subject, -1)
+    _tombstone(chat.user_id, 'chat', [chat.id])
+
+
+def chats_cleared(user_id: int):
+    if not _has_row(user_id):
+        rebuild(user_id)
+    else:
+        db.session.execute(update(UserStats).where(UserStats.user_id == user_id)
+                           .values(total_chats=0, updated_at=datetime.utcnow()))
+        db.session.execute(delete(UserSubjectStats).where(UserSubjectStats.user_id == user_id))
+    _tombstone(user_id, 'chat', [None])
+
+
+def chats_removed(rows: Iterable):
+    """Bulk prune/archive: `rows` are the deleted chats' (id, user_id, subject)"""
+    removed = Counter((row.user_id, row.subject) for row in rows)
+    ids = defaultdict(list)
+    for row in rows:
+        ids[row.user_id].append(row.id)
+    rebuilt = set()
+    for user_id, chat_ids in ids.items():
+        if not _has_row(user_id):
+            rebuild(user_id)
+            rebuilt.add(user_id)
+        else:
+            _bump(user_id, total_chats=-len(chat_ids))
+        _tombstone(user_id, 'chat', chat_ids)
+    for (user_id, subject), count in removed.items():
+        if user_id not in rebuilt:
+            _bump_subject(user_id, subject, -count)
+
+
+def plan_added(plan: StudyPlan):
+    if not _has_row(plan.user_id):
+        rebuild(plan.user_id)
+    else:
+        _bump(plan.user_id, total_study_plans=1, active_study_plans=1 if plan.is_active else 0)
+        _touch(plan.user_id, plan.created_at or datetime.utcnow())
+    plan.version = next_version(plan.user_id)
+
+
+def plan_updated(plan: StudyPlan, was_active: bool):
+    if bool(was_active) == bool(plan.is_active):
+        return
+    if not _has_row(plan.user_id):
+        rebuild(plan.user_id)
+    else:
+        _bump(plan.user_id, active_study_plans=1 if plan.is_active else -1)
+    plan.version = next_version(plan.user_id)
+
+
+def plans_deactivated(rows: Iterable):
+    """Bulk deactivation: `rows` are the switched-off plans' (id, user_id)"""
+    ids = defaultdict(list)
+    for row in rows:
+        ids[row.user_id].append(row.id)
+    for user_id, plan_ids in ids.items():
+        if not _has_row(user_id):
+            rebuild(user_id)
+        else:
+            _bump(user_id, active_study_plans=-len(plan_ids))
+        db.session.execute(update(StudyPlan).where(StudyPlan.id.in_(plan_ids))
+                           .values(version=next_version(user_id)))
+
+
+def plan_deleted(plan: StudyPlan):
+    if not _has_row(plan.user_id):
+        rebuild(plan.user_id)
+    else:
+        _bump(plan.user_id, total_study_plans=-1, active_study_plans=-1 if plan.is_active else 0)
+    _tombstone(plan.user_id, 'study_plan', [plan.id])
+
+
+def get(user_id: int) -> Optional[Dict]:
+    """Stats for one user via primary-key lookups; rebuilt once if missing"""
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        rebuild(user_id)
+        db.session.commit()
+        stats = db.session.get(UserStats, user_id)
+
+    subjects = db.session.query(UserSubjectStats.subject, UserSubjectStats.chat_count) \
+        .filter(UserSubjectStats.user_id == user_id).all()
+    breakdown = {subject: count for subject, count in subjects if count > 0}
+    return {
+        'total_chats': stats.total_chats,
+        'total_study_plans': stats.total_study_plans,
+        'active_study_plans': stats.active_study_plans,
+        'subjects_studied': len(breakdown),
+        'subject_breakdown': breakdown,
+        'last_activity_at': stats.last_activity_at.isoformat() if stats.last_activity_at else None,
+    }
+
+
+def backfill(user_ids: Iterable[int] = None, batch_size: int = 100) -> int:
+    """Rebuild stats for the given users (default: all); returns users processed"""
+    if user_ids is None:
+        user_ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+    done = 0
+    for user_id in user_ids:
+        rebuild(user_id)
+        done += 1
+        if done % batch_size == 0:
+            db.session.commit()
+    db.session.commit()
+    return done
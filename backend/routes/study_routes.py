@@ -1,27 +1,81 @@
-from flask import Blueprint, request, jsonify
-from services.ai_service import AIService
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from services.ai_service import ai_service
+from models.history_writer import history_writer
+from utils.sse import stream_sse
+from utils import http_cache
 
 study_bp = Blueprint('study', __name__)
-ai_service = AIService()
+
+def answer_response(ctx, body):
+    """JSON response tagged with which pipeline layer produced the answer"""
+    response = jsonify(body)
+    response.headers['X-Answer-Source'] = ctx.source
+    return response, 200
+
+def parse_user_id(data):
+    """Optional user_id in the request body - answers are saved to that user's history"""
+    user_id = data.get('user_id')
+    if user_id is None:
+        return None
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        raise ValueError('user_id must be an integer')
+
+def sse_response(chunks, done):
+    """Build a Server-Sent Events response from text chunks"""
+    return Response(
+        stream_with_context(stream_sse(chunks, done)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so chunks flush immediately
+        }
+    )
 
 @study_bp.route('/ask', methods=['POST'])
 def ask_question():
     """Handle student questions"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         question = data.get('question')
-        subject = data.get('subject', 'General')
+        subject = data.get('subject') or 'General'
         
         if not question:
             return jsonify({'error': 'Question is required'}), 400
+        try:
+            user_id = parse_user_id(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        answer = ai_service.get_answer(question, subject)
+        ctx = ai_service.run('ask', question=question, subject=subject)
+        if user_id is not None and ctx.source != 'fallback':
+            history_writer.add_chat(user_id, subject, question, ctx.response)
         
-        return jsonify({
-            'answer': answer,
+        return answer_response(ctx, {
+            'answer': ctx.response,
             'subject': subject,
             'question': question
-        }), 200
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@study_bp.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """Stream answer to student question as Server-Sent Events"""
+    try:
+        data = request.get_json(silent=True) or {}
+        question = data.get('question')
+        subject = data.get('subject') or 'General'
+        
+        if not question:
+            return jsonify({'error': 'Question is required'}), 400
+        
+        return sse_response(
+            ai_service.stream_answer(question, subject),
+            {'subject': subject, 'question': question}
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -30,20 +84,45 @@ def ask_question():
 def generate_study_plan():
     """Generate a study plan for a topic"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         subject = data.get('subject')
         topic = data.get('topic')
         
         if not subject or not topic:
             return jsonify({'error': 'Subject and topic are required'}), 400
+        try:
+            user_id = parse_user_id(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        plan = ai_service.generate_study_plan(subject, topic)
+        ctx = ai_service.run('study_plan', subject=subject, topic=topic)
+        if user_id is not None and ctx.source != 'fallback':
+            history_writer.add_study_plan(user_id, subject, topic, ctx.response)
         
-        return jsonify({
-            'plan': plan,
+        return answer_response(ctx, {
+            'plan': ctx.response,
             'subject': subject,
             'topic': topic
-        }), 200
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@study_bp.route('/study-plan/stream', methods=['POST'])
+def generate_study_plan_stream():
+    """Stream study plan as Server-Sent Events"""
+    try:
+        data = request.get_json(silent=True) or {}
+        subject = data.get('subject')
+        topic = data.get('topic')
+        
+        if not subject or not topic:
+            return jsonify({'error': 'Subject and topic are required'}), 400
+        
+        return sse_response(
+            ai_service.stream_study_plan(subject, topic),
+            {'subject': subject, 'topic': topic}
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -52,20 +131,46 @@ def generate_study_plan():
 def explain_concept():
     """Explain a concept at different difficulty levels"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         concept = data.get('concept')
         level = data.get('level', 'intermediate')
         
         if not concept:
             return jsonify({'error': 'Concept is required'}), 400
+        try:
+            user_id = parse_user_id(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        explanation = ai_service.explain_concept(concept, level)
+        ctx = ai_service.run('explain', concept=concept, level=level)
+        if user_id is not None and ctx.source != 'fallback':
+            history_writer.add_chat(user_id, data.get('subject') or 'General',
+                                    f"Explain {concept} ({level})", ctx.response)
         
-        return jsonify({
-            'explanation': explanation,
+        return answer_response(ctx, {
+            'explanation': ctx.response,
             'concept': concept,
             'level': level
-        }), 200
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@study_bp.route('/explain/stream', methods=['POST'])
+def explain_concept_stream():
+    """Stream concept explanation as Server-Sent Events"""
+    try:
+        data = request.get_json(silent=True) or {}
+        concept = data.get('concept')
+        level = data.get('level', 'intermediate')
+        
+        if not concept:
+            return jsonify({'error': 'Concept is required'}), 400
+        
+        return sse_response(
+            ai_service.stream_explanation(concept, level),
+            {'concept': concept, 'level': level}
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -74,12 +179,17 @@ def explain_concept():
 def get_topics(subject):
     """Get topics for a subject"""
     try:
-        topics = ai_service.get_subject_topics(subject)
-        
-        return jsonify({
+        payload = {
             'subject': subject,
-            'topics': topics
-        }), 200
+            'topics': ai_service.get_subject_topics(subject)
+        }
+        # Static catalog: revalidated by content hash, cacheable for a week
+        etag = http_cache.content_etag(payload)
+        cached = http_cache.not_modified(etag, http_cache.IMMUTABLE)
+        if cached is not None:
+            return cached
+        
+        return http_cache.tag(jsonify(payload), etag, http_cache.IMMUTABLE), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,9 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from models.database import db, User, ChatHistory, StudyPlan
-from datetime import datetime
+from models import changes, content_store, lifecycle, search, transfer, user_stats
+from utils.http_cache import per_user
+from utils.pagination import PaginationError, paginate, parse_fields, parse_limit, project
+from datetime import datetime, timedelta
 
 user_bp = Blueprint('user', __name__)
 
+# Fields clients may select with ?fields= on list endpoints (e.g. skip answer/plan bodies)
+HISTORY_FIELDS = ['id', 'subject', 'question', 'answer', 'created_at', 'version']
+PLAN_FIELDS = ['id', 'subject', 'topic', 'plan', 'created_at', 'is_active', 'version']
+
 # User Management
 @user_bp.route('/user/create', methods=['POST'])
 def create_user():
@@ -19,57 +26,90 @@ def create_user():
     # Create new user
     user = User(username=username, email=email)
     db.session.add(user)
+    db.session.flush()
+    user_stats.created(user.id)
     db.session.commit()
     
     return jsonify(user.to_dict()), 201
 
 @user_bp.route('/user/<int:user_id>', methods=['GET'])
+@per_user
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
     return jsonify(user.to_dict())
 
+@user_bp.route('/user/<int:user_id>', methods=['DELETE'])
+def delete_user(user_id):
+    # Set-based, batched deletes - the ORM cascade would load every row first
+    deleted = lifecycle.delete_user(user_id)
+    if deleted is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    return jsonify({'message': 'User deleted successfully', 'deleted': deleted}), 200
+
 @user_bp.route('/user/<int:user_id>/stats', methods=['GET'])
+@per_user
 def get_user_stats(user_id):
     user = User.query.get_or_404(user_id)
     
-    # Get statistics
-    total_chats = len(user.chat_history)
-    total_plans = len(user.study_plans)
-    active_plans = len([p for p in user.study_plans if p.is_active])
-    
-    # Get subject breakdown
-    subjects = {}
-    for chat in user.chat_history:
-        subjects[chat.subject] = subjects.get(chat.subject, 0) + 1
+    # Maintained incrementally - primary-key lookups regardless of history size
+    stats = user_stats.get(user_id)
     
     return jsonify({
-        'user': user.to_dict(),
-        'stats': {
-            'total_chats': total_chats,
-            'total_study_plans': total_plans,
-            'active_study_plans': active_plans,
-            'subjects_studied': len(subjects),
-            'subject_breakdown': subjects
-        }
+        'user': user.to_dict(stats),
+        'stats': stats
     })
 
 # Chat History
 @user_bp.route('/user/<int:user_id>/history', methods=['GET'])
+@per_user
 def get_chat_history(user_id):
     user = User.query.get_or_404(user_id)
-    limit = request.args.get('limit', 50, type=int)
     subject = request.args.get('subject')
+    try:
+        limit = parse_limit(request.args.get('limit', type=int))
+        fields = parse_fields(request.args.get('fields'), HISTORY_FIELDS)
+        
+        query = ChatHistory.query.filter_by(user_id=user_id)
+        
+        if subject:
+            query = query.filter_by(subject=subject)
+        
+        history, next_cursor = paginate(query, ChatHistory, request.args.get('cursor'), limit, fields)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     
-    query = ChatHistory.query.filter_by(user_id=user_id)
+    return jsonify({
+        'total': len(history),
+        'history': [project(h, fields) if fields else h.to_dict() for h in history],
+        'next_cursor': next_cursor
+    })
+
+# Delta sync (see models/changes.py)
+@user_bp.route('/user/<int:user_id>/changes', methods=['GET'])
+def get_changes(user_id):
+    since = request.args.get('since', 0, type=int)
+    limit = min(max(request.args.get('limit', changes.DEFAULT_LIMIT, type=int), 1), changes.MAX_LIMIT)
+    
+    result = changes.changes_since(user_id, since, limit)
+    if result is None:
+        return jsonify({'error': 'User not found'}), 404
     
-    if subject:
-        query = query.filter_by(subject=subject)
+    return jsonify(result)
+
+@user_bp.route('/user/<int:user_id>/history/search', methods=['GET'])
+def search_chat_history(user_id):
+    user = User.query.get_or_404(user_id)
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
     
-    history = query.order_by(ChatHistory.created_at.desc()).limit(limit).all()
+    results = search.search_history(user_id, query, limit, request.args.get('subject'))
     
     return jsonify({
-        'total': len(history),
-        'history': [h.to_dict() for h in history]
+        'total': len(results),
+        'results': results
     })
 
 @user_bp.route('/user/<int:user_id>/history', methods=['POST'])
@@ -85,6 +125,7 @@ def add_chat_history(user_id):
     )
     
     db.session.add(chat)
+    user_stats.chat_added(chat)
     db.session.commit()
     
     return jsonify(chat.to_dict()), 201
@@ -93,6 +134,7 @@ def add_chat_history(user_id):
 def delete_chat_history(user_id, chat_id):
     chat = ChatHistory.query.filter_by(id=chat_id, user_id=user_id).first_or_404()
     db.session.delete(chat)
+    user_stats.chat_deleted(chat)
     db.session.commit()
     
     return jsonify({'message': 'Chat deleted successfully'}), 200
@@ -100,27 +142,65 @@ def delete_chat_history(user_id, chat_id):
 @user_bp.route('/user/<int:user_id>/history/clear', methods=['DELETE'])
 def clear_chat_history(user_id):
     user = User.query.get_or_404(user_id)
+    refs = content_store.references(ChatHistory, ChatHistory.user_id == user_id)
     ChatHistory.query.filter_by(user_id=user_id).delete()
+    content_store.release(refs)
+    user_stats.chats_cleared(user_id)
     db.session.commit()
     
     return jsonify({'message': 'Chat history cleared successfully'}), 200
 
+# Export / import (streamed NDJSON, see models/transfer.py)
+@user_bp.route('/user/<int:user_id>/export', methods=['GET'])
+def export_user_data(user_id):
+    user = User.query.get_or_404(user_id)
+    kinds = [kind.strip() for kind in request.args.get('include', ','.join(transfer.KINDS)).split(',')]
+    unknown = set(kinds) - set(transfer.KINDS)
+    if unknown:
+        return jsonify({'error': f"Unknown include: {', '.join(sorted(unknown))}"}), 400
+    
+    lines = transfer.export_lines(user_id, kinds)
+    if request.args.get('gzip', 'false').lower() in ('1', 'true'):
+        return Response(
+            stream_with_context(transfer.gzip_stream(lines)),
+            mimetype='application/gzip',
+            headers={'Content-Disposition': f'attachment; filename=user-{user_id}.ndjson.gz'}
+        )
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+@user_bp.route('/user/<int:user_id>/import', methods=['POST'])
+def import_user_data(user_id):
+    user = User.query.get_or_404(user_id)
+    try:
+        imported = transfer.import_lines(user_id, transfer.open_ndjson(request.stream))
+    except transfer.TransferError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'message': 'Import complete', 'imported': imported}), 201
+
 # Study Plans
 @user_bp.route('/user/<int:user_id>/study-plans', methods=['GET'])
+@per_user
 def get_study_plans(user_id):
     user = User.query.get_or_404(user_id)
     active_only = request.args.get('active_only', 'false').lower() == 'true'
-    
-    query = StudyPlan.query.filter_by(user_id=user_id)
-    
-    if active_only:
-        query = query.filter_by(is_active=True)
-    
-    plans = query.order_by(StudyPlan.created_at.desc()).all()
+    try:
+        limit = parse_limit(request.args.get('limit', type=int))
+        fields = parse_fields(request.args.get('fields'), PLAN_FIELDS)
+        
+        query = StudyPlan.query.filter_by(user_id=user_id)
+        
+        if active_only:
+            query = query.filter_by(is_active=True)
+        
+        plans, next_cursor = paginate(query, StudyPlan, request.args.get('cursor'), limit, fields)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
         'total': len(plans),
-        'plans': [p.to_dict() for p in plans]
+        'plans': [project(p, fields) if fields else p.to_dict() for p in plans],
+        'next_cursor': next_cursor
     })
 
 @user_bp.route('/user/<int:user_id>/study-plans', methods=['POST'])
@@ -137,17 +217,38 @@ def add_study_plan(user_id):
     )
     
     db.session.add(plan)
+    user_stats.plan_added(plan)
     db.session.commit()
     
     return jsonify(plan.to_dict()), 201
 
+@user_bp.route('/user/<int:user_id>/study-plans/deactivate', methods=['POST'])
+def deactivate_study_plans(user_id):
+    user = User.query.get_or_404(user_id)
+    data = request.get_json(silent=True) or {}
+    
+    before = None
+    if data.get('older_than_days') is not None:
+        try:
+            days = int(data['older_than_days'])
+            if days < 0:
+                raise ValueError
+            before = datetime.utcnow() - timedelta(days=days)
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'older_than_days must be a non-negative integer'}), 400
+    changed = lifecycle.deactivate_plans(user_id, before=before)
+    
+    return jsonify({'message': 'Study plans deactivated', 'deactivated': changed}), 200
+
 @user_bp.route('/user/<int:user_id>/study-plans/<int:plan_id>', methods=['PUT'])
 def update_study_plan(user_id, plan_id):
     plan = StudyPlan.query.filter_by(id=plan_id, user_id=user_id).first_or_404()
     data = request.json
+    was_active = plan.is_active
     
     if 'is_active' in data:
         plan.is_active = data['is_active']
+        user_stats.plan_updated(plan, was_active)
     
     db.session.commit()
     
@@ -157,6 +258,7 @@ def update_study_plan(user_id, plan_id):
 def delete_study_plan(user_id, plan_id):
     plan = StudyPlan.query.filter_by(id=plan_id, user_id=user_id).first_or_404()
     db.session.delete(plan)
+    user_stats.plan_deleted(plan)
     db.session.commit()
     
     return jsonify({'message': 'Study plan deleted successfully'}), 200
@@ -0,0 +1,388 @@
+"""
+Composable request pipeline for AI study queries
+
+Every request runs through an ordered list of stages:
+    normalize → faq → cache → coalesce → provider → store
+
+Each stage may short-circuit by setting a response on the context, in
+which case the remaining lookup stages are skipped. Stages are timed
+individually and the stage layout is configurable per endpoint.
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List
+
+from utils.counters import ShardedStats
+from utils.log import get_logger, sample
+from utils.metrics import COALESCE_WAITERS, PIPELINE_STAGE_DURATION
+from utils.prompt_utils import compressor
+from utils.sse import chunk_text
+from utils.tracing import add_span
+
+logger = get_logger('pipeline')
+
+
+class Task:
+    """Describes one endpoint: how to key, prompt and cache it"""
+
+    def __init__(self, name: str, text_fields: List[str], max_tokens: int,
+                 ttl: int, fallback: str, faq_field: str = None):
+        self.name = name
+        self.text_fields = text_fields
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.fallback = fallback
+        self.faq_field = faq_field
+
+    def cache_key(self, params: Dict) -> str:
+        raise NotImplementedError
+
+    def metadata(self, params: Dict) -> Dict:
+        raise NotImplementedError
+
+    def prompt(self, params: Dict) -> str:
+        raise NotImplementedError
+
+
+class AskTask(Task):
+    def __init__(self, fallback: str):
+        super().__init__('ask', ['question', 'subject'], max_tokens=1024,
+                         ttl=3600, fallback=fallback, faq_field='question')
+
+    def cache_key(self, params: Dict) -> str:
+        return params['question']
+
+    def metadata(self, params: Dict) -> Dict:
+        return {'subject': params['subject'], 'type': 'qa'}
+
+    def prompt(self, params: Dict) -> str:
+        return compressor.create_efficient_prompt(
+            question=params['question'],
+            subject=params['subject']
+        )
+
+
+class StudyPlanTask(Task):
+    def __init__(self):
+        # Study plans don't change often, so cache for longer
+        super().__init__('study_plan', ['subject', 'topic'], max_tokens=1536,
+                         ttl=7200, fallback="⚠️ Couldn't generate study plan. Please try again.")
+
+    def cache_key(self, params: Dict) -> str:
+        return f"study_plan: {params['subject']} - {params['topic']}"
+
+    def metadata(self, params: Dict) -> Dict:
+        return {'subject': params['subject'], 'topic': params['topic'], 'type': 'study_plan'}
+
+    def prompt(self, params: Dict) -> str:
+        return compressor.create_study_plan_prompt(params['subject'], params['topic'])
+
+
+class ExplainTask(Task):
+    def __init__(self):
+        super().__init__('explain', ['concept', 'level'], max_tokens=512,
+                         ttl=3600, fallback="⚠️ Couldn't explain concept. Please try again.")
+
+    def cache_key(self, params: Dict) -> str:
+        return f"concept: {params['concept']} ({params['level']})"
+
+    def metadata(self, params: Dict) -> Dict:
+        return {'concept': params['concept'], 'level': params['level'], 'type': 'explain'}
+
+    def prompt(self, params: Dict) -> str:
+        return compressor.create_explain_prompt(params['concept'], params['level'])
+
+
+class RequestContext:
+    """State carried through the pipeline for a single request"""
+
+    def __init__(self, task: Task, params: Dict):
+        self.task = task
+        self.params = dict(params)
+        self.cache_key = task.cache_key(self.params)
+        self.metadata = task.metadata(self.params)
+        self.response = None
+        self.source = None  # 'faq' | 'cache' | 'coalesced' | 'provider' | 'fallback'
+        self.timings = {}   # stage name -> milliseconds
+        self.state = {}     # per-stage scratch space
+
+    @property
+    def done(self) -> bool:
+        return self.response is not None
+
+    def respond(self, response: str, source: str):
+        self.response = response
+        self.source = source
+
+
+class Stage:
+    """Base class for pipeline stages"""
+
+    name = 'stage'
+    runs_after_response = False  # Still run once the response is known
+    streaming = True             # Take part in streamed requests
+
+    def run(self, ctx: RequestContext):
+        raise NotImplementedError
+
+    def finish(self, ctx: RequestContext):
+        """Called after the pipeline completes (even on error)"""
+        pass
+
+
+class NormalizeStage(Stage):
+    """Collapse whitespace in text inputs and derive the cache key"""
+
+    name = 'normalize'
+
+    def run(self, ctx: RequestContext):
+        for field in ctx.task.text_fields:
+            value = ctx.params.get(field)
+            if isinstance(value, str):
+                ctx.params[field] = re.sub(r'\s+', ' ', value).strip()
+        ctx.cache_key = ctx.task.cache_key(ctx.params)
+        ctx.metadata = ctx.task.metadata(ctx.params)
+
+
+class FAQStage(Stage):
+    """Answer from the local FAQ database (instant, free)"""
+
+    name = 'faq'
+
+    def __init__(self, faq):
+        self.faq = faq
+
+    def run(self, ctx: RequestContext):
+        if not ctx.task.faq_field:
+            return
+        query = ctx.params[ctx.task.faq_field]
+        if self.faq.can_answer(query):
+            answer = self.faq.get_answer(query)
+            if answer:
+                logger.debug("Local FAQ match", extra=sample(0.01))
+                ctx.respond(answer, 'faq')
+
+
+class CacheStage(Stage):
+    """Serve previously generated responses"""
+
+    name = 'cache'
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def run(self, ctx: RequestContext):
+        cached = self.cache.get(ctx.cache_key, ctx.metadata)
+        if cached:
+            logger.debug("Cache HIT", extra=sample(0.01))
+            ctx.respond(cached, 'cache')
+
+
+class _Flight:
+    """An in-flight provider call that identical requests can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+
+
+class CoalesceStage(Stage):
+    """
+    Single-flight identical requests: the first caller goes on to the
+    provider, concurrent duplicates wait for its response instead of
+    spending quota on the same prompt
+    """
+
+    name = 'coalesce'
+    streaming = False
+
+    def __init__(self, timeout: float = 120):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._inflight: Dict[tuple, _Flight] = {}
+
+    def _key(self, ctx: RequestContext) -> tuple:
+        return (ctx.task.name, ctx.cache_key, tuple(sorted(ctx.metadata.items())))
+
+    def run(self, ctx: RequestContext):
+        key = self._key(ctx)
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is None:
+                self._inflight[key] = ctx.state['flight'] = _Flight()
+                return
+
+        COALESCE_WAITERS.inc()
+        try:
+            completed = flight.event.wait(self.timeout)
+        finally:
+            COALESCE_WAITERS.dec()
+        if completed and flight.response is not None:
+            ctx.respond(flight.response, 'coalesced')
+
+    def finish(self, ctx: RequestContext):
+        flight = ctx.state.pop('flight', None)
+        if flight is None:
+            return
+        with self._lock:
+            self._inflight.pop(self._key(ctx), None)
+        if ctx.source == 'provider':
+            flight.response = ctx.response
+        flight.event.set()
+
+
+class ProviderStage(Stage):
+    """Call AI providers with fallback"""
+
+    name = 'provider'
+
+    def __init__(self, provider_manager):
+        self.provider_manager = provider_manager
+
+    def run(self, ctx: RequestContext):
+        logger.debug("Calling AI API for %s", ctx.task.name)
+        try:
+            response = self.provider_manager.call_with_fallback(
+                prompt=ctx.task.prompt(ctx.params),
+                temperature=0.7,
+                max_tokens=ctx.task.max_tokens
+            )
+        except Exception as e:
+            logger.exception("AI service error: %s", e)
+            response = None
+
+        if response:
+            ctx.respond(response, 'provider')
+        else:
+            ctx.respond(ctx.task.fallback, 'fallback')
+
+    def stream(self, ctx: RequestContext) -> Iterator[str]:
+        logger.debug("Streaming from AI API for %s", ctx.task.name)
+        parts = []
+        for chunk in self.provider_manager.stream_with_fallback(
+            prompt=ctx.task.prompt(ctx.params),
+            temperature=0.7,
+            max_tokens=ctx.task.max_tokens
+        ):
+            parts.append(chunk)
+            yield chunk
+
+        if parts:
+            ctx.respond(''.join(parts), 'provider')
+        else:
+            ctx.respond(ctx.task.fallback, 'fallback')
+            yield ctx.task.fallback
+
+
+class StoreStage(Stage):
+    """Cache fresh provider responses"""
+
+    name = 'store'
+    runs_after_response = True
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def run(self, ctx: RequestContext):
+        # Only complete provider responses are cached - never fallbacks
+        if ctx.source == 'provider':
+            self.cache.set(ctx.cache_key, ctx.response, ctx.metadata, ttl=ctx.task.ttl)
+
+
+# Named stage layouts selectable per endpoint
+PIPELINE_PROFILES = {
+    'optimized': ['normalize', 'faq', 'cache', 'coalesce', 'provider', 'store'],
+    'direct': ['normalize', 'provider'],
+}
+
+
+def resolve_stage_names(endpoint: str, default: str = 'optimized') -> List[str]:
+    """
+    Read the stage layout for an endpoint from the environment.
+    AI_PIPELINE_<ENDPOINT> overrides AI_PIPELINE; either may name a
+    profile ('optimized', 'direct') or list stages, e.g. 'normalize,cache,provider,store'
+    """
+    value = os.getenv(f'AI_PIPELINE_{endpoint.upper()}') or os.getenv('AI_PIPELINE', default)
+    value = value.strip()
+    if value in PIPELINE_PROFILES:
+        return list(PIPELINE_PROFILES[value])
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class Pipeline:
+    """Ordered, timed list of stages for one endpoint"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        names = [stage.name for stage in stages]
+        if 'provider' not in names:
+            raise ValueError(f"Pipeline must include a 'provider' stage, got {names}")
+        # stage name -> its (count, total_ms) counter names
+        self._timing_keys = {name: (f"{name}.count", f"{name}.total_ms") for name in names}
+        self._timings = ShardedStats(*(key for keys in self._timing_keys.values() for key in keys))
+
+    @property
+    def stage_names(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+    @property
+    def stage_timings(self) -> Dict[str, Dict]:
+        totals = self._timings.snapshot()
+        return {name: {'count': totals[count], 'total_ms': totals[total_ms]}
+                for name, (count, total_ms) in self._timing_keys.items()}
+
+    def _should_run(self, stage: Stage, ctx: RequestContext) -> bool:
+        return not ctx.done or stage.runs_after_response
+
+    def _record(self, ctx: RequestContext, stage: Stage, started: float):
+        elapsed = time.perf_counter() - started
+        PIPELINE_STAGE_DURATION.labels(ctx.task.name, stage.name).observe(elapsed)
+        elapsed_ms = elapsed * 1000
+        add_span(stage.name, elapsed_ms)
+        ctx.timings[stage.name] = ctx.timings.get(stage.name, 0.0) + elapsed_ms
+        count, total_ms = self._timing_keys[stage.name]
+        self._timings.add({count: 1, total_ms: elapsed_ms})
+
+    def run(self, ctx: RequestContext) -> RequestContext:
+        started_stages = []
+        try:
+            for stage in self.stages:
+                if not self._should_run(stage, ctx):
+                    continue
+                started_stages.append(stage)
+                started = time.perf_counter()
+                try:
+                    stage.run(ctx)
+                finally:
+                    self._record(ctx, stage, started)
+        finally:
+            for stage in reversed(started_stages):
+                stage.finish(ctx)
+        return ctx
+
+    def stream(self, ctx: RequestContext) -> Iterator[str]:
+        """Run the pipeline, yielding response chunks as they become available"""
+        started_stages = []
+        try:
+            for stage in self.stages:
+                if not stage.streaming or not self._should_run(stage, ctx):
+                    continue
+                started_stages.append(stage)
+                was_done = ctx.done
+                started = time.perf_counter()
+                try:
+                    if isinstance(stage, ProviderStage):
+                        yield from stage.stream(ctx)
+                        continue
+                    stage.run(ctx)
+                finally:
+                    self._record(ctx, stage, started)
+
+                # Replay short-circuited responses in the same chunked format
+                if ctx.done and not was_done:
+                    yield from chunk_text(ctx.response)
+        finally:
+            for stage in reversed(started_stages):
+                stage.finish(ctx)
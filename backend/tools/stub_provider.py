@@ -0,0 +1,390 @@
+"""
+Local deterministic stand-in for the Gemini and OpenAI-compatible APIs
+
+Implements just the endpoints our providers use, so ProviderManager and
+AIService can be load-tested without spending real quota:
+
+    POST /v1beta/models/<model>:generateContent
+    POST /v1beta/models/<model>:streamGenerateContent   (JSON array or ?alt=sse)
+    POST /v1/chat/completions                           (OpenAI, optional stream)
+    POST /chat/completions                              (DeepSeek-style base URL)
+    GET  /__stats                                       (request/token counters)
+    POST /__reset
+
+Point the app at it with:
+    GEMINI_BASE_URL=http://127.0.0.1:8001
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8001
+
+Usage:
+    python -m tools.stub_provider --port 8001 --latency lognormal:250:0.5 \\
+        --tokens-per-second 80 --error-rate 0.02 --rpm-limit 15
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WORDS = (
+    "the current flows through each resistor so the total voltage drop equals "
+    "the sum of individual drops energy is conserved in every closed loop "
+    "consider a simple example where two components share the same node "
+    "**key idea** the derivative measures rate of change while the integral "
+    "accumulates area under the curve - practice with small problems first"
+).split()
+
+
+class LatencyModel:
+    """
+    Time-to-first-token distribution, parsed from a spec:
+        fixed:<ms> | uniform:<min_ms>:<max_ms> | lognormal:<median_ms>:<sigma>
+    """
+
+    def __init__(self, spec: str):
+        kind, *args = spec.split(':')
+        self.kind = kind
+        self.args = [float(a) for a in args]
+        if kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Sample a latency in seconds"""
+        if self.kind == 'fixed':
+            ms = self.args[0]
+        elif self.kind == 'uniform':
+            ms = rng.uniform(self.args[0], self.args[1])
+        else:
+            median, sigma = self.args
+            ms = rng.lognormvariate(math.log(median), sigma)
+        return ms / 1000
+
+
+class StubConfig:
+    """Behaviour knobs, read from CLI flags or STUB_* environment variables"""
+
+    def __init__(self, latency: str = 'fixed:200', tokens_per_second: float = 100,
+                 completion_tokens: int = 300, error_rate: float = 0.0,
+                 rpm_limit: int = 0, seed: int = 42):
+        self.latency = LatencyModel(latency)
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rpm_limit = rpm_limit
+        self.seed = seed
+
+
+class StubState:
+    """Shared counters and deterministic randomness across handler threads"""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.rng = random.Random(self.config.seed)
+            self.calls = {}  # api key -> deque of timestamps (rolling minute)
+            self.counters = {
+                'requests': 0,
+                'streamed': 0,
+                'errors_injected': 0,
+                'rate_limited': 0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+            }
+
+    def admit(self, api_key: str):
+        """
+        Decide the fate of a request: returns (error, latency_seconds).
+        error is None, 'rate_limited' or 'injected'.
+        """
+        now = time.time()
+        with self.lock:
+            self.counters['requests'] += 1
+            latency = self.config.latency.sample(self.rng)
+            roll = self.rng.random()
+
+            if self.config.rpm_limit:
+                calls = self.calls.setdefault(api_key, deque())
+                while calls and calls[0] <= now - 60:
+                    calls.popleft()
+                if len(calls) >= self.config.rpm_limit:
+                    self.counters['rate_limited'] += 1
+                    return 'rate_limited', 0.0
+                calls.append(now)
+
+            if roll < self.config.error_rate:
+                self.counters['errors_injected'] += 1
+                return 'injected', 0.0
+
+        return None, latency
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int, streamed: bool):
+        with self.lock:
+            self.counters['prompt_tokens'] += prompt_tokens
+            self.counters['completion_tokens'] += completion_tokens
+            if streamed:
+                self.counters['streamed'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def count_tokens(text: str) -> int:
+    """Same rough estimate the app uses (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def completion_words(prompt: str, max_tokens: int, config: StubConfig):
+    """Deterministic completion for a prompt: same prompt, same answer"""
+    seed = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    n = max(1, min(max_tokens or config.completion_tokens, config.completion_tokens))
+    return [rng.choice(WORDS) + ' ' for _ in range(n)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'StubProvider/1.0'
+
+    # Keep the load generator's terminal quiet
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, status: int, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data: str):
+        raw = data.encode()
+        self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/__stats':
+            return self._send_json(200, self.state.snapshot())
+        self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        path = url.path
+        if path == '/__reset':
+            self.state.reset()
+            return self._send_json(200, {'status': 'reset'})
+
+        body = self._read_json()
+        gemini = re.match(r'^/v1(?:beta)?/models/([^/:]+):(generateContent|streamGenerateContent)$', path)
+        if gemini:
+            api_key = parse_qs(url.query).get('key', [''])[0] or self.headers.get('x-goog-api-key', '')
+            sse = parse_qs(url.query).get('alt', [''])[0] == 'sse'
+            return self._gemini(body, api_key, gemini.group(2) == 'streamGenerateContent', sse)
+        if path in ('/v1/chat/completions', '/chat/completions'):
+            api_key = self.headers.get('Authorization', '').replace('Bearer ', '')
+            return self._openai(body, api_key)
+
+        self._send_json(404, {'error': {'code': 404, 'message': f'Unknown path {path}'}})
+
+    # ---- Gemini -------------------------------------------------------
+
+    def _gemini(self, body, api_key: str, stream: bool, sse: bool):
+        error, latency = self.state.admit(api_key)
+        if error:
+            return self._send_json(429, {'error': {
+                'code': 429,
+                'message': 'Resource has been exhausted (e.g. check quota).',
+                'status': 'RESOURCE_EXHAUSTED'
+            }})
+
+        prompt = ''.join(
+            part.get('text', '')
+            for content in body.get('contents', [])
+            for part in content.get('parts', [])
+        )
+        max_tokens = body.get('generationConfig', {}).get('maxOutputTokens')
+        words = completion_words(prompt, max_tokens, self.state.config)
+        prompt_tokens = count_tokens(prompt)
+        time.sleep(latency)
+
+        def payload(text, done, emitted):
+            candidate = {
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'index': 0,
+                'tokenCount': emitted,
+            }
+            if done:
+                candidate['finishReason'] = 'STOP'
+            return {
+                'candidates': [candidate],
+                'usageMetadata': {
+                    'promptTokenCount': prompt_tokens,
+                    'candidatesTokenCount': emitted,
+                    'totalTokenCount': prompt_tokens + emitted,
+                }
+            }
+
+        if not stream:
+            time.sleep(len(words) / self.state.config.tokens_per_second)
+            self.state.record_usage(prompt_tokens, len(words), streamed=False)
+            return self._send_json(200, payload(''.join(words), True, len(words)))
+
+        self._start_chunked('text/event-stream' if sse else 'application/json')
+        if not sse:
+            self._write_chunk('[')
+        for i, group in enumerate(self._paced(words, 8)):
+            emitted = min(len(words), (i + 1) * 8)
+            message = json.dumps(payload(group, emitted == len(words), emitted))
+            if sse:
+                self._write_chunk(f"data: {message}\r\n\r\n")
+            else:
+                self._write_chunk((',' if i else '') + message)
+        if not sse:
+            self._write_chunk(']')
+        self._end_chunked()
+        self.state.record_usage(prompt_tokens, len(words), streamed=True)
+
+    # ---- OpenAI-compatible ---------------------------------------------
+
+    def _openai(self, body, api_key: str):
+        error, latency = self.state.admit(api_key)
+        if error:
+            return self._send_json(429, {'error': {
+                'message': 'Rate limit reached: You exceeded your current quota.',
+                'type': 'insufficient_quota',
+                'code': 'rate_limit_exceeded'
+            }})
+
+        prompt = ''.join(m.get('content', '') for m in body.get('messages', []))
+        words = completion_words(prompt, body.get('max_tokens'), self.state.config)
+        prompt_tokens = count_tokens(prompt)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(words),
+            'total_tokens': prompt_tokens + len(words),
+        }
+        model = body.get('model', 'stub')
+        created = int(time.time())
+        time.sleep(latency)
+
+        if not body.get('stream'):
+            time.sleep(len(words) / self.state.config.tokens_per_second)
+            self.state.record_usage(prompt_tokens, len(words), streamed=False)
+            return self._send_json(200, {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(words)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+
+        def chunk(choices, extra=None):
+            data = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': choices,
+            }
+            data.update(extra or {})
+            return f"data: {json.dumps(data)}\n\n"
+
+        self._start_chunked('text/event-stream')
+        for group in self._paced(words, 4):
+            self._write_chunk(chunk([{'index': 0, 'delta': {'content': group}, 'finish_reason': None}]))
+        self._write_chunk(chunk([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+        if body.get('stream_options', {}).get('include_usage'):
+            self._write_chunk(chunk([], {'usage': usage}))
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_chunked()
+        self.state.record_usage(prompt_tokens, len(words), streamed=True)
+
+    def _paced(self, words, group_size: int):
+        """Yield groups of words at the configured token rate"""
+        interval = group_size / self.state.config.tokens_per_second
+        for start in range(0, len(words), group_size):
+            if start:
+                time.sleep(interval)
+            yield ''.join(words[start:start + group_size])
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8001, config: StubConfig = None):
+    """Create (but don't start) a stub server - handy for in-process benchmarks"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(config or StubConfig())
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stub for Gemini/OpenAI-compatible APIs')
+    parser.add_argument('--host', default=os.getenv('STUB_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('STUB_PORT', 8001)))
+    parser.add_argument('--latency', default=os.getenv('STUB_LATENCY', 'fixed:200'),
+                        help='fixed:<ms> | uniform:<min>:<max> | lognormal:<median_ms>:<sigma>')
+    parser.add_argument('--tokens-per-second', type=float,
+                        default=float(os.getenv('STUB_TOKENS_PER_SECOND', 100)))
+    parser.add_argument('--completion-tokens', type=int,
+                        default=int(os.getenv('STUB_COMPLETION_TOKENS', 300)))
+    parser.add_argument('--error-rate', type=float, default=float(os.getenv('STUB_ERROR_RATE', 0)),
+                        help='Fraction of requests answered with a 429 quota error')
+    parser.add_argument('--rpm-limit', type=int, default=int(os.getenv('STUB_RPM_LIMIT', 0)),
+                        help='Requests per rolling minute per API key before 429s (0 = unlimited)')
+    parser.add_argument('--seed', type=int, default=int(os.getenv('STUB_SEED', 42)))
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rpm_limit=args.rpm_limit,
+        seed=args.seed,
+    )
+    server = create_server(args.host, args.port, config)
+    print(f"🧪 Stub provider listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,15 @@ Avoids repeated API calls for same prompts
 import json
 import hashlib
 import os
+import threading
 import time
 from pathlib import Path
 from functools import wraps
 from typing import Optional, Any, Dict
+from utils.log import get_logger, sample
+from utils.tracing import span
+
+logger = get_logger('cache')
 
 class ResponseCache:
     """File-based cache for AI responses"""
@@ -36,17 +41,20 @@ class ResponseCache:
             return None
         
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with span('cache.read'):
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
             
             # Check if expired
             if time.time() > data.get('expires_at', 0):
-                cache_file.unlink()  # Delete expired cache
+                cache_file.unlink(missing_ok=True)  # Delete expired cache (another thread may beat us to it)
                 return None
             
             return data.get('response')
+        except FileNotFoundError:  # expired and removed by another thread
+            return None
         except Exception as e:
-            print(f"⚠️ Cache read error: {e}")
+            logger.warning("Cache read error: %s", e)
             return None
     
     def set(self, prompt: str, response: Any, metadata: Dict = None, ttl: int = None):
@@ -63,11 +71,17 @@ class ResponseCache:
             'expires_at': time.time() + ttl
         }
         
+        # Write to a private temp file and rename it into place, so a
+        # concurrent get() sees the old file or the new one, never half of it
+        tmp_file = cache_file.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with span('cache.write'):
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, cache_file)
         except Exception as e:
-            print(f"⚠️ Cache write error: {e}")
+            logger.warning("Cache write error: %s", e)
+            tmp_file.unlink(missing_ok=True)
     
     def clear_expired(self):
         """Clean up expired cache files"""
@@ -125,11 +139,11 @@ def cached_response(ttl: int = 3600):
             # Try to get from cache
             cached = cache.get(prompt, metadata)
             if cached:
-                print(f"✅ Cache HIT: {prompt[:50]}...")
+                logger.debug("Cache HIT: %.50s", prompt, extra=sample(0.01))
                 return cached
             
             # Call function and cache result
-            print(f"🔍 Cache MISS: Calling AI API...")
+            logger.debug("Cache MISS: calling AI API", extra=sample(0.01))
             result = func(prompt, *args, **kwargs)
             
             if result:
@@ -0,0 +1,139 @@
+"""
+Negotiated response compression (brotli / gzip) with a size threshold
+
+    COMPRESS_MIN_BYTES=1024   COMPRESS_CACHE_MB=16   COMPRESSION=0 (off)
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask import request
+
+from utils.counters import ShardedStats
+from utils.metrics import HTTP_RESPONSE_BYTES
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE = ('application/json', 'text/html', 'text/plain', 'text/markdown', 'text/css',
+                'application/javascript')
+# Dynamic responses: past these levels, CPU per request roughly doubles for
+# a few percent smaller bodies (benchmarks/payload_bench.py)
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+ENCODERS = {'gzip': _gzip}
+if brotli is not None:
+    ENCODERS['br'] = _brotli
+
+
+class CompressedCache:
+    """LRU of compressed bodies by (digest of body, encoding), bounded in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = ShardedStats('hits', 'misses')
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        self.stats.inc('misses' if body is None else 'hits')
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def put(self, key, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class Compressor:
+    """Compresses eligible responses in an after_request hook"""
+
+    def __init__(self, min_bytes: int = 1024, cache_bytes: int = 16 * 2 ** 20, enabled: bool = True):
+        self.min_bytes = min_bytes
+        self.enabled = enabled
+        self.cache = CompressedCache(cache_bytes)
+
+    def init_app(self, app):
+        if self.enabled:
+            app.after_request(self.compress_response)
+
+    def choose_encoding(self) -> Optional[str]:
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in ENCODERS and accepted[encoding]:
+                return encoding
+        return None
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        key = (hashlib.blake2b(data, digest_size=16).digest(), encoding)
+        body = self.cache.get(key)
+        if body is None:
+            body = ENCODERS[encoding](data)
+            self.cache.put(key, body)
+        return body
+
+    def compress_response(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        encoding = self.choose_encoding() if len(data) >= self.min_bytes else None
+        HTTP_RESPONSE_BYTES.labels('raw', encoding or 'identity').inc(len(data))
+        if encoding is None:
+            HTTP_RESPONSE_BYTES.labels('sent', 'identity').inc(len(data))
+            return response
+
+        body = self.compress(data, encoding)
+        HTTP_RESPONSE_BYTES.labels('sent', encoding).inc(len(body))
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # The bytes differ per encoding; If-None-Match still matches weak tags
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def get_stats(self) -> dict:
+        return {**self.cache.stats.snapshot(), 'cached_bytes': self.cache.size, 'encodings': sorted(ENCODERS)}
+
+
+compressor = Compressor(
+    min_bytes=int(os.getenv('COMPRESS_MIN_BYTES', 1024)),
+    cache_bytes=int(float(os.getenv('COMPRESS_CACHE_MB', 16)) * 2 ** 20),
+    enabled=os.getenv('COMPRESSION', '1') != '0',
+)
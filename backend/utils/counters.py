@@ -0,0 +1,75 @@
+"""
+Per-thread sharded counters for hot-path statistics
+
+Service, provider, pipeline and cache statistics are bumped on every
+request from many threads. `d[k] += 1` on a shared dict loses updates
+under threaded serving, and one lock around it makes every request queue
+on it. Instead, each thread adds to its own shard (a dict only that
+thread writes), and reads sum the shards:
+
+    stats = ShardedStats('hits', 'misses')
+    stats.inc('hits')
+    stats.snapshot()  # {'hits': 1, 'misses': 0}
+
+Updates never take a lock and are never lost; a read taken while other
+threads are counting may miss their in-flight updates, like any
+unsynchronized snapshot. Shards of exited threads are folded into a
+retired total on the next read, so short-lived threads don't accumulate.
+Values can go down (dec) as well as up, so the same class serves gauges.
+"""
+import threading
+from typing import Dict
+
+
+class ShardedStats:
+    """A fixed set of named counters/gauges, sharded per thread"""
+
+    __slots__ = ('names', '_local', '_lock', '_shards', '_retired')
+
+    def __init__(self, *names: str):
+        self.names = names
+        self._local = threading.local()
+        self._lock = threading.Lock()  # shard registration and reads, never updates
+        self._shards = []  # [(thread, shard)]
+        self._retired = dict.fromkeys(names, 0)
+
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            # Every key exists up front, so readers never see the dict resize
+            shard = self._local.shard = dict.fromkeys(self.names, 0)
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def inc(self, name: str, amount=1):
+        self._shard()[name] += amount
+
+    def dec(self, name: str, amount=1):
+        self._shard()[name] -= amount
+
+    def add(self, amounts: Dict):
+        """Add several counters at once"""
+        shard = self._shard()
+        for name, amount in amounts.items():
+            shard[name] += amount
+
+    def snapshot(self) -> Dict:
+        """Current totals across all threads"""
+        with self._lock:
+            totals = dict(self._retired)
+            live = []
+            for thread, shard in self._shards:
+                for name, value in shard.items():
+                    totals[name] += value
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:  # exited threads never write again
+                    for name, value in shard.items():
+                        self._retired[name] += value
+            self._shards = live
+        return totals
+
+    def __getitem__(self, name: str):
+        return self.snapshot()[name]
@@ -0,0 +1,70 @@
+"""
+Conditional GET (ETag / If-None-Match) and Cache-Control for read endpoints
+
+Per-user responses are validated against the user's change version
+(user_stats.version, advanced by every history/plan change), so a poll
+that changed nothing is answered 304 from one primary-key lookup of two
+columns - no ORM objects loaded, nothing serialized:
+
+    @user_bp.route('/user/<int:user_id>/stats', methods=['GET'])
+    @per_user
+    def get_user_stats(user_id): ...
+
+Static responses (the topics catalog) are tagged with a hash of their
+content and marked immutable.
+"""
+import hashlib
+import json
+from functools import wraps
+from typing import Optional
+
+from flask import Response, make_response, request
+
+from models.database import db, User, UserStats
+
+# Clients may keep per-user responses but must revalidate them on each use
+PRIVATE = 'private, no-cache'
+# Changes only with a deploy
+IMMUTABLE = 'public, max-age=604800, immutable'
+
+
+def etag(*parts) -> str:
+    return hashlib.sha256('|'.join(map(str, parts)).encode('utf-8')).hexdigest()[:32]
+
+
+def content_etag(payload) -> str:
+    return etag(json.dumps(payload, sort_keys=True, separators=(',', ':')))
+
+
+def tag(response: Response, value: str, cache_control: str) -> Response:
+    response.set_etag(value)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified(value: str, cache_control: str) -> Optional[Response]:
+    """A 304 if the client's If-None-Match already holds `value`, else None"""
+    if request.if_none_match.contains_weak(value):
+        return tag(Response(status=304), value, cache_control)
+    return None
+
+
+def per_user(view):
+    """Tag a user_id view with an ETag derived from the user's change version"""
+    @wraps(view)
+    def wrapper(user_id, **kwargs):
+        row = db.session.query(UserStats.version, User.created_at) \
+            .join(User, User.id == UserStats.user_id) \
+            .filter(UserStats.user_id == user_id).first()
+        if row is None:  # unknown user, or stats not built yet - nothing to validate against
+            return view(user_id, **kwargs)
+        # created_at: a reused id is a different user even at the same version
+        value = etag(request.endpoint, user_id, row.version, row.created_at, request.query_string.decode())
+        cached = not_modified(value, PRIVATE)
+        if cached is not None:
+            return cached
+        response = make_response(view(user_id, **kwargs))
+        if response.status_code == 200:
+            tag(response, value, PRIVATE)
+        return response
+    return wrapper
@@ -0,0 +1,40 @@
+"""
+Faster JSON for Flask responses
+
+jsonify() goes through the stdlib encoder, which spends most of a history
+page's serialization time escaping 50 markdown bodies. With orjson
+installed, responses are encoded by it instead (several times faster,
+straight to UTF-8 bytes); without it Flask's default provider is used
+unchanged. Output differs only in key order (insertion order instead of
+sorted) and whitespace. Objects orjson doesn't handle natively - and
+datetimes, which Flask renders as HTTP dates - go through Flask's default().
+
+    app.json = FastJSONProvider(app)
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider that encodes with orjson when it is installed"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=OPTIONS).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        option = OPTIONS | orjson.OPT_INDENT_2 if pretty else OPTIONS
+        return self._app.response_class(orjson.dumps(obj, default=self.default, option=option),
+                                        mimetype=self.mimetype)
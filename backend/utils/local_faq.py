@@ -3,6 +3,7 @@ Local FAQ handler - answers common questions without API calls
 Ultra-fast, free, unlimited usage
 """
 import re
+import threading
 from typing import Optional, Dict, List
 
 class LocalFAQHandler:
@@ -89,11 +90,12 @@ Think of a car factory (class) that produces cars (objects). Each car has proper
         
         # Build keyword index
         self.keyword_index = self._build_keyword_index()
+        self._write_lock = threading.Lock()
     
-    def _build_keyword_index(self) -> Dict[str, List[str]]:
+    def _build_keyword_index(self, faqs: Dict = None) -> Dict[str, List[str]]:
         """Build index of keywords to FAQ keys"""
         index = {}
-        for faq_key, faq_data in self.faqs.items():
+        for faq_key, faq_data in (self.faqs if faqs is None else faqs).items():
             for keyword in faq_data['keywords']:
                 if keyword not in index:
                     index[keyword] = []
@@ -153,13 +155,20 @@ Think of a car factory (class) that produces cars (objects). Each car has proper
         return None
     
     def add_faq(self, key: str, answer: str, keywords: List[str]):
-        """Add new FAQ to database"""
-        self.faqs[key] = {
-            'answer': answer,
-            'keywords': keywords
-        }
-        # Rebuild index
-        self.keyword_index = self._build_keyword_index()
+        """
+        Add new FAQ to database.
+        Copy-on-write: request threads may be iterating the current dicts,
+        so new ones are built and swapped in rather than mutated.
+        """
+        with self._write_lock:
+            faqs = dict(self.faqs)
+            faqs[key] = {
+                'answer': answer,
+                'keywords': keywords
+            }
+            # Rebuild index
+            index = self._build_keyword_index(faqs)
+            self.faqs, self.keyword_index = faqs, index
     
     def stats(self) -> Dict:
         """Get FAQ statistics"""
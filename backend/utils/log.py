@@ -0,0 +1,168 @@
+"""
+Structured, non-blocking logging
+
+Records are put on a bounded in-memory queue by the request thread and
+written to stdout by a background listener, so logging never blocks on
+I/O. When the queue is full, records are dropped (and counted) instead of
+stalling requests.
+
+- Levels via LOG_LEVEL (default INFO); disabled levels cost one int compare
+- LOG_FORMAT=json (default) or text
+- Every record carries the current request id (X-Request-ID or generated)
+- High-frequency events can be sampled: logger.debug(..., extra=sample(0.01))
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+ROOT_LOGGER = 'study_helper'
+
+_request_id: ContextVar[str] = ContextVar('request_id', default='-')
+
+# Attributes every LogRecord has - anything else came in via `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app's root logger, e.g. get_logger('cache')"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def sample(rate: float) -> Dict:
+    """`extra` for a log call that should only be emitted for a fraction of events"""
+    return {'sample_rate': rate}
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+class ContextFilter(logging.Filter):
+    """Attach the request id and apply per-record sampling"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, 'sample_rate', None)
+        if rate is not None and random.random() >= rate:
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and key not in entry and key not in ('sample_rate',):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records rather than block when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_state = {'pid': None, 'listener': None, 'handler': None}
+
+
+def configure_logging(level: str = None, fmt: str = None, queue_size: int = None):
+    """
+    Install the queue-based handler on the app's root logger.
+    Safe to call again in a forked worker: the listener thread is restarted.
+    """
+    if _state['pid'] == os.getpid():
+        return
+
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    queue_size = queue_size or int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    if _state['handler'] is not None:
+        root.removeHandler(_state['handler'])
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    listener.start()
+    if _state['pid'] is None:
+        atexit.register(_stop_listener)
+
+    _state.update(pid=os.getpid(), listener=listener, handler=handler)
+
+
+def _stop_listener():
+    # Flush whatever is still queued before the process exits
+    listener = _state['listener']
+    if listener is not None and _state['pid'] == os.getpid():
+        listener.stop()
+
+
+def dropped_records() -> int:
+    handler = _state['handler']
+    return handler.dropped if handler else 0
+
+
+def init_app(app):
+    """Assign a request id to every request and echo it in X-Request-ID"""
+    from flask import g, request
+
+    configure_logging()
+
+    @app.before_request
+    def _assign_request_id():
+        configure_logging()  # no-op unless we're in a freshly forked worker
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+        g._request_id_token = _request_id.set(request_id)
+
+    @app.after_request
+    def _echo_request_id(response):
+        response.headers['X-Request-ID'] = _request_id.get()
+        return response
+
+    @app.teardown_request
+    def _clear_request_id(exc=None):
+        token = g.pop('_request_id_token', None)
+        if token is not None:
+            try:
+                _request_id.reset(token)
+            except ValueError:
+                _request_id.set('-')
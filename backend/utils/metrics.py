@@ -0,0 +1,392 @@
+"""
+Low-overhead metrics (counters, gauges, histograms) with a Prometheus
+text-format /metrics endpoint
+
+Under gunicorn each worker has its own registry. When METRICS_DIR is set
+(gunicorn.conf.py defaults it to a per-instance directory), every worker
+periodically writes a snapshot to <METRICS_DIR>/<pid>.json and /metrics
+merges all snapshots, so totals are correct no matter which worker
+answers the scrape. Counters and histograms from exited workers are
+kept (they are totals); gauges are only taken from live snapshots.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Child:
+    """Value for one combination of label values"""
+
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', '_bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class Metric:
+    """Base metric: a family of children keyed by label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _Child()
+
+    def labels(self, *values):
+        """Get the child for these label values (positional, in labelnames order)"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def snapshot(self) -> Dict:
+        return {
+            'type': self.kind,
+            'help': self.help,
+            'labelnames': list(self.labelnames),
+            'samples': [[list(key), child.snapshot()] for key, child in list(self._children.items())],
+        }
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def snapshot(self) -> Dict:
+        data = super().snapshot()
+        data['buckets'] = list(self.buckets)
+        return data
+
+
+class MetricsRegistry:
+    """Holds all metrics of this process and merges snapshots across workers"""
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: float = 2.0):
+        self.metrics: Dict[str, Metric] = {}
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self) -> Dict:
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+    # ---- Multi-process support ----------------------------------------
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.multiproc_dir, f"{pid}.json")
+
+    def flush(self):
+        """Write this process's snapshot for other workers to merge"""
+        if not self.multiproc_dir:
+            return
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'written_at': time.time(), 'metrics': self.snapshot()}, f)
+        os.replace(tmp_path, path)
+
+    def start_flusher(self):
+        """Start the background snapshot writer once per process (safe after fork)"""
+        if not self.multiproc_dir or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+
+            def run():
+                while True:
+                    time.sleep(self.flush_interval)
+                    try:
+                        self.flush()
+                    except OSError:
+                        pass
+
+            threading.Thread(target=run, name='metrics-flusher', daemon=True).start()
+            atexit.register(self.flush)
+
+    def collect(self) -> Dict:
+        """Merged view over all worker snapshots (or just this process)"""
+        if not self.multiproc_dir:
+            return self.snapshot()
+
+        self.flush()
+        merged: Dict[str, Dict] = {}
+        stale_after = self.flush_interval * 3
+        now = time.time()
+        for filename in os.listdir(self.multiproc_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            live = now - data.get('written_at', 0) <= stale_after
+            for name, metric in data['metrics'].items():
+                if metric['type'] == 'gauge' and not live:
+                    continue
+                _merge_metric(merged, name, metric)
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            labelnames = metric['labelnames']
+            for label_values, value in metric['samples']:
+                labels = list(zip(labelnames, label_values))
+                if metric['type'] == 'histogram':
+                    cumulative = 0
+                    bounds = [str(b) for b in metric['buckets']] + ['+Inf']
+                    for bound, count in zip(bounds, value['counts']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _merge_metric(merged: Dict, name: str, metric: Dict):
+    target = merged.get(name)
+    if target is None:
+        merged[name] = {**metric, 'samples': [[labels, _copy(value)] for labels, value in metric['samples']]}
+        return
+
+    index = {tuple(labels): value for labels, value in target['samples']}
+    for labels, value in metric['samples']:
+        existing = index.get(tuple(labels))
+        if existing is None:
+            copied = _copy(value)
+            target['samples'].append([labels, copied])
+            index[tuple(labels)] = copied
+        elif isinstance(existing, dict):
+            existing['counts'] = [a + b for a, b in zip(existing['counts'], value['counts'])]
+            existing['sum'] += value['sum']
+            existing['count'] += value['count']
+        else:
+            for sample in target['samples']:
+                if tuple(sample[0]) == tuple(labels):
+                    sample[1] += value
+                    break
+
+
+def _copy(value):
+    return {**value, 'counts': list(value['counts'])} if isinstance(value, dict) else value
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+# Global registry
+registry = MetricsRegistry(
+    multiproc_dir=os.getenv('METRICS_DIR') or None,
+    flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', 2.0))
+)
+
+# ---- Application metrics ---------------------------------------------------
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by endpoint',
+    ('endpoint', 'method', 'status'))
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    'http_requests_in_flight', 'Requests currently being handled')
+HTTP_RESPONSE_BYTES = registry.counter(
+    'http_response_bytes_total', 'Compressible response bytes before compression and as sent',
+    ('stage', 'encoding'))
+
+AI_ANSWERS = registry.counter(
+    'ai_answers_total', 'AI answers by endpoint and the layer that produced them',
+    ('endpoint', 'source'))
+PIPELINE_STAGE_DURATION = registry.histogram(
+    'pipeline_stage_duration_seconds', 'Time spent in each pipeline stage',
+    ('endpoint', 'stage'))
+COALESCE_WAITERS = registry.gauge(
+    'coalesce_waiters', 'Requests waiting on an identical in-flight provider call')
+
+PROVIDER_REQUEST_DURATION = registry.histogram(
+    'provider_request_duration_seconds', 'Provider call latency', ('provider',))
+PROVIDER_ERRORS = registry.counter(
+    'provider_errors_total', 'Provider call failures', ('provider', 'kind'))
+PROVIDER_TOKENS = registry.counter(
+    'provider_tokens_total', 'Tokens consumed per provider', ('provider', 'type'))
+RATE_LIMITER_SKIPS = registry.counter(
+    'rate_limiter_skips_total', 'Providers skipped for rate/token budget or failures', ('provider',))
+RATE_LIMITER_WAIT = registry.histogram(
+    'rate_limiter_wait_seconds',
+    'Time lost before the successful provider call to rate-limit skips and failed attempts')
+
+DB_QUERY_DURATION = registry.histogram(
+    'db_query_duration_seconds', 'Database statement latency', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['_metrics_started'].pop()
+    operation = statement.lstrip().split(' ', 1)[0].upper()
+    DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+
+def _on_error(exception_context):
+    # Failed statements never reach after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('_metrics_started'):
+        conn.info['_metrics_started'].pop()
+
+
+def init_app(app):
+    """Instrument a Flask app and SQLAlchemy statements, and add /metrics"""
+    from flask import Response, g, request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    @app.before_request
+    def _start_timer():
+        registry.start_flusher()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        g._metrics_started = time.perf_counter()
+
+    @app.teardown_request
+    def _stop_timer(exc=None):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        status = 500 if exc else getattr(g, '_metrics_status', 200)
+        HTTP_REQUEST_DURATION.labels(
+            request.url_rule.rule if request.url_rule else 'unmatched', request.method, status
+        ).observe(time.perf_counter() - started)
+
+    @app.after_request
+    def _capture_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+        event.listen(Engine, 'handle_error', _on_error)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
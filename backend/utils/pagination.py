@@ -0,0 +1,101 @@
+"""
+Keyset (cursor) pagination and field projection for list endpoints
+
+Pages are ordered newest first on (created_at, id). The cursor is the
+(created_at, id) of the last row of the previous page, so every page is
+an index range scan of `limit` rows - page 1000 costs the same as page 1.
+
+    GET /api/user/1/history?limit=20
+    → {"history": [...], "next_cursor": "WyIyMDI2LTA..."}
+    GET /api/user/1/history?limit=20&cursor=WyIyMDI2LTA...&fields=id,subject,question,created_at
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import lazyload, load_only
+
+from models.database import ContentBody, content_fields
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    """Bad cursor, limit or field list - reported to the client as a 400"""
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_limit(value: Optional[int]) -> int:
+    if value is None:
+        return DEFAULT_LIMIT
+    if value < 1:
+        raise PaginationError('limit must be positive')
+    return min(value, MAX_LIMIT)
+
+
+def parse_fields(value: Optional[str], allowed: List[str]) -> Optional[List[str]]:
+    """Requested fields in allowed order, or None for the full object"""
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    # id and created_at are needed for the cursor anyway
+    requested |= {'id', 'created_at'}
+    return [name for name in allowed if name in requested]
+
+
+def paginate(query, model, cursor: Optional[str], limit: int, fields: Optional[List[str]] = None):
+    """Return (rows, next_cursor) for one newest-first page of `query`"""
+    if fields:
+        query = query.options(*_load_options(model, fields))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < (created_at, row_id))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def _load_options(model, fields: List[str]) -> list:
+    """Load only the requested columns; skip the contents join for unrequested bodies"""
+    columns = []
+    for name in fields:
+        attr = getattr(model, name)
+        columns.append(getattr(model, attr.column) if isinstance(attr, ContentBody) else attr)
+    options = [load_only(*columns)]
+    for name, body in content_fields(model).items():
+        if name not in fields:
+            options.append(lazyload(getattr(model, body.relationship)))
+    return options
+
+
+def project(row, fields: List[str]) -> dict:
+    """Serialize only the requested columns"""
+    data = {}
+    for name in fields:
+        value = getattr(row, name)
+        data[name] = value.isoformat() if isinstance(value, datetime) else value
+    return data
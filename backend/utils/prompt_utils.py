@@ -88,6 +88,25 @@ Format:
 - Time: 6-8h
 
 Add tips and metrics."""
+    
+    @staticmethod
+    def create_explain_prompt(concept: str, level: str = 'intermediate') -> str:
+        """Compact concept explanation prompt"""
+        level_desc = {
+            'beginner': 'very simple terms for beginners',
+            'intermediate': 'clear technical terms',
+            'advanced': 'advanced technical detail'
+        }
+        
+        return f"""Explain {concept} in {level_desc.get(level, 'simple terms')}.
+
+Use markdown:
+- **Bold** for key terms
+- Bullet points for lists
+- Real examples
+- 1 emoji at end
+
+Keep concise (max 150 words)."""
 
 
 class TokenEstimator:
@@ -1,120 +1,240 @@
 """
 Multi-provider AI service with intelligent fallback and rate limiting
+
+Provider SDKs (google.generativeai, openai) take over a second to import,
+so they are imported on a provider's first call rather than at startup.
 """
 import time
 import os
-from typing import Optional, Dict, List, Callable, Any
+import threading
+from collections import deque
+from typing import Optional, Dict, List, Callable, Any, Iterator
 from datetime import datetime
-import google.generativeai as genai
-from openai import OpenAI
+from utils.counters import ShardedStats
+from utils.prompt_utils import TokenEstimator
+from utils.metrics import (
+    PROVIDER_ERRORS, PROVIDER_REQUEST_DURATION, PROVIDER_TOKENS,
+    RATE_LIMITER_SKIPS, RATE_LIMITER_WAIT
+)
+from utils.log import get_logger, sample
+from utils.tracing import span
+
+logger = get_logger('providers')
 
 class RateLimiter:
-    """Track and enforce rate limits per provider"""
+    """
+    Track and enforce rolling per-minute request and token budgets per provider.
+    Safe to share between request threads: checks and bookings happen under
+    one lock, and reserve() does both at once so concurrent requests can't
+    all pass the check before any of them is booked.
+    """
+    
+    WINDOW = 60  # seconds
     
     def __init__(self):
-        self.counters = {}  # {provider_key: {'count': 0, 'reset_at': timestamp}}
+        self.counters = {}  # {provider_key: deque of [timestamp, tokens]}
+        self._lock = threading.Lock()
     
-    def can_call(self, provider_key: str, limit_per_minute: int) -> bool:
-        """Check if we can make a call within rate limit"""
-        now = time.time()
-        current_minute = int(now / 60)
-        
-        if provider_key not in self.counters:
-            self.counters[provider_key] = {
-                'count': 0,
-                'minute': current_minute
-            }
-        
-        counter = self.counters[provider_key]
-        
-        # Reset counter if new minute
-        if counter['minute'] != current_minute:
-            counter['count'] = 0
-            counter['minute'] = current_minute
-        
-        # Check limit
-        return counter['count'] < limit_per_minute
+    def _window(self, provider_key: str, now: float) -> deque:
+        """Get the provider's call log with entries older than the window dropped (lock held)"""
+        calls = self.counters.get(provider_key)
+        if calls is None:
+            calls = self.counters[provider_key] = deque()
+        cutoff = now - self.WINDOW
+        while calls and calls[0][0] <= cutoff:
+            calls.popleft()
+        return calls
     
-    def record_call(self, provider_key: str):
-        """Record a successful API call"""
-        now = time.time()
-        current_minute = int(now / 60)
-        
-        if provider_key not in self.counters:
-            self.counters[provider_key] = {
-                'count': 0,
-                'minute': current_minute
+    def _fits(self, calls: deque, limit_per_minute: int, tokens: int,
+              tokens_per_minute: Optional[int]) -> bool:
+        if len(calls) >= limit_per_minute:
+            return False
+        if tokens_per_minute is not None:
+            used = sum(spent for _, spent in calls)
+            if used + tokens > tokens_per_minute:
+                return False
+        return True
+    
+    def can_call(self, provider_key: str, limit_per_minute: int,
+                 tokens: int = 0, tokens_per_minute: Optional[int] = None) -> bool:
+        """Check if a call of ~tokens fits within the request and token budgets"""
+        with self._lock:
+            calls = self._window(provider_key, time.time())
+            return self._fits(calls, limit_per_minute, tokens, tokens_per_minute)
+    
+    def record_call(self, provider_key: str, tokens: int = 0):
+        """Record a successful API call and the tokens it consumed"""
+        with self._lock:
+            now = time.time()
+            self._window(provider_key, now).append([now, tokens])
+    
+    def reserve(self, provider_key: str, limit_per_minute: int,
+                tokens: int = 0, tokens_per_minute: Optional[int] = None) -> Optional[list]:
+        """
+        Check the budgets and book a call of ~tokens in one step.
+        Returns the booking to settle() or cancel() once the call is done,
+        or None if it doesn't fit.
+        """
+        with self._lock:
+            now = time.time()
+            calls = self._window(provider_key, now)
+            if not self._fits(calls, limit_per_minute, tokens, tokens_per_minute):
+                return None
+            booking = [now, tokens]
+            calls.append(booking)
+            return booking
+    
+    def settle(self, booking: list, tokens: int):
+        """Replace a booking's estimate with the tokens actually spent"""
+        with self._lock:
+            booking[1] = tokens
+    
+    def cancel(self, provider_key: str, booking: list):
+        """Release a booking whose call failed (failed calls don't count against the budget)"""
+        with self._lock:
+            calls = self.counters.get(provider_key, ())
+            for i, entry in enumerate(calls):
+                if entry is booking:
+                    del calls[i]
+                    break
+    
+    def usage(self, provider_key: str) -> Dict:
+        """Get calls and tokens spent in the current window"""
+        with self._lock:
+            calls = self._window(provider_key, time.time())
+            return {
+                'calls_this_minute': len(calls),
+                'tokens_this_minute': sum(spent for _, spent in calls)
             }
-        
-        self.counters[provider_key]['count'] += 1
     
     def get_stats(self) -> Dict:
         """Get rate limit statistics"""
-        now = time.time()
-        current_minute = int(now / 60)
-        
         stats = {}
-        for key, data in self.counters.items():
-            if data['minute'] == current_minute:
-                stats[key] = {
-                    'calls_this_minute': data['count'],
-                    'active': True
-                }
-            else:
-                stats[key] = {
-                    'calls_this_minute': 0,
-                    'active': False
-                }
+        for key in list(self.counters):
+            usage = self.usage(key)
+            usage['active'] = usage['calls_this_minute'] > 0
+            stats[key] = usage
         
         return stats
 
 
+class ProviderResponse:
+    """Provider output with usage metadata for a single call"""
+    
+    def __init__(self, text: str = '', prompt_tokens: int = 0, completion_tokens: int = 0,
+                 latency_ms: float = 0.0, estimated: bool = False):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.latency_ms = latency_ms
+        self.estimated = estimated  # True when the provider didn't report usage
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    def fill_missing_usage(self, prompt: str):
+        """Estimate token counts the provider didn't report"""
+        if not self.prompt_tokens:
+            self.prompt_tokens = TokenEstimator.estimate_tokens(prompt)
+            self.estimated = True
+        if not self.completion_tokens and self.text:
+            self.completion_tokens = TokenEstimator.estimate_tokens(self.text)
+            self.estimated = True
+
+
 class AIProvider:
     """Base class for AI providers"""
     
-    def __init__(self, name: str, api_key: str, rate_limit: int, cost_per_1k: float = 0):
+    def __init__(self, name: str, api_key: str, rate_limit: int, cost_per_1k: float = 0,
+                 tokens_per_minute: Optional[int] = None):
         self.name = name
         self.api_key = api_key
         self.rate_limit = rate_limit
+        self.tokens_per_minute = tokens_per_minute
         self.cost_per_1k = cost_per_1k
+        self.stats = ShardedStats('success_count', 'prompt_tokens', 'completion_tokens',
+                                  'total_tokens', 'total_latency_ms')
+        # Recent failures, decayed by successes. Routing decides on it and the
+        # decay reads it, so unlike the statistics it is updated under a lock
         self.failed_count = 0
-        self.success_count = 0
-        self.total_tokens = 0
+        self._health_lock = threading.Lock()
     
-    def can_use(self, rate_limiter: RateLimiter) -> bool:
-        """Check if provider can be used"""
-        if not self.api_key:
-            return False
-        if self.failed_count >= 5:  # Too many recent failures
-            return False
-        return rate_limiter.can_call(self.name, self.rate_limit)
+    def available(self) -> bool:
+        """Configured and not failing repeatedly"""
+        return bool(self.api_key) and self.failed_count < 5  # Too many recent failures
+    
+    def can_use(self, rate_limiter: RateLimiter, tokens: int = 0) -> bool:
+        """Check if provider can take a call of ~tokens right now"""
+        return self.available() and \
+            rate_limiter.can_call(self.name, self.rate_limit, tokens, self.tokens_per_minute)
+    
+    def reserve(self, rate_limiter: RateLimiter, tokens: int = 0) -> Optional[list]:
+        """Book a call of ~tokens against this provider's budgets; None if it can't be used now"""
+        if not self.available():
+            return None
+        return rate_limiter.reserve(self.name, self.rate_limit, tokens, self.tokens_per_minute)
     
-    def call(self, prompt: str, **kwargs) -> str:
+    def call(self, prompt: str, **kwargs) -> ProviderResponse:
         """Make API call - to be implemented by subclasses"""
         raise NotImplementedError
     
-    def record_success(self, rate_limiter: RateLimiter, tokens: int = 0):
-        """Record successful call"""
-        self.success_count += 1
-        self.total_tokens += tokens
-        self.failed_count = max(0, self.failed_count - 1)  # Reduce failure count
-        rate_limiter.record_call(self.name)
+    def stream(self, prompt: str, result: ProviderResponse, **kwargs) -> Iterator[str]:
+        """
+        Stream response text chunks, filling usage on result when done.
+        Falls back to a single chunk.
+        """
+        response = self.call(prompt, **kwargs)
+        result.prompt_tokens = response.prompt_tokens
+        result.completion_tokens = response.completion_tokens
+        yield response.text
+    
+    def record_success(self, rate_limiter: RateLimiter, response: ProviderResponse,
+                       booking: Optional[list] = None):
+        """Record successful call, settling its booking if it was reserved"""
+        self.stats.add({
+            'success_count': 1,
+            'prompt_tokens': response.prompt_tokens,
+            'completion_tokens': response.completion_tokens,
+            'total_tokens': response.total_tokens,
+            'total_latency_ms': response.latency_ms,
+        })
+        if self.failed_count:
+            with self._health_lock:
+                self.failed_count = max(0, self.failed_count - 1)  # Reduce failure count
+        if booking is None:
+            rate_limiter.record_call(self.name, response.total_tokens)
+        else:
+            rate_limiter.settle(booking, response.total_tokens)
     
     def record_failure(self):
         """Record failed call"""
-        self.failed_count += 1
+        with self._health_lock:
+            self.failed_count += 1
     
     def get_stats(self) -> Dict:
         """Get provider statistics"""
+        stats = self.stats.snapshot()
+        successes = stats['success_count']
         return {
             'name': self.name,
-            'success_count': self.success_count,
+            'success_count': successes,
             'failed_count': self.failed_count,
-            'total_tokens': self.total_tokens,
-            'estimated_cost': (self.total_tokens / 1000) * self.cost_per_1k
+            'prompt_tokens': stats['prompt_tokens'],
+            'completion_tokens': stats['completion_tokens'],
+            'total_tokens': stats['total_tokens'],
+            'tokens_per_minute_limit': self.tokens_per_minute,
+            'avg_latency_ms': round(stats['total_latency_ms'] / successes, 1) if successes else 0,
+            'estimated_cost': (stats['total_tokens'] / 1000) * self.cost_per_1k
         }
 
 
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """Read an optional integer limit from the environment"""
+    value = os.getenv(name, '')
+    return int(value) if value else default
+
+
 class GeminiProvider(AIProvider):
     """Google Gemini provider"""
     
@@ -123,28 +243,134 @@ class GeminiProvider(AIProvider):
         super().__init__(
             name=provider_id,
             api_key=api_key,
-            rate_limit=14,  # Stay under 15/min
-            cost_per_1k=0.0  # Free tier
+            rate_limit=_env_int('GEMINI_REQUESTS_PER_MINUTE', 14),  # Stay under 15/min
+            cost_per_1k=0.0,  # Free tier
+            tokens_per_minute=_env_int('GEMINI_TOKENS_PER_MINUTE', 1000000)
         )
         # Store API key for later use (don't configure globally yet)
         self._api_key = api_key
         self.model = None
     
-    def call(self, prompt: str, **kwargs) -> str:
-        # Configure with this specific key right before calling
-        if self._api_key:
-            genai.configure(api_key=self._api_key)
-            if not self.model:
-                self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
+    def _prepare_model(self):
+        # genai.configure() is process-global and models pick up the default
+        # client lazily, so with several keys and concurrent requests a model
+        # could end up calling with another provider's key. Build each model
+        # once, binding it to a client for this key while the lock is held
+        if self.model is None:
+            with _GEMINI_CONFIGURE_LOCK:
+                if self.model is None:
+                    import google.generativeai as genai
+                    from google.generativeai import client as genai_client
+                    genai.configure(api_key=self._api_key, **_gemini_endpoint())
+                    model = genai.GenerativeModel('gemini-2.0-flash-exp')
+                    model._client = genai_client.get_default_generative_client()
+                    self.model = model
+    
+    def _generation_config(self, kwargs: Dict) -> Dict:
+        return {
+            'temperature': kwargs.get('temperature', 0.7),
+            'max_output_tokens': kwargs.get('max_tokens', 1024),
+        }
+    
+    def call(self, prompt: str, **kwargs) -> ProviderResponse:
+        self._prepare_model()
         response = self.model.generate_content(
             prompt,
-            generation_config={
-                'temperature': kwargs.get('temperature', 0.7),
-                'max_output_tokens': kwargs.get('max_tokens', 1024),
-            }
+            generation_config=self._generation_config(kwargs)
         )
-        return response.text
+        result = ProviderResponse(response.text)
+        _read_gemini_usage(response, result)
+        return result
+    
+    def stream(self, prompt: str, result: ProviderResponse, **kwargs) -> Iterator[str]:
+        self._prepare_model()
+        response = self.model.generate_content(
+            prompt,
+            generation_config=self._generation_config(kwargs),
+            stream=True
+        )
+        for chunk in response:
+            # Usage is cumulative, so the last chunk's counts win
+            _read_gemini_usage(chunk, result, streaming=True)
+            # Final/safety chunks may carry no parts
+            if chunk.parts:
+                yield chunk.text
+
+
+_GEMINI_CONFIGURE_LOCK = threading.Lock()
+
+
+def _gemini_endpoint() -> Dict:
+    """Client options for a custom Gemini endpoint (e.g. the local stub server)"""
+    base_url = os.getenv('GEMINI_BASE_URL', '')
+    if not base_url:
+        return {}
+    return {'transport': 'rest', 'client_options': {'api_endpoint': base_url}}
+
+
+def _read_gemini_usage(response, result: ProviderResponse, streaming: bool = False):
+    """Copy token usage from a Gemini response onto result"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage and usage.prompt_token_count:
+        result.prompt_tokens = usage.prompt_token_count
+        result.completion_tokens = usage.candidates_token_count
+        return
+    
+    # Older SDKs drop usage_metadata and only report output tokens per candidate
+    if not streaming and response.candidates and response.candidates[0].token_count:
+        result.completion_tokens = response.candidates[0].token_count
+
+
+def _chat_messages(prompt: str) -> List[Dict]:
+    """Build chat messages for OpenAI-compatible APIs"""
+    return [
+        {"role": "system", "content": "You are an expert AI tutor for engineering students."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _chat_response(response) -> ProviderResponse:
+    """Convert an OpenAI-compatible completion into a ProviderResponse"""
+    result = ProviderResponse(response.choices[0].message.content)
+    if response.usage:
+        result.prompt_tokens = response.usage.prompt_tokens
+        result.completion_tokens = response.usage.completion_tokens
+    return result
+
+
+def _iter_chat_deltas(response, result: ProviderResponse) -> Iterator[str]:
+    """Yield text deltas from an OpenAI-compatible streaming response"""
+    for chunk in response:
+        # With include_usage, the final chunk carries usage and no choices
+        usage = getattr(chunk, 'usage', None)
+        if usage:
+            result.prompt_tokens = usage.prompt_tokens
+            result.completion_tokens = usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+# Ask OpenAI-compatible APIs to report usage at the end of a stream
+STREAM_USAGE = {'stream_options': {'include_usage': True}}
+
+
+class _LazyClient:
+    """OpenAI client built (and the SDK imported) on first use"""
+    
+    def __init__(self, api_key: str, base_url: Optional[str]):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._lock = threading.Lock()
+    
+    @property
+    def chat(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client.chat
 
 
 class OpenAIProvider(AIProvider):
@@ -154,24 +380,33 @@ class OpenAIProvider(AIProvider):
         super().__init__(
             name=f"openai-{model}",
             api_key=api_key,
-            rate_limit=10,
-            cost_per_1k=0.002  # GPT-3.5 pricing
+            rate_limit=_env_int('OPENAI_REQUESTS_PER_MINUTE', 10),
+            cost_per_1k=0.002,  # GPT-3.5 pricing
+            tokens_per_minute=_env_int('OPENAI_TOKENS_PER_MINUTE', 40000)
         )
         self.model = model
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
+        # base_url=None keeps the SDK default (and its OPENAI_BASE_URL handling)
+        self.client = _LazyClient(api_key, os.getenv('OPENAI_BASE_URL') or None)
     
-    def call(self, prompt: str, **kwargs) -> str:
+    def call(self, prompt: str, **kwargs) -> ProviderResponse:
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "system", "content": "You are an expert AI tutor for engineering students."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=_chat_messages(prompt),
             max_tokens=kwargs.get('max_tokens', 1024),
             temperature=kwargs.get('temperature', 0.7)
         )
-        return response.choices[0].message.content
+        return _chat_response(response)
+    
+    def stream(self, prompt: str, result: ProviderResponse, **kwargs) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=_chat_messages(prompt),
+            max_tokens=kwargs.get('max_tokens', 1024),
+            temperature=kwargs.get('temperature', 0.7),
+            stream=True,
+            extra_body=STREAM_USAGE
+        )
+        yield from _iter_chat_deltas(response, result)
 
 
 class DeepSeekProvider(AIProvider):
@@ -181,26 +416,31 @@ class DeepSeekProvider(AIProvider):
         super().__init__(
             name="deepseek",
             api_key=api_key,
-            rate_limit=10,
-            cost_per_1k=0.0014  # DeepSeek pricing
+            rate_limit=_env_int('DEEPSEEK_REQUESTS_PER_MINUTE', 10),
+            cost_per_1k=0.0014,  # DeepSeek pricing
+            tokens_per_minute=_env_int('DEEPSEEK_TOKENS_PER_MINUTE', None)
         )
-        if api_key:
-            self.client = OpenAI(
-                api_key=api_key,
-                base_url="https://api.deepseek.com"
-            )
+        self.client = _LazyClient(api_key, os.getenv('DEEPSEEK_BASE_URL', "https://api.deepseek.com"))
     
-    def call(self, prompt: str, **kwargs) -> str:
+    def call(self, prompt: str, **kwargs) -> ProviderResponse:
         response = self.client.chat.completions.create(
             model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "You are an expert AI tutor for engineering students."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=_chat_messages(prompt),
             max_tokens=kwargs.get('max_tokens', 1024),
             temperature=kwargs.get('temperature', 0.7)
         )
-        return response.choices[0].message.content
+        return _chat_response(response)
+    
+    def stream(self, prompt: str, result: ProviderResponse, **kwargs) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model="deepseek-chat",
+            messages=_chat_messages(prompt),
+            max_tokens=kwargs.get('max_tokens', 1024),
+            temperature=kwargs.get('temperature', 0.7),
+            stream=True,
+            extra_body=STREAM_USAGE
+        )
+        yield from _iter_chat_deltas(response, result)
 
 
 class ProviderManager:
@@ -222,6 +462,12 @@ class ProviderManager:
         if gemini_backup:
             self.providers.append(GeminiProvider(gemini_backup, "gemini-backup"))
         
+        # Additional backup keys (support up to 10 keys)
+        for i in range(2, 10):
+            key = os.getenv(f'AI_API_KEY_BACKUP_{i}', '')
+            if key:
+                self.providers.append(GeminiProvider(key, f"gemini-backup-{i}"))
+        
         # OpenAI
         openai_key = os.getenv('OPENAI_API_KEY', '')
         if openai_key:
@@ -232,42 +478,144 @@ class ProviderManager:
         if deepseek_key:
             self.providers.append(DeepSeekProvider(deepseek_key))
         
-        print(f"✅ Initialized {len(self.providers)} AI provider(s)")
+        logger.info("Initialized %d AI provider(s)", len(self.providers))
+    
+    def _request_budget(self, prompt: str, kwargs: Dict) -> int:
+        """Worst-case tokens a call can spend: prompt estimate + max output"""
+        return TokenEstimator.estimate_tokens(prompt) + kwargs.get('max_tokens', 1024)
+    
+    def _skip(self, provider: AIProvider):
+        RATE_LIMITER_SKIPS.labels(provider.name).inc()
+        logger.info("Skipping %s (rate/token limit or failures)", provider.name, extra=sample(0.1))
+    
+    def _succeed(self, provider: AIProvider, response: ProviderResponse, prompt: str,
+                 entered: float, started: float, booking: list):
+        """Record usage, latency and routing delay for a successful call"""
+        response.latency_ms = (time.perf_counter() - started) * 1000
+        response.fill_missing_usage(prompt)
+        provider.record_success(self.rate_limiter, response, booking)
+        RATE_LIMITER_WAIT.observe(started - entered)
+        PROVIDER_REQUEST_DURATION.labels(provider.name).observe(response.latency_ms / 1000)
+        PROVIDER_TOKENS.labels(provider.name, 'prompt').inc(response.prompt_tokens)
+        PROVIDER_TOKENS.labels(provider.name, 'completion').inc(response.completion_tokens)
+    
+    def _fail(self, provider: AIProvider, error_msg: str, booking: Optional[list] = None) -> bool:
+        """Record a failed call, releasing its booking if given; returns True for quota/rate-limit errors"""
+        if booking is not None:
+            self.rate_limiter.cancel(provider.name, booking)
+        provider.record_failure()
+        is_quota = "429" in error_msg or "quota" in error_msg.lower() or "insufficient" in error_msg.lower()
+        PROVIDER_ERRORS.labels(provider.name, 'quota' if is_quota else 'error').inc()
+        return is_quota
+    
+    def _settle_partial(self, provider: AIProvider, response: ProviderResponse, prompt: str,
+                        parts: List[str], booking: list):
+        """
+        Settle the booking of a stream that ended early (client gone or
+        provider error) with the tokens generated so far - the provider
+        bills those - or release it if nothing was generated
+        """
+        if not parts:
+            self.rate_limiter.cancel(provider.name, booking)
+            return
+        response.text = ''.join(parts)
+        response.fill_missing_usage(prompt)
+        self.rate_limiter.settle(booking, response.total_tokens)
     
     def call_with_fallback(self, prompt: str, **kwargs) -> Optional[str]:
         """Call AI with automatic fallback across providers"""
         errors = []
+        budget = self._request_budget(prompt, kwargs)
+        entered = time.perf_counter()
         
         for provider in self.providers:
-            if not provider.can_use(self.rate_limiter):
-                print(f"⏭️ Skipping {provider.name} (rate limit or failures)")
+            booking = provider.reserve(self.rate_limiter, budget)
+            if booking is None:
+                self._skip(provider)
                 continue
             
             try:
-                print(f"🔄 Trying {provider.name}...")
-                result = provider.call(prompt, **kwargs)
+                logger.debug("Trying %s", provider.name)
+                started = time.perf_counter()
+                with span(f"llm.{provider.name}"):
+                    response = provider.call(prompt, **kwargs)
                 
-                if result:
-                    provider.record_success(self.rate_limiter, len(result))
-                    print(f"✅ Success with {provider.name}")
-                    return result
+                if response.text:
+                    self._succeed(provider, response, prompt, entered, started, booking)
+                    logger.debug("Success with %s", provider.name)
+                    return response.text
+                self.rate_limiter.cancel(provider.name, booking)
             
             except Exception as e:
                 error_msg = str(e)
                 errors.append(f"{provider.name}: {error_msg}")
-                provider.record_failure()
                 
                 # Check if quota error - skip this provider
-                if "429" in error_msg or "quota" in error_msg.lower() or "insufficient" in error_msg.lower():
-                    print(f"❌ {provider.name} quota exceeded, trying next...")
+                if self._fail(provider, error_msg, booking):
+                    logger.warning("%s quota exceeded, trying next", provider.name, extra=sample(0.1))
                     continue
                 else:
-                    print(f"❌ {provider.name} error: {error_msg}")
+                    logger.warning("%s error: %s", provider.name, error_msg)
         
         # All providers failed
-        print(f"❌ All providers failed. Errors: {errors}")
+        logger.error("All providers failed", extra={'errors': errors})
         return None
     
+    def stream_with_fallback(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Stream AI response with fallback across providers.
+        Fallback only happens before the first chunk is sent - once text
+        has reached the client, a mid-stream failure is raised to the caller.
+        """
+        errors = []
+        budget = self._request_budget(prompt, kwargs)
+        entered = time.perf_counter()
+        
+        for provider in self.providers:
+            booking = provider.reserve(self.rate_limiter, budget)
+            if booking is None:
+                self._skip(provider)
+                continue
+            
+            response = ProviderResponse()
+            parts = []
+            finished = False
+            try:
+                logger.debug("Streaming from %s", provider.name)
+                started = time.perf_counter()
+                for chunk in provider.stream(prompt, response, **kwargs):
+                    parts.append(chunk)
+                    yield chunk
+                finished = True
+            
+            except Exception as e:
+                finished = True
+                error_msg = str(e)
+                errors.append(f"{provider.name}: {error_msg}")
+                self._settle_partial(provider, response, prompt, parts, booking)
+                self._fail(provider, error_msg)
+                
+                if parts:
+                    logger.error("%s failed mid-stream: %s", provider.name, error_msg)
+                    raise
+                logger.warning("%s stream error: %s, trying next", provider.name, error_msg)
+                continue
+            
+            finally:
+                if not finished:
+                    # The client went away (GeneratorExit at the yield)
+                    self._settle_partial(provider, response, prompt, parts, booking)
+            
+            if parts:
+                response.text = ''.join(parts)
+                self._succeed(provider, response, prompt, entered, started, booking)
+                logger.debug("Streamed with %s", provider.name)
+                return
+            self.rate_limiter.cancel(provider.name, booking)
+        
+        # All providers failed
+        logger.error("All providers failed", extra={'errors': errors})
+    
     def get_stats(self) -> Dict:
         """Get statistics for all providers"""
         return {
@@ -0,0 +1,34 @@
+"""
+Server-Sent Events helpers for streaming AI responses
+"""
+import json
+from typing import Dict, Iterator, Optional
+
+
+def format_sse(data: Dict, event: Optional[str] = None) -> str:
+    """Format a single SSE message"""
+    message = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+
+def chunk_text(text: str, size: int = 64) -> Iterator[str]:
+    """Split text into chunks so cached answers stream like live ones"""
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def stream_sse(chunks: Iterator[str], done: Dict) -> Iterator[str]:
+    """
+    Wrap text chunks as SSE 'data' events, followed by a final 'done'
+    event (or an 'error' event if the stream fails midway)
+    """
+    try:
+        for chunk in chunks:
+            yield format_sse({'delta': chunk})
+    except Exception as e:
+        yield format_sse({'error': str(e)}, event='error')
+        return
+    
+    yield format_sse(done, event='done')
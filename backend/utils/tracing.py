@@ -0,0 +1,190 @@
+"""
+Lightweight per-request tracing
+
+Spans recorded during a request (pipeline stages, provider calls, cache
+I/O, SQL statements) are returned in a Server-Timing header, e.g.
+
+    Server-Timing: faq;dur=0.2, cache.read;dur=1.4, llm.gemini-primary;dur=812.3, db;dur=2.1;desc="3 calls", total;dur=820.4
+
+Outside a request (or with TRACING_ENABLED=0) span() is a no-op.
+
+An opt-in sampling profiler can dump flame-graph-ready collapsed stacks
+("frame;frame;frame count" lines, for flamegraph.pl or speedscope) to
+PROFILE_DIR for a fraction of requests (PROFILE_SAMPLE_RATE, e.g. 0.01)
+or when a request sends "X-Profile: 1" and PROFILE_HEADER=1 is set.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """Spans for one request, aggregated by name"""
+
+    __slots__ = ('started', 'spans')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, list] = {}  # name -> [total_ms, count, desc]
+
+    def add(self, name: str, duration_ms: float, desc: str = None):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [duration_ms, 1, desc]
+        else:
+            span[0] += duration_ms
+            span[1] += 1
+            if desc:
+                span[2] = desc
+
+    def server_timing(self) -> str:
+        parts = []
+        for name, (duration_ms, count, desc) in self.spans.items():
+            entry = f"{name};dur={duration_ms:.1f}"
+            if desc or count > 1:
+                entry += f';desc="{desc or f"{count} calls"}"'
+            parts.append(entry)
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(parts)
+
+
+def add_span(name: str, duration_ms: float, desc: str = None):
+    """Record an already-measured span on the current request, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration_ms, desc)
+
+
+@contextmanager
+def span(name: str, desc: str = None):
+    """Time a block as a span on the current request"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, (time.perf_counter() - started) * 1000, desc)
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's stack at a fixed interval and writes collapsed
+    stacks when stopped
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, path: str):
+        self._stop.set()
+        self._thread.join()
+        if not self.stacks:
+            return
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_trace.get() is not None:
+        conn.info.setdefault('_trace_started', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started_stack = conn.info.get('_trace_started')
+    if started_stack:
+        add_span('db', (time.perf_counter() - started_stack.pop()) * 1000)
+
+
+def _on_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('_trace_started'):
+        conn.info['_trace_started'].pop()
+
+
+def init_app(app):
+    """Enable request tracing, Server-Timing headers and sampled profiling"""
+    from flask import g, request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    enabled = os.getenv('TRACING_ENABLED', '1') != '0'
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    header_trigger = os.getenv('PROFILE_HEADER', '0') == '1'
+    profile_dir = os.getenv('PROFILE_DIR', 'profiles')
+    if not enabled:
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+        event.listen(Engine, 'handle_error', _on_error)
+
+    @app.before_request
+    def _start_trace():
+        g._trace_token = _current_trace.set(Trace())
+
+        profile = (sample_rate and random.random() < sample_rate) or \
+            (header_trigger and request.headers.get('X-Profile') == '1')
+        if profile:
+            g._profiler = SamplingProfiler(threading.get_ident())
+            g._profiler.start()
+
+    @app.after_request
+    def _add_server_timing(response):
+        trace = _current_trace.get()
+        if trace is not None:
+            response.headers['Server-Timing'] = trace.server_timing()
+
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            endpoint = (request.endpoint or 'unknown').replace('.', '-')
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}.folded"
+            profiler.stop(os.path.join(profile_dir, filename))
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc=None):
+        # after_request is skipped on some failures - never leave a sampler running
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler._stop.set()
+
+        token = g.pop('_trace_token', None)
+        if token is not None:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # Streamed responses finish in a different context
+                _current_trace.set(None)
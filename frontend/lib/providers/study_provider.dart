@@ -16,7 +16,7 @@ class StudyProvider extends ChangeNotifier {
   Map<String, dynamic>? get currentAnswer => _currentAnswer;
   List<Map<String, String>> get chatHistory => _chatHistory;
 
-  Future<void> askQuestion(String question, {String? subject}) async {
+  Future<void> askQuestion(String question, {String? subject, int? userId}) async {
     _isLoading = true;
     _error = null;
     notifyListeners();
@@ -24,7 +24,7 @@ class StudyProvider extends ChangeNotifier {
     try {
       _chatHistory.add({'role': 'user', 'content': question});
       
-      final response = await _apiService.askQuestion(question, subject: subject);
+      final response = await _apiService.askQuestion(question, subject: subject, userId: userId);
       
       _currentAnswer = response;
       _chatHistory.add({'role': 'assistant', 'content': response['answer'] ?? ''});
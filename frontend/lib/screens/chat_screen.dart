@@ -1,8 +1,6 @@
 import 'package:flutter/material.dart';
 import 'package:provider/provider.dart';
 import 'package:flutter_markdown/flutter_markdown.dart';
-import 'package:http/http.dart' as http;
-import 'dart:convert';
 import '../providers/study_provider.dart';
 
 class ChatScreen extends StatefulWidget {
@@ -39,20 +37,10 @@ class _ChatScreenState extends State<ChatScreen> with SingleTickerProviderStateM
     if (question.isEmpty) return;
 
     final provider = Provider.of<StudyProvider>(context, listen: false);
-    provider.askQuestion(question, subject: 'General');
+    // The backend saves the answer to this user's history itself
+    provider.askQuestion(question, subject: 'General', userId: 1);
     _controller.clear();
 
-    // Save to history
-    Future.delayed(const Duration(seconds: 2), () async {
-      final messages = provider.chatHistory;
-      if (messages.length >= 2) {
-        final lastMessage = messages.last;
-        if (lastMessage['role'] == 'assistant') {
-          await _saveToHistory(question, lastMessage['content'] ?? '');
-        }
-      }
-    });
-
     Future.delayed(const Duration(milliseconds: 100), () {
       if (_scrollController.hasClients) {
         _scrollController.animateTo(
@@ -64,22 +52,6 @@ class _ChatScreenState extends State<ChatScreen> with SingleTickerProviderStateM
     });
   }
 
-  Future<void> _saveToHistory(String question, String answer) async {
-    try {
-      await http.post(
-        Uri.parse('http://10.0.2.2:5000/api/user/1/history'),
-        headers: {'Content-Type': 'application/json'},
-        body: json.encode({
-          'subject': 'General',
-          'question': question,
-          'answer': answer,
-        }),
-      );
-    } catch (e) {
-      print('Error saving to history: $e');
-    }
-  }
-
   @override
   Widget build(BuildContext context) {
     final isDark = Theme.of(context).brightness == Brightness.dark;
@@ -1,6 +1,7 @@
 import 'package:flutter/material.dart';
-import 'dart:convert';
 import 'package:http/http.dart' as http;
+import '../services/api_service.dart';
+import '../services/history_sync.dart';
 
 class HistoryScreen extends StatefulWidget {
   const HistoryScreen({super.key});
@@ -14,6 +15,7 @@ class _HistoryScreenState extends State<HistoryScreen> {
   bool _isLoading = true;
   String _selectedSubject = 'All';
   final String _userId = '1';
+  late final HistorySync _sync = HistorySync.forUser(_userId);
   
   final List<Map<String, dynamic>> _subjects = [
     {'name': 'All', 'icon': Icons.all_inclusive, 'color': Color(0xFF64748B)},
@@ -32,25 +34,24 @@ class _HistoryScreenState extends State<HistoryScreen> {
     _loadHistory();
   }
 
+  void _showHistory() {
+    _history = _sync.chats(subject: _selectedSubject == 'All' ? null : _selectedSubject);
+  }
+
+  /// Show the local copy at once, then fetch only what changed since it
   Future<void> _loadHistory() async {
-    setState(() => _isLoading = true);
+    setState(() {
+      _showHistory();
+      _isLoading = _history.isEmpty;
+    });
     
     try {
-      final url = _selectedSubject == 'All'
-          ? 'http://10.0.2.2:5000/api/user/$_userId/history'
-          : 'http://10.0.2.2:5000/api/user/$_userId/history?subject=$_selectedSubject';
-      
-      final response = await http.get(Uri.parse(url));
-      
-      if (response.statusCode == 200) {
-        final data = json.decode(response.body);
-        setState(() {
-          _history = data['history'] ?? [];
-          _isLoading = false;
-        });
-      } else {
-        throw Exception('Failed to load history');
-      }
+      await _sync.sync();
+      if (!mounted) return;
+      setState(() {
+        _showHistory();
+        _isLoading = false;
+      });
     } catch (e) {
       setState(() => _isLoading = false);
       if (mounted) {
@@ -68,7 +69,7 @@ class _HistoryScreenState extends State<HistoryScreen> {
   Future<void> _deleteChat(int chatId) async {
     try {
       final response = await http.delete(
-        Uri.parse('http://10.0.2.2:5000/api/user/$_userId/history/$chatId'),
+        Uri.parse('${ApiService.baseUrl}/user/$_userId/history/$chatId'),
       );
       
       if (response.statusCode == 200) {
@@ -136,7 +137,7 @@ class _HistoryScreenState extends State<HistoryScreen> {
     if (confirm == true) {
       try {
         final response = await http.delete(
-          Uri.parse('http://10.0.2.2:5000/api/user/$_userId/history/clear'),
+          Uri.parse('${ApiService.baseUrl}/user/$_userId/history/clear'),
         );
         
         if (response.statusCode == 200) {
@@ -241,8 +242,8 @@ class _HistoryScreenState extends State<HistoryScreen> {
                       onTap: () {
                         setState(() {
                           _selectedSubject = subject['name'] as String;
+                          _showHistory();
                         });
-                        _loadHistory();
                       },
                       borderRadius: BorderRadius.circular(20),
                       child: AnimatedContainer(
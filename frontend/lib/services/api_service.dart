@@ -14,7 +14,8 @@ class ApiService {
   
   static String get baseUrl => _isProduction ? _productionUrl : _developmentUrl;
 
-  Future<Map<String, dynamic>> askQuestion(String question, {String? subject}) async {
+  /// When [userId] is set, the backend saves the answer to that user's history
+  Future<Map<String, dynamic>> askQuestion(String question, {String? subject, int? userId}) async {
     try {
       final response = await http.post(
         Uri.parse('$baseUrl/ask'),
@@ -22,6 +23,7 @@ class ApiService {
         body: jsonEncode({
           'question': question,
           'subject': subject,
+          if (userId != null) 'user_id': userId,
         }),
       );
 
@@ -92,4 +94,21 @@ class ApiService {
       throw Exception('Error: $e');
     }
   }
+
+  /// History and study plan changes after version [since] (delta sync)
+  Future<Map<String, dynamic>> getChanges(String userId, int since) async {
+    try {
+      final response = await http.get(
+        Uri.parse('$baseUrl/user/$userId/changes?since=$since'),
+      );
+
+      if (response.statusCode == 200) {
+        return jsonDecode(response.body);
+      } else {
+        throw Exception('Failed to get changes: ${response.statusCode}');
+      }
+    } catch (e) {
+      throw Exception('Error: $e');
+    }
+  }
 }
@@ -0,0 +1,87 @@
+import 'dart:convert';
+import 'package:shared_preferences/shared_preferences.dart';
+import 'api_service.dart';
+
+/// Local copy of a user's chat history, kept current through the backend's
+/// delta sync endpoint instead of refetching the whole history on every
+/// visit. Persisted in shared preferences with the last synced version.
+class HistorySync {
+  static final Map<String, HistorySync> _instances = {};
+
+  /// One shared copy per user for the app session
+  factory HistorySync.forUser(String userId) =>
+      _instances.putIfAbsent(userId, () => HistorySync._(userId, ApiService()));
+
+  HistorySync._(this.userId, this._api);
+
+  final String userId;
+  final ApiService _api;
+  final Map<int, Map<String, dynamic>> _chats = {};
+  int _version = 0;
+  bool _restored = false;
+
+  String get _storageKey => 'history_sync_$userId';
+
+  /// Chats, newest first, optionally for one subject
+  List<Map<String, dynamic>> chats({String? subject}) {
+    final list = _chats.values
+        .where((chat) => subject == null || chat['subject'] == subject)
+        .toList();
+    list.sort((a, b) {
+      final byDate = (b['created_at'] as String).compareTo(a['created_at'] as String);
+      return byDate != 0 ? byDate : (b['id'] as int).compareTo(a['id'] as int);
+    });
+    return list;
+  }
+
+  /// Pull every change since the last sync; returns whether anything changed
+  Future<bool> sync() async {
+    if (!_restored) await _restore();
+
+    var changed = false;
+    while (true) {
+      final page = await _api.getChanges(userId, _version);
+      if (page['changed'] != true) break;
+      changed = true;
+
+      if (page['reset'] == true) {
+        // Too far behind for incremental changes - start over
+        _chats.clear();
+        _version = 0;
+        continue;
+      }
+      if ((page['cleared'] as List).contains('history')) _chats.clear();
+      for (final id in page['deleted']['history']) {
+        _chats.remove(id);
+      }
+      for (final chat in page['history']) {
+        _chats[chat['id'] as int] = Map<String, dynamic>.from(chat);
+      }
+      _version = page['version'];
+      if (page['has_more'] != true) break;
+    }
+
+    if (changed) await _save();
+    return changed;
+  }
+
+  Future<void> _restore() async {
+    _restored = true;
+    final prefs = await SharedPreferences.getInstance();
+    final saved = prefs.getString(_storageKey);
+    if (saved == null) return;
+    final data = jsonDecode(saved);
+    _version = data['version'];
+    for (final chat in data['history']) {
+      _chats[chat['id'] as int] = Map<String, dynamic>.from(chat);
+    }
+  }
+
+  Future<void> _save() async {
+    final prefs = await SharedPreferences.getInstance();
+    await prefs.setString(_storageKey, jsonEncode({
+      'version': _version,
+      'history': _chats.values.toList(),
+    }));
+  }
+}